@@ -2,17 +2,34 @@ import json
 import logging
 from fastapi import WebSocket
 from app.services.https.UserManagement import UserManagement
+from .OutboundQueue import OutboundQueue
 
 
 class ConnectionHandler:
     """
     连接管理器，管理所有WebSocket连接
+    认证后每个连接的所有发送都经过自己的 OutboundQueue，由单个 writer task 顺序写出
     """
-    sessions = {}  # 类级别，存储所有已认证的客户端 {user_id: websocket}
+    sessions = {}  # 类级别，存储所有已认证的客户端 {user_id: OutboundQueue}
 
     def __init__(self, websocket: WebSocket):
         self.websocket = websocket
         self.user_id = None
+        self.outbound = None  # 认证成功后创建
+
+    async def send_text(self, message: str):
+        """
+        发送消息给当前连接，认证后走发送队列，保证与广播消息的顺序一致
+        """
+        if self.outbound is not None:
+            await self.outbound.send_text(message)
+        else:
+            await self.websocket.send_text(message)
+
+    def _on_outbound_closed(self, outbound: OutboundQueue):
+        # 只移除自己的会话（同一用户重连后会话已被新连接替换）
+        if self.user_id is not None and self.sessions.get(self.user_id) is outbound:
+            del self.sessions[self.user_id]
 
     async def handle_connection(self):
         """
@@ -34,9 +51,10 @@ class ConnectionHandler:
                 await self.websocket.close()
                 return
 
-            # 认证成功，注册会话
-            self.sessions[self.user_id] = self.websocket
-            await self.websocket.send_text(json.dumps({"status": "authenticated", "user_id": self.user_id}))
+            # 认证成功，创建发送队列并注册会话
+            self.outbound = OutboundQueue(self.websocket, on_close=self._on_outbound_closed)
+            self.sessions[self.user_id] = self.outbound
+            await self.send_text(json.dumps({"status": "authenticated", "user_id": self.user_id}))
             
             # 调用连接钩子
             await self.on_connect()
@@ -48,31 +66,30 @@ class ConnectionHandler:
                     message_data = json.loads(message)
                     await self.on_message(message_data)
                 except json.JSONDecodeError:
-                    await self.websocket.send_text(json.dumps({"error": "Invalid JSON format"}))
+                    await self.send_text(json.dumps({"error": "Invalid JSON format"}))
 
         except Exception as e:
             logging.error(f"Connection error for user {self.user_id}: {e}")
         finally:
-            # 清理会话
-            if self.user_id and self.user_id in self.sessions:
-                del self.sessions[self.user_id]
+            # 清理会话并停止发送队列
+            if self.outbound is not None:
+                await self.outbound.close()
             await self.on_disconnect()
 
     @classmethod
     async def broadcast(cls, message: str, exclude_id: str = None):
         """
         广播消息给所有连接的客户端
+        每个会话只入队一次，不等待任何客户端写出
         """
         if not cls.sessions:
             return
 
         disconnected = []
-        for user_id, websocket in cls.sessions.items():
+        for user_id, outbound in list(cls.sessions.items()):
             if exclude_id and user_id == exclude_id:
                 continue
-            try:
-                await websocket.send_text(message)
-            except Exception:
+            if not outbound.enqueue(message):
                 disconnected.append(user_id)
         
         # 清理断开的连接
@@ -82,17 +99,54 @@ class ConnectionHandler:
     @classmethod
     async def send_to_user(cls, user_id: str, message: str) -> bool:
         """
-        发送消息给指定用户
+        发送消息给指定用户（入队成功即返回True）
         """
-        if user_id not in cls.sessions:
+        outbound = cls.sessions.get(user_id)
+        if outbound is None:
             return False
         
-        try:
-            await cls.sessions[user_id].send_text(message)
+        if outbound.enqueue(message):
             return True
-        except Exception:
-            cls.sessions.pop(user_id, None)
-            return False
+        cls.sessions.pop(user_id, None)
+        return False
+
+    @classmethod
+    def _session_registries(cls) -> dict:
+        """
+        当前类及所有子类各自的会话字典 {定义该字典的类名: sessions}
+        子类可以定义自己的 sessions（如 MatchSessionHandler），没有定义的与父类共用同一个字典
+        """
+        registries = {}
+        pending = [cls]
+        while pending:
+            handler_cls = pending.pop()
+            if "sessions" in handler_cls.__dict__:
+                registries[handler_cls.__name__] = handler_cls.__dict__["sessions"]
+            pending.extend(handler_cls.__subclasses__())
+        return registries
+
+    @classmethod
+    def get_queue_stats(cls) -> dict:
+        """
+        发送队列指标：当前连接数、总排队深度、最深队列、丢弃与溢出断开次数
+        汇总当前类及所有子类的会话，handlers 中按会话字典分别给出连接数和深度
+        """
+        handlers = {}
+        for name, sessions in cls._session_registries().items():
+            depths = [outbound.depth for outbound in list(sessions.values())]
+            handlers[name] = {
+                "connections": len(depths),
+                "total_depth": sum(depths),
+                "max_depth": max(depths, default=0),
+            }
+        return {
+            "connections": sum(stats["connections"] for stats in handlers.values()),
+            "total_depth": sum(stats["total_depth"] for stats in handlers.values()),
+            "max_depth": max((stats["max_depth"] for stats in handlers.values()), default=0),
+            "total_dropped": OutboundQueue.total_dropped,
+            "total_overflow_disconnects": OutboundQueue.total_overflow_disconnects,
+            "handlers": handlers,
+        }
 
     async def _authenticate(self, auth_data: dict) -> bool:
         """
@@ -2,6 +2,7 @@ import json
 import logging
 from fastapi import WebSocket
 from .ConnectionHandler import ConnectionHandler
+from app.config import settings
 from app.services.https.ChatroomManager import ChatroomManager
 from app.utils.my_logger import MyLogger
 
@@ -12,6 +13,12 @@ class MessageConnectionHandler(ConnectionHandler):
     """
     消息连接处理器，专门处理私聊消息
     """
+    # 显式订阅了所有 user_message_update 事件的会话（如管理员/监控），其余会话只收到与自己相关的事件
+    message_update_subscribers = set()
+
+    @staticmethod
+    def _subscriber_allowlist() -> set:
+        return {user_id.strip() for user_id in settings.WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST.split(",") if user_id.strip()}
 
     async def on_message(self, message: dict):
         """
@@ -23,6 +30,10 @@ class MessageConnectionHandler(ConnectionHandler):
             # 新的私信流程初始化
             await self.handle_private_chat_init(message)
             
+        elif message_type == "load_more_history":
+            # 分页加载更早的聊天记录
+            await self.handle_load_more_history(message)
+            
         elif message_type == "private":
             # 私聊消息
             await self.handle_private_message(message)
@@ -31,8 +42,15 @@ class MessageConnectionHandler(ConnectionHandler):
             # 广播消息
             await self.handle_broadcast_message(message)
             
+        elif message_type == "subscribe_message_updates":
+            # 订阅所有用户的消息更新事件
+            await self.handle_message_update_subscription(subscribe=True)
+            
+        elif message_type == "unsubscribe_message_updates":
+            await self.handle_message_update_subscription(subscribe=False)
+            
         else:
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "error": f"Unknown message type: {message_type}"
             }))
 
@@ -48,7 +66,7 @@ class MessageConnectionHandler(ConnectionHandler):
             match_id = message.get("match_id")
             
             if not target_user_id or not match_id:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "type": "private_chat_error",
                     "error": "target_user_id and match_id are required"
                 }))
@@ -60,7 +78,7 @@ class MessageConnectionHandler(ConnectionHandler):
                 target_user_id = int(target_user_id)
                 match_id = int(match_id)
             except (ValueError, TypeError) as e:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "type": "private_chat_error",
                     "error": f"Invalid ID format: {str(e)}"
                 }))
@@ -69,7 +87,7 @@ class MessageConnectionHandler(ConnectionHandler):
             logger.info(f"私信流程开始 - 用户 {current_user_id} 发起与用户 {target_user_id} 的私信 (match_id: {match_id})")
             
             # 步骤1: 获取或创建聊天室
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "private_chat_progress",
                 "step": 1,
                 "message": f"正在获取或创建聊天室... (match_id: {match_id})"
@@ -81,7 +99,7 @@ class MessageConnectionHandler(ConnectionHandler):
             )
             
             if not chatroom_id:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "type": "private_chat_error",
                     "step": 1,
                     "error": "Failed to get or create chatroom"
@@ -89,7 +107,7 @@ class MessageConnectionHandler(ConnectionHandler):
                 return
             
             # 步骤1完成通知
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "private_chat_progress",
                 "step": 1,
                 "status": "completed",
@@ -98,30 +116,36 @@ class MessageConnectionHandler(ConnectionHandler):
             }))
             
             # 步骤2: 获取聊天历史记录
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "private_chat_progress",
                 "step": 2,
                 "message": f"正在获取聊天历史记录... (chatroom_id: {chatroom_id})"
             }))
             
-            chat_history = await chatroom_manager.get_chatroom_history(chatroom_id, current_user_id)
+            # 只加载最新一页，更早的记录通过 load_more_history 按需加载
+            history_page = await chatroom_manager.get_chatroom_history_page(
+                chatroom_id, current_user_id, limit=message.get("history_limit")
+            )
+            chat_history = history_page["chat_history"]
             
-            # 步骤2完成通知
-            await self.websocket.send_text(json.dumps({
+            # 步骤2完成通知（聊天记录只在完成消息中发送一次）
+            await self.send_text(json.dumps({
                 "type": "private_chat_progress",
                 "step": 2,
                 "status": "completed",
-                "chat_history": chat_history,
+                "message_count": len(chat_history),
                 "message": f"获取到 {len(chat_history)} 条聊天记录"
             }))
             
             # 私信流程完成
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "private_chat_init_complete",
                 "chatroom_id": chatroom_id,
                 "target_user_id": target_user_id,
                 "match_id": match_id,
                 "chat_history": chat_history,
+                "has_more": history_page["has_more"],
+                "next_before_message_id": history_page["next_before_message_id"],
                 "message": "私信流程初始化完成，可以开始聊天"
             }))
             
@@ -129,11 +153,72 @@ class MessageConnectionHandler(ConnectionHandler):
             
         except Exception as e:
             logger.error(f"私信流程失败: {e}")
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "private_chat_error",
                 "error": f"Private chat initialization failed: {str(e)}"
             }))
 
+    async def handle_load_more_history(self, message: dict):
+        """
+        分页加载更早的聊天记录
+        需要 chatroom_id 和 before_message_id（来自上一页的 next_before_message_id），limit 可选
+        """
+        try:
+            chatroom_id = message.get("chatroom_id")
+            before_message_id = message.get("before_message_id")
+            
+            if not chatroom_id or not before_message_id:
+                await self.send_text(json.dumps({
+                    "type": "history_error",
+                    "error": "chatroom_id and before_message_id are required"
+                }))
+                return
+            
+            # 统一转换为int类型
+            try:
+                current_user_id = int(self.user_id)
+                chatroom_id = int(chatroom_id)
+                before_message_id = int(before_message_id)
+            except (ValueError, TypeError) as e:
+                await self.send_text(json.dumps({
+                    "type": "history_error",
+                    "error": f"Invalid ID format: {str(e)}"
+                }))
+                return
+            
+            # 只允许聊天室成员读取聊天记录
+            chatroom_manager = ChatroomManager()
+            chatroom = chatroom_manager.chatrooms.get(chatroom_id)
+            if not chatroom or current_user_id not in (chatroom.user1_id, chatroom.user2_id):
+                await self.send_text(json.dumps({
+                    "type": "history_error",
+                    "chatroom_id": chatroom_id,
+                    "error": "Chatroom not found"
+                }))
+                return
+            
+            history_page = await chatroom_manager.get_chatroom_history_page(
+                chatroom_id, current_user_id,
+                before_message_id=before_message_id,
+                limit=message.get("limit")
+            )
+            
+            await self.send_text(json.dumps({
+                "type": "history_page",
+                "chatroom_id": chatroom_id,
+                "before_message_id": before_message_id,
+                "chat_history": history_page["chat_history"],
+                "has_more": history_page["has_more"],
+                "next_before_message_id": history_page["next_before_message_id"]
+            }))
+            
+        except Exception as e:
+            logger.error(f"加载更多聊天记录失败: {e}")
+            await self.send_text(json.dumps({
+                "type": "history_error",
+                "error": f"Load more history failed: {str(e)}"
+            }))
+
     async def handle_private_message(self, message: dict):
         """
         处理私聊消息
@@ -145,13 +230,13 @@ class MessageConnectionHandler(ConnectionHandler):
             content = message.get("content", "")
             
             if not target_user_id:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "error": "target_user_id is required for private messages"
                 }))
                 return
             
             if not chatroom_id:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "error": "chatroom_id is required for private messages"
                 }))
                 return
@@ -162,7 +247,7 @@ class MessageConnectionHandler(ConnectionHandler):
                 target_user_id = int(target_user_id)
                 chatroom_id = int(chatroom_id)
             except (ValueError, TypeError) as e:
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "error": f"Invalid ID format: {str(e)}"
                 }))
                 return
@@ -190,7 +275,7 @@ class MessageConnectionHandler(ConnectionHandler):
                 }))
                 
                 # 给发送者确认，包含match_id
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "type": "message_status",
                     "target_user_id": target_user_id,
                     "chatroom_id": chatroom_id,
@@ -202,16 +287,15 @@ class MessageConnectionHandler(ConnectionHandler):
                 
                 logger.info(f"私聊消息处理完成 - 数据库保存: {success}, WebSocket发送: {websocket_success}")
 
-                # 新增：广播内部消息，通知有用户收到私信
-                # 中文注释：广播一个内部消息，type为'user_message_update'，内容为“User xxxxxx (user_id) receives a message from user xxxxxx(user_id)”
-                await self.broadcast(json.dumps({
+                # 通知有用户收到私信：只发给发送者、接收者和显式订阅者，而不是所有连接
+                await self.publish_message_update(current_user_id, target_user_id, json.dumps({
                     "type": "user_message_update",
                     "message": f"User {target_user_id} ({target_user_id}) receives a message from user {current_user_id} ({current_user_id})"
-                }), exclude_id=None)  # 不排除任何人，所有人都能收到
+                }))
 
             else:
                 # 发送失败
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "type": "message_status",
                     "target_user_id": target_user_id,
                     "chatroom_id": chatroom_id,
@@ -225,11 +309,50 @@ class MessageConnectionHandler(ConnectionHandler):
             
         except Exception as e:
             logger.error(f"处理私聊消息失败: {e}")
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "message_status",
                 "error": f"Private message handling failed: {str(e)}"
             }))
 
+    @classmethod
+    async def publish_message_update(cls, sender_user_id, target_user_id, message: str) -> int:
+        """
+        定向投递 user_message_update 事件
+        接收者为发送者、接收者以及 message_update_subscribers 中的会话，开销与连接总数无关
+        返回成功入队的会话数
+        """
+        recipients = {str(sender_user_id), str(target_user_id)}
+        recipients.update(cls.message_update_subscribers)
+        
+        delivered = 0
+        for user_id in recipients:
+            if await cls.send_to_user(user_id, message):
+                delivered += 1
+        return delivered
+
+    async def handle_message_update_subscription(self, subscribe: bool):
+        """
+        订阅/取消订阅所有用户的 user_message_update 事件
+        只有 WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST 名单内的用户可以订阅，名单为空时拒绝所有订阅
+        """
+        if subscribe:
+            if self.user_id not in self._subscriber_allowlist():
+                await self.send_text(json.dumps({
+                    "type": "subscription_status",
+                    "subscribed": False,
+                    "error": "Not allowed to subscribe to message updates"
+                }))
+                return
+            self.message_update_subscribers.add(self.user_id)
+        else:
+            self.message_update_subscribers.discard(self.user_id)
+        
+        await self.send_text(json.dumps({
+            "type": "subscription_status",
+            "subscribed": subscribe
+        }))
+        logger.info(f"用户 {self.user_id} {'订阅' if subscribe else '取消订阅'}了消息更新事件")
+
     async def handle_broadcast_message(self, message: dict):
         """
         处理广播消息
@@ -238,7 +361,7 @@ class MessageConnectionHandler(ConnectionHandler):
             content = message.get("content", "")
             
             if not content.strip():
-                await self.websocket.send_text(json.dumps({
+                await self.send_text(json.dumps({
                     "error": "message content cannot be empty"
                 }))
                 return
@@ -254,7 +377,7 @@ class MessageConnectionHandler(ConnectionHandler):
             }), exclude_id=self.user_id)
             
             # 给发送者确认
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "broadcast_status",
                 "content": content,
                 "delivered": True,
@@ -265,7 +388,7 @@ class MessageConnectionHandler(ConnectionHandler):
             
         except Exception as e:
             logger.error(f"处理广播消息失败: {e}")
-            await self.websocket.send_text(json.dumps({
+            await self.send_text(json.dumps({
                 "type": "broadcast_status",
                 "error": f"Broadcast message handling failed: {str(e)}"
             }))
@@ -286,6 +409,9 @@ class MessageConnectionHandler(ConnectionHandler):
         用户断开连接时通知
         """
         await super().on_disconnect()
+        # 同一用户的新连接仍在线时保留订阅
+        if self.user_id not in self.sessions:
+            self.message_update_subscribers.discard(self.user_id)
         # 通知其他用户有用户离开
         await self.broadcast(json.dumps({
             "type": "user_left", 
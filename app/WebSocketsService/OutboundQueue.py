@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+from typing import Callable, Optional
+from fastapi import WebSocket
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("OutboundQueue")
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT)
+
+
+class OutboundQueue:
+    """
+    单个WebSocket连接的有界发送队列，由独立的 writer task 顺序写出
+    广播只需要入队（O(1)，不等待网络），慢客户端只会堆积自己的队列，不会拖慢其他连接和发送者
+    队列满时按 overflow_policy 处理:
+      - drop_oldest: 丢弃最旧的待发消息
+      - disconnect: 关闭该连接
+    """
+    # 所有连接累计的指标
+    total_dropped = 0
+    total_overflow_disconnects = 0
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: Optional[int] = None,
+        overflow_policy: Optional[str] = None,
+        on_close: Optional[Callable[["OutboundQueue"], None]] = None,
+    ):
+        self.websocket = websocket
+        self.max_size = max_size or settings.WS_SEND_QUEUE_SIZE
+        self.overflow_policy = overflow_policy or settings.WS_SEND_QUEUE_OVERFLOW_POLICY
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {self.overflow_policy}")
+        self.on_close = on_close
+
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._messages = deque()
+        self._wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer())
+
+    @property
+    def depth(self) -> int:
+        return len(self._messages)
+
+    def enqueue(self, message: str) -> bool:
+        """
+        非阻塞入队，返回 False 表示连接已关闭（或因队列溢出被断开）
+        """
+        if self.closed:
+            return False
+
+        if len(self._messages) >= self.max_size:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                OutboundQueue.total_overflow_disconnects += 1
+                logger.warning(f"Outbound queue full ({self.max_size}), disconnecting slow client")
+                self._close(close_websocket=True)
+                return False
+            self._messages.popleft()
+            self.dropped += 1
+            OutboundQueue.total_dropped += 1
+
+        self._messages.append(message)
+        if len(self._messages) > self.max_depth:
+            self.max_depth = len(self._messages)
+        self._wakeup.set()
+        return True
+
+    async def send_text(self, message: str):
+        """
+        与 WebSocket.send_text 兼容的入口，只入队不等待写出
+        """
+        if not self.enqueue(message):
+            raise ConnectionError("Outbound queue is closed")
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._messages:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                message = self._messages.popleft()
+                await self.websocket.send_text(message)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Outbound writer stopped: {e}")
+            self._close(close_websocket=False)
+
+    def _close(self, close_websocket: bool):
+        if self.closed:
+            return
+        self.closed = True
+        self._messages.clear()
+        if self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        if close_websocket:
+            # 关闭连接后，接收循环会退出并完成会话清理
+            asyncio.create_task(self._close_websocket())
+        if self.on_close:
+            self.on_close(self)
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=1013)  # Try Again Later
+        except Exception:
+            pass
+
+    async def close(self):
+        """连接结束时停止 writer task，丢弃未发送的消息"""
+        self._close(close_websocket=False)
+        try:
+            await self._writer_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "closed": self.closed,
+        }
@@ -0,0 +1,67 @@
+from typing import Optional
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.config import settings
+from app.core.query_stats import QueryStats
+from app.utils.metrics import (
+    CONTENT_TYPE, MANAGER_OBJECTS, REGISTRY, WEBSOCKET_OVERFLOW_DISCONNECTS, WEBSOCKET_SEND_DROPPED,
+    WEBSOCKET_SEND_QUEUE_DEPTH, WEBSOCKET_SEND_QUEUE_MAX_DEPTH,
+)
+from app.WebSocketsService.ConnectionHandler import ConnectionHandler
+from app.WebSocketsService.OutboundQueue import OutboundQueue
+from app.utils.singleton_status import SingletonStatusReporter
+
+router = APIRouter()
+
+
+def _manager_object_counts() -> dict:
+    """
+    读取已创建的管理器单例中容器的大小（len 为 O(1)，不遍历任何容器）
+    不经过单例状态快照，避免输出最多一个刷新间隔之前的数量；未创建的单例不会被创建
+    """
+    from app.services.https.UserManagement import UserManagement
+    from app.services.https.MatchManager import MatchManager
+    from app.services.https.ChatroomManager import ChatroomManager
+    counts = {}
+    for manager, cls, container in (("users", UserManagement, "user_list"),
+                                    ("matches", MatchManager, "match_list"),
+                                    ("chatrooms", ChatroomManager, "chatrooms")):
+        instance = getattr(cls, "_instance", None)
+        if instance is not None:
+            counts[(manager,)] = len(getattr(instance, container))
+    return counts
+
+
+MANAGER_OBJECTS.set_function(_manager_object_counts)
+
+# WebSocket 发送队列：汇总 ConnectionHandler 及其子类（含 MatchSessionHandler 自己的 sessions）的所有连接
+WEBSOCKET_SEND_QUEUE_DEPTH.set_function(lambda: {
+    (handler,): stats["total_depth"] for handler, stats in ConnectionHandler.get_queue_stats()["handlers"].items()
+})
+WEBSOCKET_SEND_QUEUE_MAX_DEPTH.set_function(lambda: {
+    (handler,): stats["max_depth"] for handler, stats in ConnectionHandler.get_queue_stats()["handlers"].items()
+})
+WEBSOCKET_SEND_DROPPED.set_function(lambda: {(): OutboundQueue.total_dropped})
+WEBSOCKET_OVERFLOW_DISCONNECTS.set_function(lambda: {(): OutboundQueue.total_overflow_disconnects})
+
+# 单例服务状态（缓存的快照，只含大小和计数器）
+@router.get("/debug/status")
+async def debug_status(refresh: bool = False):
+    if refresh:
+        return SingletonStatusReporter.refresh()
+    # 后台刷新任务停止时，快照过期后在这里补刷新一次
+    return SingletonStatusReporter.get_cached_status(max_age=settings.SINGLETON_STATUS_REFRESH_INTERVAL * 2)
+
+# Prometheus 文本格式的进程内指标
+@router.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# 数据库操作统计：各集合/操作的延迟分位数和总耗时最高的查询结构（值已脱敏）
+@router.get("/debug/db_stats")
+async def debug_db_stats(top: Optional[int] = None, reset: bool = False):
+    query_stats = QueryStats()
+    stats = query_stats.get_stats(top_n=top)
+    if reset:
+        query_stats.reset()
+    return stats
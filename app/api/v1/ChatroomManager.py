@@ -31,10 +31,24 @@ async def get_or_create_chatroom(request: GetOrCreateChatroomRequest):
 async def get_chat_history(request: GetChatHistoryRequest):
     chatroom_manager = ChatroomManager()
     try:
-        chat_history = await chatroom_manager.get_chatroom_history(
-            chatroom_id=request.chatroom_id,
-            user_id=request.user_id
-        )
+        has_more = False
+        next_before_message_id = None
+        if request.before_message_id is None and request.limit is None:
+            # 未指定分页参数时保持原行为，返回全部聊天记录
+            chat_history = await chatroom_manager.get_chatroom_history(
+                chatroom_id=request.chatroom_id,
+                user_id=request.user_id
+            )
+        else:
+            page = await chatroom_manager.get_chatroom_history_page(
+                chatroom_id=request.chatroom_id,
+                user_id=request.user_id,
+                before_message_id=request.before_message_id,
+                limit=request.limit
+            )
+            chat_history = page["chat_history"]
+            has_more = page["has_more"]
+            next_before_message_id = page["next_before_message_id"]
         
         # 转换格式以匹配响应模型
         messages = []
@@ -45,7 +59,12 @@ async def get_chat_history(request: GetChatHistoryRequest):
                 "datetime": datetime_str
             })
         
-        return GetChatHistoryResponse(success=True, messages=messages)
+        return GetChatHistoryResponse(
+            success=True,
+            messages=messages,
+            has_more=has_more,
+            next_before_message_id=next_before_message_id
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
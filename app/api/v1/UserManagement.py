@@ -6,7 +6,8 @@ from app.schemas.UserManagement import (
     EditSummaryRequest, EditSummaryResponse,
     SaveUserInfoToDatabaseRequest, SaveUserInfoToDatabaseResponse,
     GetUserInfoWithUserIdRequest, GetUserInfoWithUserIdResponse,
-    DeactivateUserRequest, DeactivateUserResponse
+    DeactivateUserRequest, DeactivateUserResponse,
+    DeactivateUsersRequest, DeactivateUsersResponse
 )
 from app.services.https.UserManagement import UserManagement
 
@@ -84,4 +85,14 @@ async def deactivate_user(request: DeactivateUserRequest):
         success = await user_manager.deactivate_user(request.user_id)
         return DeactivateUserResponse(success=success)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) 
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 批量注销用户
+@router.post("/deactivate_users", response_model=DeactivateUsersResponse)
+async def deactivate_users(request: DeactivateUsersRequest):
+    user_manager = UserManagement()
+    try:
+        result = await user_manager.deactivate_users(request.user_ids)
+        return DeactivateUsersResponse(**result)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -13,12 +13,93 @@ class Settings:
     VERSION: str = "1.0.0"
     API_V1_STR: str = "/api/v1"
 
+    # 日志配置：LOG_ASYNC 时日志记录先放入有界队列，由后台线程写控制台和文件；队列满时丢弃并计数
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 按 logger 对 INFO/DEBUG 采样和限速（WARNING 及以上不受影响），格式 "MatchManager=0.1,http=0.5" / "MatchManager=200"（条/秒）
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+    LOG_RATE_LIMITS: str = os.getenv("LOG_RATE_LIMITS", "")
+
+    # HTTP 访问日志：off / access（每个请求一行结构化日志）/ full（每个请求都记录请求头和请求/响应体，仅用于排查问题）
+    ACCESS_LOG_MODE: str = os.getenv("ACCESS_LOG_MODE", "access")
+    # access 模式下按比例抽样做完整记录；请求头带 ACCESS_LOG_DEBUG_HEADER: 1 时也会完整记录
+    ACCESS_LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("ACCESS_LOG_DEBUG_SAMPLE_RATE", "0"))
+    ACCESS_LOG_DEBUG_HEADER: str = os.getenv("ACCESS_LOG_DEBUG_HEADER", "X-Debug-Log")
+    ACCESS_LOG_MAX_BODY_BYTES: int = int(os.getenv("ACCESS_LOG_MAX_BODY_BYTES", "4096"))  # 完整记录时请求/响应体最多记录的字节数
+
+    # 单例状态快照（/debug/status）的后台刷新间隔（秒）
+    SINGLETON_STATUS_REFRESH_INTERVAL: int = int(os.getenv("SINGLETON_STATUS_REFRESH_INTERVAL", "10"))
+
+    # 数据库操作统计（/debug/db_stats）：超过 DB_SLOW_QUERY_MS 毫秒的操作记录 WARNING 日志（只含查询结构，不含值）
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+    DB_STATS_LATENCY_SAMPLES: int = int(os.getenv("DB_STATS_LATENCY_SAMPLES", "1024"))  # 每个集合/操作保留最近多少次耗时用于计算分位数
+    DB_STATS_TOP_N: int = int(os.getenv("DB_STATS_TOP_N", "20"))  # 按总耗时排序返回的查询结构数量
+    DB_STATS_WINDOW_SECONDS: int = int(os.getenv("DB_STATS_WINDOW_SECONDS", "300"))  # 查询结构统计的滚动窗口（秒）
+    DB_STATS_MAX_SHAPES: int = int(os.getenv("DB_STATS_MAX_SHAPES", "2000"))  # 每个窗口最多跟踪的查询结构数量
+
     # MongoDB配置
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     MONGODB_DB_NAME: str = os.getenv("MONGODB_DB_NAME", "miracle_demo")
     MONGODB_USERNAME: str = os.getenv("MONGODB_USERNAME", "root")
     MONGODB_PASSWORD: str = os.getenv("MONGODB_PASSWORD", "Awr20020311")
     MONGODB_AUTH_SOURCE: str = os.getenv("MONGODB_AUTH_SOURCE", "admin")
+    # 批量写入时每批的文档数量（每批一次数据库往返）
+    MONGODB_BULK_BATCH_SIZE: int = int(os.getenv("MONGODB_BULK_BATCH_SIZE", "1000"))
+    # 启动预热时流式读取集合的每批文档数量
+    STARTUP_LOAD_BATCH_SIZE: int = int(os.getenv("STARTUP_LOAD_BATCH_SIZE", "5000"))
+
+    # 聊天记录分页配置
+    CHAT_HISTORY_PAGE_SIZE: int = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+    CHAT_HISTORY_MAX_PAGE_SIZE: int = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "200"))
+
+    # 热消息缓存配置：每个聊天室缓存的最近消息数量，以及所有聊天室共享的内存上限
+    MESSAGE_CACHE_PER_CHATROOM: int = int(os.getenv("MESSAGE_CACHE_PER_CHATROOM", "200"))
+    MESSAGE_CACHE_MAX_BYTES: int = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # 管理器快照配置：定期把内存中的用户/匹配/聊天室写入本地文件，重启时从快照恢复并只回放增量
+    SNAPSHOT_ENABLED: bool = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+    SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH", str(PROJECT_DIR / "data" / "manager_snapshot.bin"))
+    SNAPSHOT_INTERVAL: int = int(os.getenv("SNAPSHOT_INTERVAL", "600"))  # 秒
+    SNAPSHOT_MAX_AGE: int = int(os.getenv("SNAPSHOT_MAX_AGE", str(24 * 3600)))  # 秒，超过则视为过期
+    # 快照恢复后在后台按 _id 全量对账（兜底墓碑写入前崩溃等情况），不在启动关键路径上
+    SNAPSHOT_RECONCILE_IN_BACKGROUND: bool = os.getenv("SNAPSHOT_RECONCILE_IN_BACKGROUND", "true").lower() == "true"
+
+    # 全量数据完备性检查的最小间隔（秒），<=0 表示关闭；每轮自动保存前只做增量检查
+    INTEGRITY_FULL_CHECK_INTERVAL: int = int(os.getenv("INTEGRITY_FULL_CHECK_INTERVAL", str(6 * 3600)))
+
+    # WebSocket 每个连接的发送队列长度，以及队列满时的处理策略（drop_oldest 或 disconnect）
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_SEND_QUEUE_OVERFLOW_POLICY: str = os.getenv("WS_SEND_QUEUE_OVERFLOW_POLICY", "drop_oldest")
+
+    # 允许订阅全部 user_message_update 事件的用户ID（逗号分隔，如管理员/监控账号）；为空时任何用户都不能订阅
+    WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST: str = os.getenv("WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST", "")
+
+    # n8n 匹配 webhook 配置：长连接池大小、keep-alive 与超时（秒）
+    N8N_WEBHOOK_URL: str = os.getenv("N8N_WEBHOOK_URL", "http://8.216.32.239:5678/webhook/match")
+    N8N_MAX_CONNECTIONS: int = int(os.getenv("N8N_MAX_CONNECTIONS", "100"))
+    N8N_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("N8N_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    N8N_KEEPALIVE_EXPIRY: float = float(os.getenv("N8N_KEEPALIVE_EXPIRY", "30"))
+    N8N_CONNECT_TIMEOUT: float = float(os.getenv("N8N_CONNECT_TIMEOUT", "5"))
+    N8N_READ_TIMEOUT: float = float(os.getenv("N8N_READ_TIMEOUT", "30"))
+    N8N_POOL_TIMEOUT: float = float(os.getenv("N8N_POOL_TIMEOUT", "10"))
+    N8N_HTTP2: bool = os.getenv("N8N_HTTP2", "true").lower() == "true"  # 仅在安装了 h2 时生效
+    # n8n 熔断器：连续失败多少次后打开、打开多少秒后半开探测、半开时允许的探测请求数
+    N8N_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("N8N_BREAKER_FAILURE_THRESHOLD", "5"))
+    N8N_BREAKER_RECOVERY_TIMEOUT: float = float(os.getenv("N8N_BREAKER_RECOVERY_TIMEOUT", "30"))
+    N8N_BREAKER_HALF_OPEN_MAX_CALLS: int = int(os.getenv("N8N_BREAKER_HALF_OPEN_MAX_CALLS", "1"))
+
+    # 匹配引擎：n8n（webhook 工作流）、local（进程内匹配）或 fallback（优先 n8n，失败时使用本地匹配）
+    MATCH_ENGINE: str = os.getenv("MATCH_ENGINE", "fallback")
+    # 本地匹配的年龄范围（岁）
+    MATCH_ENGINE_AGE_RANGE: int = int(os.getenv("MATCH_ENGINE_AGE_RANGE", "10"))
+    # 索引估计的候选数不超过总用户数的该比例时，用二级索引取候选而不是全量扫描特征库
+    MATCH_ENGINE_INDEX_SELECTIVITY: float = float(os.getenv("MATCH_ENGINE_INDEX_SELECTIVITY", "0.05"))
+
+    # 匹配推荐缓存：每次向 n8n 请求的推荐数量、缓存有效期（秒）、缓存的最大用户数，以及触发后台补货的剩余数量
+    MATCH_RECOMMENDATION_BATCH_SIZE: int = int(os.getenv("MATCH_RECOMMENDATION_BATCH_SIZE", "5"))
+    MATCH_RECOMMENDATION_TTL: int = int(os.getenv("MATCH_RECOMMENDATION_TTL", "600"))
+    MATCH_RECOMMENDATION_MAX_USERS: int = int(os.getenv("MATCH_RECOMMENDATION_MAX_USERS", "10000"))
+    MATCH_RECOMMENDATION_LOW_WATERMARK: int = int(os.getenv("MATCH_RECOMMENDATION_LOW_WATERMARK", "2"))
 
     # JWT配置 (为了保持结构完整性，即使当前未使用)
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key")
@@ -0,0 +1,157 @@
+"""
+HTTP access log middleware
+纯 ASGI 中间件：每个请求只记录一行结构化日志（方法、路径、状态码、耗时、响应字节数、请求ID），
+响应原样流式透传，不再缓冲和重建响应体
+完整的请求头/请求体/响应体记录只对抽样请求或带调试请求头的请求开启
+"""
+import json
+import random
+import time
+import uuid
+
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("access")
+
+REQUEST_ID_HEADER = b"x-request-id"
+# 调试记录请求头时隐藏这些值
+REDACTED_HEADERS = {b"authorization", b"cookie", b"set-cookie"}
+
+
+def _format_body(body: bytes, truncated: bool) -> str:
+    """调试记录用：JSON 按原样压缩输出，其余按文本输出"""
+    suffix = "...(truncated)" if truncated else ""
+    try:
+        return json.dumps(json.loads(body), ensure_ascii=False) + suffix
+    except ValueError:
+        return body.decode("utf-8", errors="ignore") + suffix
+
+
+def _format_headers(headers: list) -> list:
+    return [
+        (name.decode("latin-1"), "***" if name.lower() in REDACTED_HEADERS else value.decode("latin-1"))
+        for name, value in headers
+    ]
+
+
+class _BodyCapture:
+    """调试记录时截取请求/响应体的前 max_bytes 字节，不影响透传"""
+    __slots__ = ("max_bytes", "chunks", "size", "truncated")
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    def add(self, chunk: bytes):
+        if not chunk:
+            return
+        room = self.max_bytes - self.size
+        if room <= 0:
+            self.truncated = True
+            return
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+    def text(self) -> str:
+        return _format_body(b"".join(self.chunks), self.truncated) if self.chunks else "<empty>"
+
+
+class AccessLogMiddleware:
+    """
+    mode:
+        off    - 不记录，只透传 X-Request-ID
+        access - 每个请求一行；按 debug_sample_rate 抽样或请求头带 debug_header 时做完整记录
+        full   - 每个请求都做完整记录（仅用于排查问题）
+    请求带 X-Request-ID 时沿用，否则生成一个，并写回响应头
+    """
+
+    def __init__(self, app, mode: str = None, debug_sample_rate: float = None,
+                 debug_header: str = None, max_body_bytes: int = None):
+        self.app = app
+        self.mode = (mode or settings.ACCESS_LOG_MODE).lower()
+        self.debug_sample_rate = settings.ACCESS_LOG_DEBUG_SAMPLE_RATE if debug_sample_rate is None else debug_sample_rate
+        self.debug_header = (debug_header or settings.ACCESS_LOG_DEBUG_HEADER).lower().encode("latin-1")
+        self.max_body_bytes = settings.ACCESS_LOG_MAX_BODY_BYTES if max_body_bytes is None else max_body_bytes
+
+    def _wants_debug(self, headers: list) -> bool:
+        if self.mode == "full":
+            return True
+        if self.mode != "access":
+            return False
+        if self.debug_sample_rate > 0 and random.random() < self.debug_sample_rate:
+            return True
+        return any(name == self.debug_header and value.lower() in (b"1", b"true") for name, value in headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        headers = scope.get("headers", [])
+        request_id = None
+        for name, value in headers:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex[:16]
+        encoded_request_id = request_id.encode("latin-1")
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        debug = self._wants_debug(headers)
+        request_body = _BodyCapture(self.max_body_bytes) if debug else None
+        response_body = _BodyCapture(self.max_body_bytes) if debug else None
+        response_headers = []
+        status_code = 500
+        response_bytes = 0
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.add(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = list(message.get("headers", []))
+                response_headers.append((REQUEST_ID_HEADER, encoded_request_id))
+                message = {**message, "headers": response_headers}
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                response_bytes += len(body)
+                if response_body is not None:
+                    response_body.add(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper if debug else receive, send_wrapper)
+        except Exception as e:
+            if self.mode != "off":
+                latency_ms = (time.perf_counter() - start) * 1000
+                logger.error(f"method={scope['method']} path={scope['path']} status={status_code} latency_ms={latency_ms:.1f} "
+                             f"bytes={response_bytes} request_id={request_id} error={e!r}")
+            raise
+
+        if self.mode == "off":
+            return
+        latency_ms = (time.perf_counter() - start) * 1000
+        client = scope.get("client")
+        logger.info(f"method={scope['method']} path={scope['path']} status={status_code} latency_ms={latency_ms:.1f} "
+                    f"bytes={response_bytes} request_id={request_id} client={client[0] if client else '-'}")
+        if debug:
+            query = scope.get("query_string", b"").decode("latin-1")
+            logger.info(f"[{request_id}] debug query={query!r} request_headers="
+                        f"{_format_headers(headers)}")
+            logger.info(f"[{request_id}] debug request_body={request_body.text()}")
+            logger.info(f"[{request_id}] debug response_headers="
+                        f"{_format_headers(response_headers)}")
+            logger.info(f"[{request_id}] debug response_body={response_body.text()}")
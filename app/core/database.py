@@ -1,17 +1,28 @@
 import sys
+import time
 from pathlib import Path
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
 ROOT_PATH = Path(__file__).resolve().parents[2]
 sys.path.append(str(ROOT_PATH))
 from app.config import settings
 from app.utils.my_logger import MyLogger
+from app.utils.metrics import DB_OPERATION_DURATION
+from app.core.query_stats import QueryStats
 
 logger = MyLogger("database")
 
 
+def _observe(collection_name: str, operation: str, start: float, query=None):
+    """记录一次数据库操作的耗时（按集合和操作类型分组），query 只用于统计查询结构和慢查询日志"""
+    elapsed = time.perf_counter() - start
+    DB_OPERATION_DURATION.labels(collection_name, operation).observe(elapsed)
+    QueryStats().record(collection_name, operation, elapsed, query)
+
+
 def convert_objectid_to_str(data):
     """将字典中的所有ObjectID转换为字符串"""
     if isinstance(data, dict):
@@ -67,6 +78,32 @@ class Database:
             cls.client.close()
             logger.info("Closed MongoDB connection")
 
+    @classmethod
+    async def ensure_indexes(cls):
+        """创建查询路径依赖的索引（已存在时为空操作）"""
+        try:
+            # 分页加载聊天记录: {chatroom_id, _id < before} 按 _id 倒序
+            await cls.get_collection("messages").create_index(
+                [("chatroom_id", 1), ("_id", 1)], name="chatroom_id_1__id_1"
+            )
+            # 快照恢复时回放 {updated_at >= 高水位线} 的文档
+            for collection_name in ("users", "matches", "chatrooms"):
+                await cls.get_collection(collection_name).create_index([("updated_at", 1)], name="updated_at_1")
+            # 快照恢复时回放删除墓碑；墓碑超过快照有效期后不再需要，由 TTL 索引清理
+            tombstones = cls.get_collection("tombstones")
+            await tombstones.create_index([("collection", 1), ("deleted_at", 1)], name="collection_1_deleted_at_1")
+            try:
+                await tombstones.create_index(
+                    [("deleted_at", 1)], name="deleted_at_ttl", expireAfterSeconds=2 * settings.SNAPSHOT_MAX_AGE
+                )
+            except OperationFailure as e:
+                # SNAPSHOT_MAX_AGE 修改后已有索引的 TTL 不同，需要手动 collMod
+                logger.warning(f"Tombstone TTL index not updated: {e}")
+            logger.info("MongoDB indexes ensured")
+        except Exception as e:
+            logger.error(f"Error ensuring indexes: {e}")
+            raise
+
     @classmethod
     def get_db(cls):
         """获取数据库实例"""
@@ -80,6 +117,7 @@ class Database:
     @classmethod
     async def insert_one(cls, collection_name: str, document: dict):
         """插入单个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).insert_one(document)
             logger.info(f"Inserted document with id: {result.inserted_id}")
@@ -87,10 +125,13 @@ class Database:
         except Exception as e:
             logger.error(f"Error inserting document: {e}")
             raise
+        finally:
+            _observe(collection_name, "insert_one", start)
 
     @classmethod
     async def insert_many(cls, collection_name: str, documents: list):
         """插入多个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).insert_many(documents)
             logger.info(f"Inserted {len(result.inserted_ids)} documents")
@@ -98,16 +139,21 @@ class Database:
         except Exception as e:
             logger.error(f"Error inserting documents: {e}")
             raise
+        finally:
+            _observe(collection_name, "insert_many", start)
 
     @classmethod
     async def find_one(cls, collection_name: str, query: dict):
         """查找单个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).find_one(query)
             return convert_objectid_to_str(result) if result else None
         except Exception as e:
             logger.error(f"Error finding document: {e}")
             raise
+        finally:
+            _observe(collection_name, "find_one", start, query)
 
     @classmethod
     async def find(
@@ -119,6 +165,7 @@ class Database:
         sort: list = [],
     ):
         """查找多个文档"""
+        start = time.perf_counter()
         try:
             cursor = cls.get_collection(collection_name).find(query, projection)
             if sort:
@@ -130,10 +177,79 @@ class Database:
         except Exception as e:
             logger.error(f"Error finding documents: {e}")
             raise
+        finally:
+            _observe(collection_name, "find", start, query)
+
+    @classmethod
+    async def iterate(
+        cls,
+        collection_name: str,
+        query: dict = None,
+        projection: dict = None,
+        batch_size: int = None,
+    ):
+        """
+        流式读取集合，按批 yield 文档列表
+        与 find 不同，不会一次性把整个集合读入内存
+        """
+        batch_size = batch_size or settings.STARTUP_LOAD_BATCH_SIZE
+        try:
+            cursor = cls.get_collection(collection_name).find(query or {}, projection).batch_size(batch_size)
+            batch = []
+            start = time.perf_counter()
+            async for document in cursor:
+                batch.append(convert_objectid_to_str(document))
+                if len(batch) >= batch_size:
+                    # 只统计等待数据库返回这一批的时间，不含调用方处理时间
+                    _observe(collection_name, "iterate", start, query)
+                    yield batch
+                    batch = []
+                    start = time.perf_counter()
+            if batch:
+                _observe(collection_name, "iterate", start, query)
+                yield batch
+        except Exception as e:
+            logger.error(f"Error iterating collection {collection_name}: {e}")
+            raise
+
+    @classmethod
+    async def aggregate(
+        cls,
+        collection_name: str,
+        pipeline: list,
+        batch_size: int = None,
+        allow_disk_use: bool = True,
+    ):
+        """
+        在服务端执行聚合管道，按批 yield 结果文档列表
+        $group / $sort 等阶段超出内存限制时允许落盘（allow_disk_use）
+        """
+        batch_size = batch_size or settings.STARTUP_LOAD_BATCH_SIZE
+        try:
+            cursor = cls.get_collection(collection_name).aggregate(
+                pipeline, allowDiskUse=allow_disk_use, batchSize=batch_size
+            )
+            batch = []
+            start = time.perf_counter()
+            async for document in cursor:
+                batch.append(convert_objectid_to_str(document))
+                if len(batch) >= batch_size:
+                    # 只统计等待数据库返回这一批的时间，不含调用方处理时间
+                    _observe(collection_name, "aggregate", start, pipeline)
+                    yield batch
+                    batch = []
+                    start = time.perf_counter()
+            if batch:
+                _observe(collection_name, "aggregate", start, pipeline)
+                yield batch
+        except Exception as e:
+            logger.error(f"Error aggregating collection {collection_name}: {e}")
+            raise
 
     @classmethod
     async def update_one(cls, collection_name: str, query: dict, update: dict):
         """更新单个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).update_one(query, update)
             # logger.info(f"Modified {result.modified_count} document")
@@ -141,10 +257,13 @@ class Database:
         except Exception as e:
             logger.error(f"Error updating document: {e}")
             raise
+        finally:
+            _observe(collection_name, "update_one", start, query)
 
     @classmethod
     async def update_many(cls, collection_name: str, query: dict, update: dict):
         """更新多个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).update_many(
                 query, update
@@ -154,10 +273,108 @@ class Database:
         except Exception as e:
             logger.error(f"Error updating documents: {e}")
             raise
+        finally:
+            _observe(collection_name, "update_many", start, query)
+
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        collection_name: str,
+        docs: list,
+        key: str = "_id",
+        ordered: bool = False,
+        batch_size: int = None,
+    ):
+        """
+        批量 upsert 文档：每个文档按 key 整体替换（ReplaceOne, upsert=True）
+        按 batch_size 分批，每批一次 bulk_write 往返
+        返回每批的统计信息列表，failed_keys 为写入失败的文档 key
+        """
+        docs = list(docs)
+        batch_size = batch_size or settings.MONGODB_BULK_BATCH_SIZE
+        collection = cls.get_collection(collection_name)
+        batch_stats = []
+
+        for batch_index, start in enumerate(range(0, len(docs), batch_size)):
+            chunk = docs[start:start + batch_size]
+            operations = [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in chunk]
+            stats = {
+                "batch": batch_index,
+                "size": len(chunk),
+                "matched": 0,
+                "modified": 0,
+                "upserted": 0,
+                "failed_keys": [],
+            }
+            batch_start = time.perf_counter()
+            try:
+                result = await collection.bulk_write(operations, ordered=ordered)
+                stats["matched"] = result.matched_count
+                stats["modified"] = result.modified_count
+                stats["upserted"] = result.upserted_count
+            except BulkWriteError as e:
+                details = e.details or {}
+                stats["matched"] = details.get("nMatched", 0)
+                stats["modified"] = details.get("nModified", 0)
+                stats["upserted"] = details.get("nUpserted", 0)
+                failed_indexes = {error["index"] for error in details.get("writeErrors", [])}
+                if ordered and failed_indexes:
+                    # 有序写入在第一个错误处停止，之后的文档都没有写入
+                    failed_indexes = set(range(min(failed_indexes), len(chunk)))
+                stats["failed_keys"] = [chunk[i][key] for i in sorted(failed_indexes)]
+                logger.error(f"Bulk upsert into {collection_name} batch {batch_index} had {len(stats['failed_keys'])} failures")
+            except Exception as e:
+                stats["failed_keys"] = [doc[key] for doc in chunk]
+                logger.error(f"Error bulk upserting documents into {collection_name} batch {batch_index}: {e}")
+            _observe(collection_name, "bulk_upsert", batch_start)
+            batch_stats.append(stats)
+
+        return batch_stats
+
+    @classmethod
+    async def bulk_write(
+        cls,
+        collection_name: str,
+        operations: list,
+        ordered: bool = False,
+        batch_size: int = None,
+    ):
+        """
+        批量执行写操作（UpdateOne / DeleteMany 等 pymongo 操作对象）
+        按 batch_size 分批，每批一次往返，返回各项计数的合计
+        """
+        operations = list(operations)
+        batch_size = batch_size or settings.MONGODB_BULK_BATCH_SIZE
+        collection = cls.get_collection(collection_name)
+        totals = {"matched": 0, "modified": 0, "deleted": 0, "upserted": 0, "errors": 0}
+
+        for start in range(0, len(operations), batch_size):
+            chunk = operations[start:start + batch_size]
+            batch_start = time.perf_counter()
+            try:
+                result = await collection.bulk_write(chunk, ordered=ordered)
+                totals["matched"] += result.matched_count
+                totals["modified"] += result.modified_count
+                totals["deleted"] += result.deleted_count
+                totals["upserted"] += result.upserted_count
+            except BulkWriteError as e:
+                details = e.details or {}
+                totals["matched"] += details.get("nMatched", 0)
+                totals["modified"] += details.get("nModified", 0)
+                totals["deleted"] += details.get("nRemoved", 0)
+                totals["upserted"] += details.get("nUpserted", 0)
+                totals["errors"] += len(details.get("writeErrors", []))
+                logger.error(f"Bulk write into {collection_name} had {len(details.get('writeErrors', []))} failures")
+                if ordered:
+                    raise
+            finally:
+                _observe(collection_name, "bulk_write", batch_start)
+        return totals
 
     @classmethod
     async def delete_one(cls, collection_name: str, query: dict):
         """删除单个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).delete_one(query)
             logger.info(f"Deleted {result.deleted_count} document")
@@ -165,10 +382,13 @@ class Database:
         except Exception as e:
             logger.error(f"Error deleting document: {e}")
             raise
+        finally:
+            _observe(collection_name, "delete_one", start, query)
 
     @classmethod
     async def delete_many(cls, collection_name: str, query: dict):
         """删除多个文档"""
+        start = time.perf_counter()
         try:
             result = await cls.get_collection(collection_name).delete_many(query)
             logger.info(f"Deleted {result.deleted_count} documents")
@@ -176,6 +396,8 @@ class Database:
         except Exception as e:
             logger.error(f"Error deleting documents: {e}")
             raise
+        finally:
+            _observe(collection_name, "delete_many", start, query)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""
+HTTP / WebSocket metrics middleware
+纯 ASGI 中间件：记录 /api/v1 路由的请求延迟直方图，以及各 WebSocket 路由当前打开的连接数
+"""
+import time
+from typing import Iterable
+
+from app.utils.metrics import HTTP_REQUEST_DURATION, WEBSOCKET_CONNECTIONS
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _route_label(scope) -> str:
+    """
+    用路由模板作为标签，避免每个不同的URL产生一组新的时间序列
+    未匹配到路由的请求（404）统一记为 unmatched
+    """
+    if scope.get("endpoint") is None:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    path_params = scope.get("path_params")
+    if path_params:
+        templates = {str(value): f"{{{name}}}" for name, value in path_params.items()}
+        path = "/".join(templates.get(segment, segment) for segment in path.split("/"))
+    return path
+
+
+class MetricsMiddleware:
+    def __init__(self, app, http_prefix: str = "/api/v1", websocket_paths: Iterable[str] = ()):
+        self.app = app
+        self.http_prefix = http_prefix
+        self.websocket_paths = set(websocket_paths)
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope["type"]
+        if scope_type == "websocket" and scope["path"] in self.websocket_paths:
+            # 连接在 app 调用期间一直保持打开
+            gauge = WEBSOCKET_CONNECTIONS.labels(scope["path"])
+            gauge.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                gauge.dec()
+            return
+
+        if scope_type != "http" or not scope["path"].startswith(self.http_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(scope["method"], _route_label(scope), status_code).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,188 @@
+"""
+Database query statistics
+记录每个 Database 操作的耗时：按集合/操作统计次数和延迟分位数，按查询结构（值已脱敏）统计滚动窗口内的总耗时，
+超过 DB_SLOW_QUERY_MS 的操作记录慢查询日志。用于在真实负载下定位 N+1 查询：
+同一个查询结构在一个窗口内被执行成千上万次，会在 top_shapes 中排在前面
+"""
+import json
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("query_stats")
+
+REDACTED = "?"
+# 这些操作符的值是子查询列表，保留结构；其余列表（如 $in 的取值）整体脱敏，使不同长度的 $in 归为同一结构
+_LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+
+
+def query_shape(query: Any) -> Any:
+    """
+    将查询/聚合管道中的值替换为 "?"，只保留字段名和操作符
+    {"user_id": 5, "age": {"$gt": 18}} -> {"user_id": "?", "age": {"$gt": "?"}}
+    """
+    if isinstance(query, dict):
+        return {
+            key: [query_shape(item) for item in value]
+            if key in _LOGICAL_OPERATORS and isinstance(value, list) else query_shape(value)
+            for key, value in query.items()
+        }
+    if isinstance(query, list) and query and all(isinstance(item, dict) for item in query):
+        # 聚合管道：每个阶段分别脱敏
+        return [query_shape(item) for item in query]
+    return REDACTED
+
+
+def format_shape(query: Any) -> str:
+    if query is None:
+        return "-"
+    return json.dumps(query_shape(query), separators=(",", ":"), default=str)
+
+
+def _percentile(sorted_samples: List[float], percent: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(percent / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class _OperationStats:
+    __slots__ = ("count", "slow", "total", "max", "samples")
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.slow = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_size)  # 最近的耗时，用于计算分位数
+
+
+class _ShapeStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class QueryStats:
+    """
+    数据库操作统计单例，由 Database 的每个操作在结束时调用 record
+    查询结构统计分为当前窗口和上一窗口，当前窗口满 DB_STATS_WINDOW_SECONDS 后轮换，
+    因此 top_shapes 总是覆盖最近一到两个窗口的数据
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.slow_query_ms = settings.DB_SLOW_QUERY_MS
+            cls._instance.sample_size = settings.DB_STATS_LATENCY_SAMPLES
+            cls._instance.top_n = settings.DB_STATS_TOP_N
+            cls._instance.window_seconds = settings.DB_STATS_WINDOW_SECONDS
+            cls._instance.max_shapes = settings.DB_STATS_MAX_SHAPES
+            cls._instance.reset()
+        return cls._instance
+
+    def reset(self):
+        self.operations: Dict[Tuple[str, str], _OperationStats] = {}
+        self.current_shapes: Dict[Tuple[str, str, str], _ShapeStats] = {}
+        self.previous_shapes: Dict[Tuple[str, str, str], _ShapeStats] = {}
+        self.window_started_at = time.monotonic()
+        self.shapes_dropped = 0
+
+    def _rotate_if_needed(self, now: float):
+        if now - self.window_started_at >= self.window_seconds:
+            # 超过两个窗口没有操作时，上一窗口的数据也已过期
+            stale = now - self.window_started_at >= 2 * self.window_seconds
+            self.previous_shapes = {} if stale else self.current_shapes
+            self.current_shapes = {}
+            self.window_started_at = now
+
+    def record(self, collection_name: str, operation: str, elapsed: float, query: Any = None):
+        """记录一次操作；elapsed 单位为秒，query 为过滤条件或聚合管道（只取结构）"""
+        key = (collection_name, operation)
+        stats = self.operations.get(key)
+        if stats is None:
+            stats = self.operations[key] = _OperationStats(self.sample_size)
+        stats.count += 1
+        stats.total += elapsed
+        stats.samples.append(elapsed)
+        if elapsed > stats.max:
+            stats.max = elapsed
+
+        shape = format_shape(query)
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= self.slow_query_ms:
+            stats.slow += 1
+            logger.warning(
+                f"Slow query: collection={collection_name} op={operation} elapsed_ms={elapsed_ms:.1f} shape={shape}"
+            )
+
+        self._rotate_if_needed(time.monotonic())
+        shape_key = (collection_name, operation, shape)
+        shape_stats = self.current_shapes.get(shape_key)
+        if shape_stats is None:
+            if len(self.current_shapes) >= self.max_shapes:
+                self.shapes_dropped += 1
+                return
+            shape_stats = self.current_shapes[shape_key] = _ShapeStats()
+        shape_stats.count += 1
+        shape_stats.total += elapsed
+        if elapsed > shape_stats.max:
+            shape_stats.max = elapsed
+
+    def _top_shapes(self, top_n: int) -> List[Dict[str, Any]]:
+        merged: Dict[Tuple[str, str, str], List[float]] = {}
+        for shapes in (self.previous_shapes, self.current_shapes):
+            for key, shape_stats in shapes.items():
+                entry = merged.setdefault(key, [0, 0.0, 0.0])
+                entry[0] += shape_stats.count
+                entry[1] += shape_stats.total
+                entry[2] = max(entry[2], shape_stats.max)
+        ranked = sorted(merged.items(), key=lambda item: item[1][1], reverse=True)[:top_n]
+        return [
+            {
+                "collection": collection_name,
+                "operation": operation,
+                "shape": shape,
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / count, 3),
+                "max_ms": round(max_elapsed * 1000, 3),
+            }
+            for (collection_name, operation, shape), (count, total, max_elapsed) in ranked
+        ]
+
+    def get_stats(self, top_n: Optional[int] = None) -> Dict[str, Any]:
+        """
+        返回各集合/操作的次数和延迟分位数（按总耗时降序），以及总耗时最高的 top_n 个查询结构
+        """
+        self._rotate_if_needed(time.monotonic())
+        operations = []
+        for (collection_name, operation), stats in self.operations.items():
+            samples = sorted(stats.samples)
+            operations.append({
+                "collection": collection_name,
+                "operation": operation,
+                "count": stats.count,
+                "slow": stats.slow,
+                "total_ms": round(stats.total * 1000, 3),
+                "avg_ms": round(stats.total * 1000 / stats.count, 3),
+                "p50_ms": round(_percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(_percentile(samples, 95) * 1000, 3),
+                "p99_ms": round(_percentile(samples, 99) * 1000, 3),
+                "max_ms": round(stats.max * 1000, 3),
+            })
+        operations.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "window_seconds": self.window_seconds,
+            "operations": operations,
+            "top_shapes": self._top_shapes(top_n or self.top_n),
+            "shapes_dropped": self.shapes_dropped,
+        }
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
 
@@ -7,7 +8,9 @@ logger = MyLogger("Chatroom")
 class Chatroom:
     """
     聊天室类，管理聊天室内容
+    只保存用户ID，user1/user2 通过UserManagement按需解析
     """
+    __slots__ = ("chatroom_id", "message_ids", "user1_id", "user2_id", "match_id")
     _chatroom_counter = 0
     _initialized = False
     
@@ -53,36 +56,72 @@ class Chatroom:
         self.user2_id = user2.user_id
         self.match_id = match_id  # 添加match_id属性
         
-        self.user1 = user1
-        self.user2 = user2
-        
         logger.info(f"Created chatroom {self.chatroom_id} for users {self.user1_id} and {self.user2_id} with match_id {self.match_id}")
 
+    @classmethod
+    def from_document(cls, chatroom_data: dict, user1, user2) -> "Chatroom":
+        """
+        从数据库文档恢复聊天室实例，沿用已有的chatroom_id，不占用计数器
+        """
+        chatroom = cls.__new__(cls)
+        chatroom.chatroom_id = int(chatroom_data["_id"])  # chatroom_id存储在_id字段中
+        chatroom.message_ids = chatroom_data.get("message_ids", [])
+        chatroom.user1_id = user1.user_id
+        chatroom.user2_id = user2.user_id
+        match_id = chatroom_data.get("match_id")
+        chatroom.match_id = int(match_id) if match_id is not None else None
+        return chatroom
+
+    @property
+    def user1(self):
+        """从UserManagement单例解析用户1实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.user1_id)
+
+    @property
+    def user2(self):
+        """从UserManagement单例解析用户2实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.user2_id)
+
+    def add_message_id(self, message_id):
+        """
+        记录新消息ID，并标记聊天室需要写回数据库
+        """
+        self.message_ids.append(message_id)
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        """
+        通知ChatroomManager该聊天室需要写回数据库
+        """
+        from app.services.https.ChatroomManager import ChatroomManager
+        ChatroomManager().mark_chatroom_dirty(self.chatroom_id)
+
+    def to_document(self) -> dict:
+        """
+        转换为数据库文档，使用chatroom_id作为_id主键
+        updated_at 供快照增量回放使用
+        """
+        return {
+            "_id": self.chatroom_id,  # 使用chatroom_id作为MongoDB的_id主键
+            "user1_id": self.user1_id,
+            "user2_id": self.user2_id,
+            "message_ids": self.message_ids,
+            "match_id": self.match_id,  # 添加match_id到数据库字段
+            "updated_at": datetime.now(timezone.utc)
+        }
+
     async def save_to_database(self) -> bool:
         """
         保存聊天室到数据库，使用chatroom_id作为_id主键
+        单次 upsert 往返，不再先查询是否存在
         """
         try:
-            chatroom_dict = {
-                "_id": self.chatroom_id,  # 使用chatroom_id作为MongoDB的_id主键
-                "user1_id": self.user1_id,
-                "user2_id": self.user2_id,
-                "message_ids": self.message_ids,
-                "match_id": self.match_id  # 添加match_id到数据库字段
-            }
-            
-            # 检查聊天室是否已存在（基于_id查询，O(log n)复杂度）
-            existing_chatroom = await Database.find_one("chatrooms", {"_id": self.chatroom_id})
-            if existing_chatroom:
-                # 更新现有聊天室
-                await Database.update_one(
-                    "chatrooms",
-                    {"_id": self.chatroom_id},
-                    {"$set": {k: v for k, v in chatroom_dict.items() if k != "_id"}}  # 不更新_id字段
-                )
-            else:
-                # 插入新聊天室
-                await Database.insert_one("chatrooms", chatroom_dict)
+            batch_stats = await Database.bulk_upsert("chatrooms", [self.to_document()])
+            if any(stats["failed_keys"] for stats in batch_stats):
+                logger.error(f"Error saving chatroom {self.chatroom_id} to database: upsert failed")
+                return False
             
             logger.info(f"Saved chatroom {self.chatroom_id} to database")
             return True
@@ -1,4 +1,5 @@
 import time
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
@@ -9,7 +10,20 @@ logger = MyLogger("Match")
 class Match:
     """
     匹配类，管理一个Match
+    只保存ID，user_1/user_2/chatroom 通过管理器按需解析，不持有对象引用
     """
+    __slots__ = (
+        "match_id",
+        "user_id_1",
+        "user_id_2",
+        "description_to_user_1",
+        "description_to_user_2",
+        "is_liked",
+        "match_score",
+        "mutual_game_scores",
+        "chatroom_id",
+        "match_time",
+    )
     _match_counter = 0
     _initialized = False
     
@@ -59,35 +73,65 @@ class Match:
         self.chatroom_id = None
         self.match_time = match_time
         
-        self.chatroom = None
-        self.user_1 = None
-        self.user_2 = None
-        
-        # Populate user instances from UserManagement
-        self._populate_user_instances()
+        # Check that both users exist in UserManagement
+        self._check_user_instances()
         
         logger.info(f"Created new match with ID: {self.match_id} between users {self.user_id_1} and {self.user_id_2}")
 
-    def _populate_user_instances(self):
+    @classmethod
+    def from_document(cls, match_data: Dict[str, Any]) -> "Match":
+        """
+        从数据库文档恢复匹配实例，沿用已有的match_id，不占用计数器
+        """
+        match = cls.__new__(cls)
+        match.match_id = match_data["_id"]  # match_id存储在_id字段中
+        match.user_id_1 = match_data["user_id_1"]
+        match.user_id_2 = match_data["user_id_2"]
+        match.description_to_user_1 = match_data.get("description_to_user_1", "")
+        match.description_to_user_2 = match_data.get("description_to_user_2", "")
+        match.is_liked = match_data.get("is_liked", False)
+        match.match_score = match_data.get("match_score", 0)
+        match.mutual_game_scores = match_data.get("mutual_game_scores", {})
+        match.chatroom_id = match_data.get("chatroom_id")
+        match.match_time = match_data.get("match_time", "Unknown")
+        match._check_user_instances()
+        return match
+
+    @property
+    def user_1(self):
+        """从UserManagement单例解析用户1实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.user_id_1)
+
+    @property
+    def user_2(self):
+        """从UserManagement单例解析用户2实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.user_id_2)
+
+    @property
+    def chatroom(self):
+        """从ChatroomManager单例解析聊天室实例，尚未创建聊天室时为None"""
+        if self.chatroom_id is None:
+            return None
+        from app.services.https.ChatroomManager import ChatroomManager
+        return ChatroomManager().chatrooms.get(self.chatroom_id)
+
+    def _check_user_instances(self):
         """
-        从UserManagement单例获取用户实例
+        检查两个用户是否都存在于UserManagement单例
         """
         try:
             from app.services.https.UserManagement import UserManagement
             user_manager = UserManagement()
             
-            self.user_1 = user_manager.get_user_instance(self.user_id_1)
-            self.user_2 = user_manager.get_user_instance(self.user_id_2)
-            
-            if self.user_1 is None:
+            if user_manager.get_user_instance(self.user_id_1) is None:
                 logger.warning(f"User {self.user_id_1} not found in UserManagement")
-            if self.user_2 is None:
+            if user_manager.get_user_instance(self.user_id_2) is None:
                 logger.warning(f"User {self.user_id_2} not found in UserManagement")
                 
         except Exception as e:
-            logger.error(f"Error populating user instances: {e}")
-            self.user_1 = None
-            self.user_2 = None
+            logger.error(f"Error checking user instances: {e}")
 
     def get_target_user(self, user_id: int):
         """
@@ -113,6 +157,13 @@ class Match:
             logger.error(f"User ID {user_id} not found in match {self.match_id}")
             return None
 
+    def _mark_dirty(self):
+        """
+        通知MatchManager该匹配需要写回数据库
+        """
+        from app.services.https.MatchManager import MatchManager
+        MatchManager().mark_match_dirty(self.match_id)
+
     def get_match_id(self) -> int:
         """
         返回匹配ID
@@ -125,46 +176,42 @@ class Match:
         """
         try:
             self.is_liked = not self.is_liked
+            self._mark_dirty()
             logger.info(f"Match {self.match_id} like status toggled to: {self.is_liked}")
             return True
         except Exception as e:
             logger.error(f"Error toggling like for match {self.match_id}: {e}")
             return False
 
+    def to_document(self) -> Dict[str, Any]:
+        """
+        转换为数据库文档，使用match_id作为_id主键
+        updated_at 供快照增量回放使用
+        """
+        return {
+            "_id": self.match_id,  # 使用match_id作为MongoDB的_id主键
+            "user_id_1": self.user_id_1,
+            "user_id_2": self.user_id_2,
+            "description_to_user_1": self.description_to_user_1,
+            "description_to_user_2": self.description_to_user_2,
+            "is_liked": self.is_liked,
+            "match_score": self.match_score,
+            "mutual_game_scores": self.mutual_game_scores,
+            "chatroom_id": self.chatroom_id,
+            "match_time": self.match_time,
+            "updated_at": datetime.now(timezone.utc)
+        }
+
     async def save_to_database(self) -> bool:
         """
         保存匹配到数据库，使用match_id作为_id主键
+        单次 upsert 往返，不再先查询是否存在
         """
         try:
-            match_data = {
-                "_id": self.match_id,  # 使用match_id作为MongoDB的_id主键
-                "user_id_1": self.user_id_1,
-                "user_id_2": self.user_id_2,
-                "description_to_user_1": self.description_to_user_1,
-                "description_to_user_2": self.description_to_user_2,
-                "is_liked": self.is_liked,
-                "match_score": self.match_score,
-                "mutual_game_scores": self.mutual_game_scores,
-                "chatroom_id": self.chatroom_id,
-                "match_time": self.match_time
-            }
-            
-            # 检查匹配是否已存在（基于_id查询，O(log n)复杂度）
-            existing_match = await Database.find_one("matches", {"_id": self.match_id})
-            
-            if existing_match:
-                # 更新现有匹配
-                await Database.update_one(
-                    "matches",
-                    {"_id": self.match_id},
-                    {"$set": {k: v for k, v in match_data.items() if k != "_id"}}  # 不更新_id字段
-                )
-                # logger.info(f"Updated match {self.match_id} in database")
-            else:
-                # 插入新匹配
-                await Database.insert_one("matches", match_data)
-                # logger.info(f"Saved new match {self.match_id} to database")
-            
+            batch_stats = await Database.bulk_upsert("matches", [self.to_document()])
+            if any(stats["failed_keys"] for stats in batch_stats):
+                logger.error(f"Error saving match {self.match_id} to database: upsert failed")
+                return False
             return True
         except Exception as e:
             logger.error(f"Error saving match {self.match_id} to database: {e}")
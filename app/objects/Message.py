@@ -1,4 +1,5 @@
 from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
 
@@ -8,7 +9,16 @@ logger = MyLogger("Message")
 class Message:
     """
     消息类，管理单条消息内容
+    只保存发送者/接收者ID，用户实例通过UserManagement按需解析
     """
+    __slots__ = (
+        "message_id",
+        "message_content",
+        "message_send_time_in_utc",
+        "message_sender_id",
+        "message_receiver_id",
+        "chatroom_id",
+    )
     _message_counter = 0
     _initialized = False
     
@@ -55,42 +65,51 @@ class Message:
         self.message_receiver_id = receiver_user.user_id
         self.chatroom_id = chatroom_id  # 消息归属的聊天室ID
         
-        self.message_sender = sender_user
-        self.message_receiver = receiver_user
-        
         # 验证消息归属：确保发送者和接收者都属于指定的chatroom
         self._validate_chatroom_membership()
         
         logger.info(f"Created message {self.message_id} from {self.message_sender_id} to {self.message_receiver_id} in chatroom {self.chatroom_id}")
     
+    @property
+    def message_sender(self):
+        """从UserManagement单例解析发送者实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.message_sender_id)
+
+    @property
+    def message_receiver(self):
+        """从UserManagement单例解析接收者实例"""
+        from app.services.https.UserManagement import UserManagement
+        return UserManagement().get_user_instance(self.message_receiver_id)
+
+    def to_document(self) -> dict:
+        """
+        转换为数据库文档，使用message_id作为_id主键
+        """
+        return {
+            "_id": self.message_id,  # 使用message_id作为MongoDB的_id主键
+            "message_content": self.message_content,
+            "message_send_time_in_utc": self.message_send_time_in_utc,
+            "message_sender_id": self.message_sender_id,
+            "message_receiver_id": self.message_receiver_id,
+            "chatroom_id": self.chatroom_id  # 保存消息所属的聊天室ID
+        }
+
     async def save_to_database(self) -> bool:
         """
         保存消息到数据库，使用message_id作为_id主键
         消息一旦创建不可更新，确保数据完整性
+        直接插入（单次往返），_id 冲突说明消息已存在
         """
         try:
-            message_dict = {
-                "_id": self.message_id,  # 使用message_id作为MongoDB的_id主键
-                "message_content": self.message_content,
-                "message_send_time_in_utc": self.message_send_time_in_utc,
-                "message_sender_id": self.message_sender_id,
-                "message_receiver_id": self.message_receiver_id,
-                "chatroom_id": self.chatroom_id  # 保存消息所属的聊天室ID
-            }
-            
-            # 检查消息是否已存在（基于_id查询，O(log n)复杂度）
-            existing_message = await Database.find_one("messages", {"_id": self.message_id})
-            
-            if existing_message:
-                # 消息已存在，不允许更新
-                logger.warning(f"Message {self.message_id} already exists in database - skipping save (messages are immutable)")
-                return True  # 返回True因为消息已经存在于数据库中
-            else:
-                # 插入新消息
-                await Database.insert_one("messages", message_dict)
-                logger.info(f"Saved new message {self.message_id} to database")
-                return True
-            
+            await Database.insert_one("messages", self.to_document())
+            logger.info(f"Saved new message {self.message_id} to database")
+            return True
+            
+        except DuplicateKeyError:
+            # 消息已存在，不允许更新
+            logger.warning(f"Message {self.message_id} already exists in database - skipping save (messages are immutable)")
+            return True  # 返回True因为消息已经存在于数据库中
         except Exception as e:
             logger.error(f"Error saving message {self.message_id} to database: {e}")
             return False
@@ -1,7 +1,22 @@
+from datetime import datetime, timezone
+
+
 class User:
     """
     用户类，管理单一用户的数据
+    使用 __slots__ 减少常驻内存对象的开销
     """
+    __slots__ = (
+        "user_id",
+        "telegram_user_name",
+        "gender",
+        "age",
+        "target_gender",
+        "user_personality_summary",
+        "match_ids",
+        "blocked_user_ids",
+    )
+
     def __init__(self, telegram_user_name: str = None, gender: int = None, user_id: int = None):
         # 用户基本信息
         self.user_id = user_id
@@ -25,14 +40,38 @@ class User:
             self.target_gender = target_gender
         if user_personality_summary is not None:
             self.user_personality_summary = user_personality_summary
+        self._mark_dirty()
 
     def get_user_id(self):
         return self.user_id
 
+    def to_document(self):
+        """转换为数据库文档，user_id 作为 _id，updated_at 供快照增量回放使用"""
+        return {
+            "_id": self.user_id,
+            "telegram_user_name": self.telegram_user_name,
+            "gender": self.gender,
+            "age": self.age,
+            "target_gender": self.target_gender,
+            "user_personality_summary": self.user_personality_summary,
+            "match_ids": self.match_ids,
+            "blocked_user_ids": self.blocked_user_ids,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+    def _mark_dirty(self):
+        """通知UserManagement该用户需要写回数据库"""
+        from app.services.https.UserManagement import UserManagement
+        UserManagement().mark_user_dirty(self.user_id)
+
     def block_user(self, blocked_user_id):
         if blocked_user_id not in self.blocked_user_ids:
             self.blocked_user_ids.append(blocked_user_id)
+            from app.services.matching.UserFeatureStore import UserFeatureStore
+            UserFeatureStore().record_block(self.user_id, blocked_user_id)
+            self._mark_dirty()
 
     def like_match(self, match_id):
         if match_id not in self.match_ids:
-            self.match_ids.append(match_id)
\ No newline at end of file
+            self.match_ids.append(match_id)
+            self._mark_dirty()
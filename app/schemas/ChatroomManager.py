@@ -15,6 +15,8 @@ class GetOrCreateChatroomResponse(BaseModel):
 class GetChatHistoryRequest(BaseModel):
     chatroom_id: int = Field(..., description="聊天室ID")
     user_id: int = Field(..., description="请求用户的ID")
+    before_message_id: Optional[int] = Field(None, description="分页游标：只返回该消息ID之前的消息")
+    limit: Optional[int] = Field(None, ge=1, description="每页消息数量；与before_message_id都不提供时返回全部聊天记录")
 
 class ChatMessage(BaseModel):
     sender_name: str = Field(..., description="发送者名称或'I'")
@@ -24,6 +26,8 @@ class ChatMessage(BaseModel):
 class GetChatHistoryResponse(BaseModel):
     success: bool = Field(..., description="是否获取成功")
     messages: List[ChatMessage] = Field(default=[], description="聊天记录")
+    has_more: bool = Field(False, description="是否还有更早的聊天记录")
+    next_before_message_id: Optional[int] = Field(None, description="加载更早一页时使用的before_message_id")
 
 # Save chatroom history
 class SaveChatroomHistoryRequest(BaseModel):
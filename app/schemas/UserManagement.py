@@ -89,4 +89,19 @@ class DeactivateUserRequest(BaseModel):
     user_id: int = Field(..., description="要注销的用户ID")
 
 class DeactivateUserResponse(BaseModel):
-    success: bool = Field(..., description="是否注销成功")
\ No newline at end of file
+    success: bool = Field(..., description="是否注销成功")
+
+# 批量注销用户
+class DeactivateUsersRequest(BaseModel):
+    user_ids: List[int] = Field(..., description="要注销的用户ID列表")
+
+class DeactivateUsersResponse(BaseModel):
+    success: bool = Field(..., description="是否全部执行成功")
+    deactivated: List[int] = Field(default_factory=list, description="已注销的用户ID")
+    not_found: List[int] = Field(default_factory=list, description="不存在的用户ID")
+    deleted_matches: int = Field(0, description="删除的匹配数")
+    deleted_chatrooms: int = Field(0, description="删除的聊天室数")
+    deleted_messages: int = Field(0, description="删除的消息数")
+    updated_users: int = Field(0, description="移除了match_id的其他用户数")
+    elapsed_ms: float = Field(0.0, description="耗时（毫秒）")
+    error: Optional[str] = Field(None, description="失败原因")
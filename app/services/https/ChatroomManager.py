@@ -3,8 +3,12 @@ from app.objects.Chatroom import Chatroom
 from app.objects.Message import Message
 from app.services.https.MatchManager import MatchManager
 from app.services.https.UserManagement import UserManagement
+from app.services.https.MessageCache import MessageCache
+from app.services.https.IntegrityChangeLog import IntegrityChangeLog
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
+from app.utils.dirty_tracker import DirtyTracker
+from app.utils.metrics import CHAT_MESSAGES_SENT
 from typing import Optional, List, Tuple
 
 logger = MyLogger("ChatroomManager")
@@ -21,10 +25,14 @@ class ChatroomManager:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.chatrooms = {}  # {chatroom_id: Chatroom}
+            cls._instance.dirty_tracker = DirtyTracker("chatrooms")  # chatroom_ids waiting to be persisted
             logger.info("ChatroomManager singleton instance created")
         return cls._instance
 
-    async def construct(self) -> bool:
+    # 启动加载只读取 Chatroom 需要的字段
+    LOAD_PROJECTION = {"user1_id": 1, "user2_id": 1, "message_ids": 1, "match_id": 1}
+
+    async def construct(self, batch_size: int = None) -> bool:
         """
         Initialize ChatroomManager by loading data from database
         """
@@ -36,57 +44,47 @@ class ChatroomManager:
             await Message.initialize_counter()
             await Chatroom.initialize_counter()
             
-            # Load existing chatrooms from database
+            # Stream existing chatrooms from database in batches
             logger.info("ChatroomManager construct: Querying chatrooms from database...")
-            chatrooms_data = await Database.find("chatrooms")
-            logger.info(f"ChatroomManager construct: Found {len(chatrooms_data)} chatrooms in database")
             loaded_count = 0
-            
-            for chatroom_data in chatrooms_data:
-                try:
-                    chatroom_id = chatroom_data["_id"]  # chatroom_id现在存储在_id字段中
-                    user1_id = chatroom_data["user1_id"]
-                    user2_id = chatroom_data["user2_id"]
-                    match_id = chatroom_data.get("match_id")  # 获取match_id，如果不存在则为None
-                    
-                    logger.info(f"ChatroomManager construct: Processing chatroom {chatroom_id} (users: {user1_id}, {user2_id}, match_id: {match_id})")
-                    
-                    # 统一转换为int类型
-                    chatroom_id = int(chatroom_id)
-                    user1_id = int(user1_id)
-                    user2_id = int(user2_id)
-                    if match_id is not None:
-                        match_id = int(match_id)
-                    
-                    # Get user instances
-                    user_manager = UserManagement()
-                    user1 = user_manager.get_user_instance(user1_id)
-                    user2 = user_manager.get_user_instance(user2_id)
-                    
-                    if user1 and user2:
-                        # Create chatroom instance with existing ID
-                        chatroom = Chatroom(user1, user2, match_id)
-                        chatroom.chatroom_id = chatroom_id
-                        chatroom.message_ids = chatroom_data.get("message_ids", [])
-                        
-                        self.chatrooms[chatroom_id] = chatroom
+            async for batch in Database.iterate("chatrooms", projection=self.LOAD_PROJECTION, batch_size=batch_size):
+                for chatroom_data in batch:
+                    if self.load_chatroom_document(chatroom_data):
                         loaded_count += 1
-                        logger.info(f"ChatroomManager construct: Successfully loaded chatroom {chatroom_id} with {len(chatroom.message_ids)} message_ids and match_id {match_id}")
-                    else:
-                        logger.warning(f"ChatroomManager construct: Cannot load chatroom {chatroom_id}: users {user1_id} (found: {user1 is not None}) or {user2_id} (found: {user2 is not None}) not found")
-                        
-                except Exception as e:
-                    logger.error(f"ChatroomManager construct: Error loading chatroom from database: {e}")
-                    continue
             
             logger.info(f"ChatroomManager construct: Loaded {loaded_count} chatrooms from database")
-            logger.info(f"ChatroomManager construct: Final chatrooms in memory: {list(self.chatrooms.keys())}")
             return True
             
         except Exception as e:
             logger.error(f"ChatroomManager construct: Error constructing ChatroomManager: {e}")
             return False
 
+    def load_chatroom_document(self, chatroom_data: dict):
+        """
+        把一个数据库聊天室文档加载到内存，两个用户都存在时才加载
+        """
+        try:
+            chatroom_id = chatroom_data["_id"]  # chatroom_id现在存储在_id字段中
+            user1_id = int(chatroom_data["user1_id"])
+            user2_id = int(chatroom_data["user2_id"])
+            
+            # Get user instances
+            user_manager = UserManagement()
+            user1 = user_manager.get_user_instance(user1_id)
+            user2 = user_manager.get_user_instance(user2_id)
+            
+            if not (user1 and user2):
+                logger.warning(f"ChatroomManager construct: Cannot load chatroom {chatroom_id}: users {user1_id} (found: {user1 is not None}) or {user2_id} (found: {user2 is not None}) not found")
+                return None
+            
+            chatroom = Chatroom.from_document(chatroom_data, user1, user2)
+            self.chatrooms[chatroom.chatroom_id] = chatroom
+            logger.debug(f"ChatroomManager construct: Loaded chatroom {chatroom.chatroom_id} with {len(chatroom.message_ids)} message_ids and match_id {chatroom.match_id}")
+            return chatroom
+        except Exception as e:
+            logger.error(f"ChatroomManager construct: Error loading chatroom from database: {e}")
+            return None
+
     async def get_or_create_chatroom(self, user_id_1, user_id_2, match_id) -> int:
         """
         Get existing chatroom or create new one for the match
@@ -145,18 +143,22 @@ class ChatroomManager:
             logger.info(f"STEP 1.5: Storing chatroom {chatroom.chatroom_id} in memory")
             # Store in memory
             self.chatrooms[chatroom.chatroom_id] = chatroom
+            IntegrityChangeLog().record_chatroom_created(chatroom.chatroom_id)
             
             logger.info(f"STEP 1.6: Updating match {match_id} with chatroom_id {chatroom.chatroom_id}")
-            # Update match with chatroom_id
+            # Update match with chatroom_id；标记为脏，下面直接保存失败时由自动保存任务重试
             match.chatroom_id = chatroom.chatroom_id
+            match_manager.mark_match_dirty(match_id)
             
             logger.info(f"STEP 1.7: Saving chatroom {chatroom.chatroom_id} to database")
             # Save chatroom to database
             chatroom_save_success = await chatroom.save_to_database()
             if not chatroom_save_success:
                 logger.error(f"STEP 1.7 FAILED: Could not save chatroom {chatroom.chatroom_id} to database")
-                # 从内存中移除失败的chatroom
+                # 从内存中移除失败的chatroom，match不再指向它
                 self.chatrooms.pop(chatroom.chatroom_id, None)
+                IntegrityChangeLog().record_chatroom_deleted(chatroom.chatroom_id)
+                match.chatroom_id = None
                 return None
             
             logger.info(f"STEP 1.8: Saving updated match {match_id} to database")
@@ -164,8 +166,8 @@ class ChatroomManager:
             match_save_success = await match.save_to_database()
             if not match_save_success:
                 logger.error(f"STEP 1.8 FAILED: Could not save match {match_id} to database")
-                # 注意：这里不移除chatroom，因为chatroom已经成功创建并保存
-                logger.warning(f"STEP 1.8: Chatroom {chatroom.chatroom_id} was created but match update failed")
+                # 注意：这里不移除chatroom，因为chatroom已经成功创建并保存；match已标记为脏，自动保存时会重试
+                logger.warning(f"STEP 1.8: Chatroom {chatroom.chatroom_id} was created but match update failed, will retry on next auto-save")
             
             logger.info(f"STEP 1 SUCCESS: Created chatroom {chatroom.chatroom_id} for match {match_id}")
             return chatroom.chatroom_id
@@ -174,6 +176,41 @@ class ChatroomManager:
             logger.error(f"STEP 1 FAILED: Error getting or creating chatroom for match {match_id}: {e}")
             return None
 
+    # Fields needed to render a chat history entry
+    HISTORY_PROJECTION = {
+        "message_content": 1,
+        "message_send_time_in_utc": 1,
+        "message_sender_id": 1,
+    }
+
+    def _build_chat_history(self, message_docs: list, user_id: int) -> List[Tuple[str, str, int, str]]:
+        """
+        Turn ordered message documents into (message, datetime, sender_id, sender_name) tuples,
+        replacing the requesting user's own name with "I"
+        """
+        # Resolve sender names once per sender instead of once per message
+        user_manager = UserManagement()
+        sender_names = {}
+        
+        chat_history = []
+        for message_data in message_docs:
+            sender_id = message_data["message_sender_id"]
+            if sender_id not in sender_names:
+                sender_user = user_manager.get_user_instance(sender_id)
+                sender_names[sender_id] = sender_user.telegram_user_name if sender_user else f"User{sender_id}"
+            
+            # Replace sender name with "I" if it's the requesting user
+            display_name = "I" if sender_id == user_id else sender_names[sender_id]
+            datetime_utc = message_data["message_send_time_in_utc"]
+            
+            chat_history.append((
+                message_data["message_content"],
+                datetime_utc.isoformat() if hasattr(datetime_utc, 'isoformat') else str(datetime_utc),
+                sender_id,
+                display_name
+            ))
+        return chat_history
+
     async def get_chatroom_history(self, chatroom_id, user_id) -> List[Tuple[str, str, int, str]]:
         """
         Get chat history for a chatroom, replacing user's own name with "I"
@@ -188,7 +225,6 @@ class ChatroomManager:
             
             # Debug: 打印ChatroomManager的当前状态
             logger.info(f"STEP 2.1 DEBUG: ChatroomManager has {len(self.chatrooms)} chatrooms in memory")
-            logger.info(f"STEP 2.1 DEBUG: Available chatroom IDs: {list(self.chatrooms.keys())}")
             logger.info(f"STEP 2.1 DEBUG: Looking for chatroom_id: {chatroom_id} (type: {type(chatroom_id)})")
             
             chatroom = self.chatrooms.get(chatroom_id)
@@ -202,58 +238,44 @@ class ChatroomManager:
             logger.info(f"STEP 2.2: Loading messages from database for chatroom {chatroom_id}")
             
             # Load messages on-demand from database using message_ids
-            message_ids = chatroom.message_ids
+            # (copy: send_message may append while we await the query)
+            message_ids = list(chatroom.message_ids)
             if not message_ids:
                 logger.info(f"STEP 2.2: No message_ids found for chatroom {chatroom_id}")
                 return []
             
             logger.info(f"STEP 2.2: Found {len(message_ids)} message_ids for chatroom {chatroom_id}")
             
-            # Load messages from database by ID (using _id for O(log n) lookup)
-            messages = []
+            # Serve from the hot message cache when it holds the whole conversation
+            message_cache = MessageCache()
+            cached_docs = message_cache.get_all(chatroom_id)
+            if cached_docs is not None:
+                chat_history = self._build_chat_history(cached_docs, user_id)
+                logger.info(f"STEP 2.3 SUCCESS: Retrieved {len(chat_history)} cached messages for chatroom {chatroom_id}, user {user_id}")
+                return chat_history
+            
+            # Load all messages in a single cursor query (_id $in), projecting only the fields we need
+            message_docs = await Database.find(
+                "messages",
+                {"_id": {"$in": message_ids}},
+                projection=self.HISTORY_PROJECTION
+            )
+            docs_by_id = {message_data["_id"]: message_data for message_data in message_docs}
+            
+            # Keep the chatroom's message_ids order
+            ordered_docs = []
             for message_id in message_ids:
-                try:
-                    # 使用_id字段查询，获得O(log n)的查询性能
-                    message_data = await Database.find_one("messages", {"_id": message_id})
-                    
-                    if message_data:
-                        # Get sender user instance for sender name
-                        user_manager = UserManagement()
-                        sender_user = user_manager.get_user_instance(message_data["message_sender_id"])
-                        sender_name = sender_user.telegram_user_name if sender_user else f"User{message_data['message_sender_id']}"
-                        
-                        # Create message tuple: (message_content, datetime_utc, sender_id, sender_name)
-                        message_tuple = (
-                            message_data["message_content"],
-                            message_data["message_send_time_in_utc"],
-                            message_data["message_sender_id"],
-                            sender_name
-                        )
-                        messages.append(message_tuple)
-                        
-                        logger.debug(f"STEP 2.2: Loaded message {message_id}")
-                    else:
-                        logger.warning(f"STEP 2.2: Message {message_id} not found in database")
-                        
-                except Exception as e:
-                    logger.error(f"STEP 2.2: Error loading message {message_id}: {e}")
+                message_data = docs_by_id.get(message_id)
+                if not message_data:
+                    logger.warning(f"STEP 2.2: Message {message_id} not found in database")
                     continue
+                ordered_docs.append(message_data)
             
-            logger.info(f"STEP 2.2: Successfully loaded {len(messages)} messages from database")
+            logger.info(f"STEP 2.2: Successfully loaded {len(ordered_docs)} messages from database")
+            message_cache.seed(chatroom_id, ordered_docs, covers_start=True)
             
             logger.info(f"STEP 2.3: Transforming messages for user {user_id}")
-            # Transform messages for the requesting user
-            chat_history = []
-            for message_content, datetime_utc, sender_id, sender_name in messages:
-                # Replace sender name with "I" if it's the requesting user
-                display_name = "I" if sender_id == user_id else sender_name
-                
-                chat_history.append((
-                    message_content,
-                    datetime_utc.isoformat() if hasattr(datetime_utc, 'isoformat') else str(datetime_utc),
-                    sender_id,
-                    display_name
-                ))
+            chat_history = self._build_chat_history(ordered_docs, user_id)
             
             logger.info(f"STEP 2.3 SUCCESS: Retrieved {len(chat_history)} messages for chatroom {chatroom_id}, user {user_id}")
             return chat_history
@@ -262,12 +284,81 @@ class ChatroomManager:
             logger.error(f"STEP 2 FAILED: Error getting chat history for chatroom {chatroom_id}: {e}")
             return []
 
+    async def get_chatroom_history_page(self, chatroom_id, user_id, before_message_id: Optional[int] = None, limit: Optional[int] = None) -> dict:
+        """
+        Get one page of chat history, newest page first, returned in chronological order
+        Uses the (chatroom_id, _id) index: messages with _id < before_message_id, newest `limit` of them
+        Returns {"chat_history": [...], "has_more": bool, "next_before_message_id": int | None}
+        next_before_message_id is the cursor to pass as before_message_id for the previous page
+        """
+        empty_page = {"chat_history": [], "has_more": False, "next_before_message_id": None}
+        try:
+            # 统一转换为int类型
+            chatroom_id = int(chatroom_id)
+            user_id = int(user_id)
+            if before_message_id is not None:
+                before_message_id = int(before_message_id)
+            limit = int(limit) if limit else settings.CHAT_HISTORY_PAGE_SIZE
+            limit = max(1, min(limit, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+            
+            if chatroom_id not in self.chatrooms:
+                logger.error(f"HISTORY PAGE FAILED: Chatroom {chatroom_id} not found in memory")
+                return empty_page
+            
+            # Serve from the hot message cache when it covers the requested page
+            message_cache = MessageCache()
+            cached_page = message_cache.get_page(chatroom_id, before_message_id, limit)
+            if cached_page is not None:
+                cached_docs, has_more = cached_page
+                return {
+                    "chat_history": self._build_chat_history(cached_docs, user_id),
+                    "has_more": has_more,
+                    "next_before_message_id": cached_docs[0]["_id"] if cached_docs and has_more else None
+                }
+            
+            query = {"chatroom_id": chatroom_id}
+            if before_message_id is not None:
+                query["_id"] = {"$lt": before_message_id}
+            
+            # Fetch one extra document to know whether an older page exists
+            message_docs = await Database.find(
+                "messages",
+                query,
+                projection=self.HISTORY_PROJECTION,
+                limit=limit + 1,
+                sort=[("_id", -1)]
+            )
+            has_more = len(message_docs) > limit
+            message_docs = message_docs[:limit]
+            message_docs.reverse()
+            
+            if before_message_id is None:
+                # The newest page is what "reopen the active chat" asks for next time
+                message_cache.seed(chatroom_id, message_docs, covers_start=not has_more)
+            
+            next_before_message_id = message_docs[0]["_id"] if message_docs and has_more else None
+            logger.info(f"HISTORY PAGE: Loaded {len(message_docs)} messages for chatroom {chatroom_id} (before={before_message_id}, has_more={has_more})")
+            return {
+                "chat_history": self._build_chat_history(message_docs, user_id),
+                "has_more": has_more,
+                "next_before_message_id": next_before_message_id
+            }
+            
+        except Exception as e:
+            logger.error(f"HISTORY PAGE FAILED: Error getting chat history page for chatroom {chatroom_id}: {e}")
+            return empty_page
+
     async def send_message(self, chatroom_id, sender_user_id, message_content) -> dict:
         """
         Send a message in the specified chatroom
         Creates Message instance, stores in chatroom, and saves to database
         Returns dict with success status and match_id
         """
+        result = await self._send_message(chatroom_id, sender_user_id, message_content)
+        CHAT_MESSAGES_SENT.labels("success" if result["success"] else "failed").inc()
+        return result
+
+    async def _send_message(self, chatroom_id, sender_user_id, message_content) -> dict:
         try:
             # 统一转换为int类型
             chatroom_id = int(chatroom_id)
@@ -321,14 +412,13 @@ class ChatroomManager:
             logger.info(f"SEND MSG STEP 5: Adding message {message.message_id} to chatroom {chatroom_id}")
             
             # Add message ID to chatroom (don't store message instance in memory)
-            chatroom.message_ids.append(message.message_id)
-            
-            logger.info(f"SEND MSG STEP 6: Updating chatroom {chatroom_id} in database")
-            
-            # Save updated chatroom to database (to update message_ids)
-            chatroom_save_success = await chatroom.save_to_database()
-            if not chatroom_save_success:
-                logger.warning(f"SEND MSG STEP 6 WARNING: Could not update chatroom {chatroom_id} in database, but message was saved")
+            # The chatroom is marked dirty and its message_ids are persisted by the auto-save task
+            chatroom.add_message_id(message.message_id)
+            MessageCache().append(
+                chatroom_id,
+                MessageCache.entry_from_message(message),
+                is_first_message=len(chatroom.message_ids) == 1
+            )
             
             logger.info(f"SEND MSG SUCCESS: Message {message.message_id} sent successfully in chatroom {chatroom_id} with match_id {chatroom.match_id}")
             return {"success": True, "match_id": chatroom.match_id}
@@ -337,6 +427,45 @@ class ChatroomManager:
             logger.error(f"SEND MSG FAILED: Error sending message in chatroom {chatroom_id}: {e}")
             return {"success": False, "match_id": None}
 
+    def mark_chatroom_dirty(self, chatroom_id: int):
+        """
+        Mark a chatroom as modified so the auto-save task writes it back
+        """
+        if chatroom_id in self.chatrooms:
+            self.dirty_tracker.mark(chatroom_id)
+
+    async def _bulk_save_chatrooms(self, chatrooms: list) -> list:
+        """
+        Upsert chatrooms through Database.bulk_upsert (one round trip per batch)
+        Returns the chatroom_ids that failed to save
+        """
+        try:
+            batch_stats = await Database.bulk_upsert("chatrooms", [chatroom.to_document() for chatroom in chatrooms])
+        except Exception as e:
+            logger.error(f"Error bulk saving chatrooms: {e}")
+            return [chatroom.chatroom_id for chatroom in chatrooms]
+        
+        failed_ids = []
+        for stats in batch_stats:
+            failed_ids.extend(stats["failed_keys"])
+        return failed_ids
+
+    async def save_dirty_chatrooms(self) -> Tuple[int, int]:
+        """
+        Write-behind flush: save only chatrooms marked dirty since the last flush
+        Returns (saved_count, dirty_count)
+        """
+        dirty_chatroom_ids = self.dirty_tracker.drain()
+        # Chatrooms deleted since they were marked are skipped
+        chatrooms = [self.chatrooms[chatroom_id] for chatroom_id in dirty_chatroom_ids if chatroom_id in self.chatrooms]
+        if not chatrooms:
+            return 0, 0
+
+        failed_ids = await self._bulk_save_chatrooms(chatrooms)
+        if failed_ids:
+            self.dirty_tracker.restore(failed_ids)
+        return len(chatrooms) - len(failed_ids), len(chatrooms)
+
     async def save_chatroom_history(self, chatroom_id: Optional[int] = None) -> bool:
         """
         Save chatroom and its messages to database
@@ -347,7 +476,10 @@ class ChatroomManager:
                 # Save specific chatroom
                 chatroom = self.chatrooms.get(chatroom_id)
                 if chatroom:
+                    self.dirty_tracker.discard(chatroom_id)
                     success = await chatroom.save_to_database()
+                    if not success:
+                        self.dirty_tracker.mark(chatroom_id)
                     
                     # Messages are already saved to database when sent via send_message()
                     # No need to save them again here since chatroom.messages is empty
@@ -357,18 +489,20 @@ class ChatroomManager:
                     logger.error(f"Chatroom {chatroom_id} not found")
                     return False
             else:
-                # Save all chatrooms
-                success_count = 0
-                total_chatrooms = len(self.chatrooms)
+                # Save all chatrooms in bulk batches
+                chatrooms = list(self.chatrooms.values())
+                for chatroom in chatrooms:
+                    self.dirty_tracker.discard(chatroom.chatroom_id)
                 
-                for chatroom in self.chatrooms.values():
-                    if await chatroom.save_to_database():
-                        success_count += 1
+                failed_ids = await self._bulk_save_chatrooms(chatrooms)
+                if failed_ids:
+                    self.dirty_tracker.restore(failed_ids)
                 
                 # Messages are already saved to database when sent via send_message()
                 # No need to save them again here since chatroom.messages is empty
-                logger.info(f"Saved {success_count}/{total_chatrooms} chatrooms structure to database")
-                return success_count == total_chatrooms
+                total_chatrooms = len(chatrooms)
+                logger.info(f"Saved {total_chatrooms - len(failed_ids)}/{total_chatrooms} chatrooms structure to database")
+                return not failed_ids
                 
         except Exception as e:
             logger.error(f"Error saving chatroom history: {e}")
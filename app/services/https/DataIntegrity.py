@@ -1,9 +1,17 @@
+import asyncio
+import time
+from datetime import datetime, timezone
 from typing import List, Set
+from pymongo import DeleteMany, UpdateOne
+from app.config import settings
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
 from app.services.https.MatchManager import MatchManager
 from app.services.https.UserManagement import UserManagement
 from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.MessageCache import MessageCache
+from app.services.https.IntegrityChangeLog import IntegrityChangeLog
+from app.objects.Message import Message
 
 logger = MyLogger("DataIntegrity")
 
@@ -11,6 +19,8 @@ logger = MyLogger("DataIntegrity")
 class DataIntegrity:
     """
     数据完备性检查器单例，负责检查和清理不一致的数据
+    - run_incremental_check: 每轮自动保存前执行，只检查 IntegrityChangeLog 记录的受影响实体
+    - run_integrity_check: 全量扫描，作为低频后台任务按 INTEGRITY_FULL_CHECK_INTERVAL 限频执行
     """
     _instance = None
 
@@ -20,6 +30,9 @@ class DataIntegrity:
             cls._instance.match_manager = MatchManager()
             cls._instance.user_manager = UserManagement()
             cls._instance.chatroom_manager = ChatroomManager()
+            cls._instance.change_log = IntegrityChangeLog()
+            cls._instance.last_full_check_at = None  # time.monotonic()
+            cls._instance.full_check_running = False
             logger.info("DataIntegrity singleton instance created")
         return cls._instance
         
@@ -53,6 +66,29 @@ class DataIntegrity:
             logger.error(f"数据完备性检查过程中发生错误: {e}")
             return False
     
+    # 全量检查只需要消息的关联字段
+    MESSAGE_CHECK_PROJECTION = {
+        "message_id": 1,
+        "chatroom_id": 1,
+        "message_sender_id": 1,
+        "message_receiver_id": 1,
+    }
+
+    @staticmethod
+    def _message_high_water_mark() -> int:
+        """
+        检查开始时已分配的最大 message_id（message_id 单调递增并作为 _id 保存）
+        流式读取期间聊天仍在进行，之后发送的消息不参与本轮检查
+        """
+        return Message._message_counter
+
+    async def _iterate_messages(self, high_water_mark: int):
+        """按批流式读取 _id 不超过 high_water_mark 的消息，每批之间让出事件循环"""
+        async for batch in Database.iterate("messages", query={"_id": {"$lte": high_water_mark}},
+                                            projection=self.MESSAGE_CHECK_PROJECTION):
+            for message_data in batch:
+                yield message_data
+
     async def check_and_clean_matches(self) -> bool:
         """
         检查MatchManager里的每一个Match实例，确保实例中的两个user都在UserManagement里存在
@@ -81,8 +117,7 @@ class DataIntegrity:
             # 删除非法的Match实例
             for match_id in invalid_match_ids:
                 # 从内存中删除
-                if match_id in self.match_manager.match_list:
-                    del self.match_manager.match_list[match_id]
+                if self.match_manager.remove_match(match_id) is not None:
                     logger.info(f"从内存中删除非法Match {match_id}")
                 
                 # 从数据库中删除
@@ -131,7 +166,8 @@ class DataIntegrity:
             existing_match_ids = set(self.match_manager.match_list.keys())
             
             # 轮询UserManagement里的user实例
-            for user_id, user in self.user_manager.user_list.items():
+            # 循环中会 await 保存，遍历快照，避免其他请求修改字典
+            for user_id, user in list(self.user_manager.user_list.items()):
                 if hasattr(user, 'match_ids') and user.match_ids:
                     invalid_match_ids = []
                     
@@ -201,6 +237,8 @@ class DataIntegrity:
                 if chatroom_id in self.chatroom_manager.chatrooms:
                     del self.chatroom_manager.chatrooms[chatroom_id]
                     logger.info(f"从内存中删除无效Chatroom {chatroom_id}")
+                MessageCache().invalidate(chatroom_id)
+                self.change_log.record_chatroom_deleted(chatroom_id)
                 
                 # 从数据库中删除
                 await Database.delete_one("chatrooms", {"_id": chatroom_id})
@@ -220,25 +258,29 @@ class DataIntegrity:
         try:
             logger.info("开始检查Message数据完备性...")
             
+            high_water_mark = self._message_high_water_mark()
             # 获取所有存在的chatroom_ids (从ChatroomManager内存中获取)
             existing_chatroom_ids = set(self.chatroom_manager.chatrooms.keys())
             
-            # 获取所有message数据
-            messages_data = await Database.find("messages")
-            invalid_message_ids = []
+            # 流式读取message的关联字段，不一次性加载整个集合
+            invalid_messages = []  # [(message_id, chatroom_id)]
             
-            for message_data in messages_data:
+            async for message_data in self._iterate_messages(high_water_mark):
                 message_id = message_data.get("_id") or message_data.get("message_id")
                 chatroom_id = message_data.get("chatroom_id")
                 
                 # 检查chatroom_id是否存在于ChatroomManager中
                 if chatroom_id and chatroom_id not in existing_chatroom_ids:
-                    logger.warning(f"Message {message_id} 包含不存在的chatroom_id: {chatroom_id}")
-                    invalid_message_ids.append(message_id)
+                    invalid_messages.append((message_id, chatroom_id))
             
-            # 删除无效的message
-            for message_id in invalid_message_ids:
+            # 删除无效的message；读取期间新建的聊天室不在快照中，删除前按当前内存再确认一次
+            invalid_message_ids = []
+            for message_id, chatroom_id in invalid_messages:
+                if chatroom_id in self.chatroom_manager.chatrooms:
+                    continue
+                logger.warning(f"Message {message_id} 包含不存在的chatroom_id: {chatroom_id}")
                 await Database.delete_one("messages", {"_id": message_id})
+                invalid_message_ids.append(message_id)
                 logger.info(f"从数据库中删除无效Message {message_id}")
             
             # 反向检查：检查chatroom的message_ids中是否有指向不存在的message
@@ -258,24 +300,24 @@ class DataIntegrity:
         try:
             logger.info("开始检查Chatroom的message_ids完备性...")
             
-            # 获取所有存在的message_ids
-            messages_data = await Database.find("messages")
+            # 获取所有存在的message_ids；只读取到高水位，之后发送的消息不在本轮检查范围内
+            high_water_mark = self._message_high_water_mark()
             existing_message_ids = set()
-            for message_data in messages_data:
+            async for message_data in self._iterate_messages(high_water_mark):
                 message_id = message_data.get("_id") or message_data.get("message_id")
                 if message_id:
                     existing_message_ids.add(message_id)
             
             updated_chatroom_count = 0
             
-            # 检查每个chatroom的message_ids
-            for chatroom_id, chatroom in self.chatroom_manager.chatrooms.items():
+            # 检查每个chatroom的message_ids（循环中会 await 保存，遍历快照）
+            for chatroom_id, chatroom in list(self.chatroom_manager.chatrooms.items()):
                 if hasattr(chatroom, 'message_ids') and chatroom.message_ids:
                     invalid_message_ids = []
                     
                     # 检查每个message_id是否存在
                     for message_id in chatroom.message_ids:
-                        if message_id not in existing_message_ids:
+                        if message_id <= high_water_mark and message_id not in existing_message_ids:
                             logger.warning(f"Chatroom {chatroom_id} 的message_ids中发现不存在的message_id: {message_id}")
                             invalid_message_ids.append(message_id)
                     
@@ -284,6 +326,7 @@ class DataIntegrity:
                         for invalid_id in invalid_message_ids:
                             chatroom.message_ids.remove(invalid_id)
                             logger.info(f"从Chatroom {chatroom_id} 的message_ids中删除无效message_id: {invalid_id}")
+                        MessageCache().invalidate(chatroom_id)
                         
                         # 更新数据库中的chatroom数据
                         await chatroom.save_to_database()
@@ -308,44 +351,51 @@ class DataIntegrity:
         try:
             logger.info("开始最终数据库Message完备性检查...")
             
+            high_water_mark = self._message_high_water_mark()
             # 获取所有存在的user_ids和chatroom_ids
             existing_user_ids = set(self.user_manager.user_list.keys())
             existing_chatroom_ids = set(self.chatroom_manager.chatrooms.keys())
             
-            # 获取数据库中所有message数据
-            messages_data = await Database.find("messages")
-            invalid_message_ids = []
+            # 流式读取数据库中message的关联字段
+            candidates = []  # [(message_id, sender_id, receiver_id, chatroom_id)]
             
-            for message_data in messages_data:
+            async for message_data in self._iterate_messages(high_water_mark):
                 message_id = message_data.get("_id") or message_data.get("message_id")
                 sender_id = message_data.get("message_sender_id")
                 receiver_id = message_data.get("message_receiver_id")
                 chatroom_id = message_data.get("chatroom_id")
                 
+                if ((sender_id and sender_id not in existing_user_ids)
+                        or (receiver_id and receiver_id not in existing_user_ids)
+                        or (chatroom_id and chatroom_id not in existing_chatroom_ids)):
+                    candidates.append((message_id, sender_id, receiver_id, chatroom_id))
+            
+            # 读取期间新建的用户和聊天室不在快照中，删除前按当前内存再确认一次
+            invalid_message_ids = []
+            user_list = self.user_manager.user_list
+            chatrooms = self.chatroom_manager.chatrooms
+            for message_id, sender_id, receiver_id, chatroom_id in candidates:
                 is_invalid = False
                 
                 # 检查message_sender_id是否存在
-                if sender_id and sender_id not in existing_user_ids:
+                if sender_id and sender_id not in user_list:
                     logger.warning(f"Message {message_id} 包含不存在的message_sender_id: {sender_id}")
                     is_invalid = True
                 
                 # 检查message_receiver_id是否存在
-                if receiver_id and receiver_id not in existing_user_ids:
+                if receiver_id and receiver_id not in user_list:
                     logger.warning(f"Message {message_id} 包含不存在的message_receiver_id: {receiver_id}")
                     is_invalid = True
                 
                 # 检查chatroom_id是否存在
-                if chatroom_id and chatroom_id not in existing_chatroom_ids:
+                if chatroom_id and chatroom_id not in chatrooms:
                     logger.warning(f"Message {message_id} 包含不存在的chatroom_id: {chatroom_id}")
                     is_invalid = True
                 
                 if is_invalid:
+                    await Database.delete_one("messages", {"_id": message_id})
                     invalid_message_ids.append(message_id)
-            
-            # 删除无效的message
-            for message_id in invalid_message_ids:
-                await Database.delete_one("messages", {"_id": message_id})
-                logger.info(f"从数据库中删除无效Message {message_id}")
+                    logger.info(f"从数据库中删除无效Message {message_id}")
             
             logger.info(f"最终数据库Message检查完成，删除了 {len(invalid_message_ids)} 个无效Message")
             return True
@@ -354,6 +404,125 @@ class DataIntegrity:
             logger.error(f"最终数据库Message检查时发生错误: {e}")
             return False
     
+    async def run_incremental_check(self) -> dict:
+        """
+        只检查变更日志中记录的实体（删除的用户/匹配/聊天室，新建的匹配/聊天室），代价与变更数量成正比
+        检查失败时把变更放回日志，下一轮重试
+        """
+        changes = self.change_log.drain()
+        result = {"success": True, "changes": len(changes), "removed_matches": 0, "removed_chatrooms": 0,
+                  "repaired_users": 0, "deleted_messages": 0}
+        if not changes:
+            return result
+
+        try:
+            deleted_matches = dict(changes.deleted_matches)
+            deleted_chatrooms = set(changes.deleted_chatrooms)
+
+            # 1. 删除的用户：移除仍引用他们的匹配
+            # 他们的消息随聊天室在第 5 步按 chatroom_id 删除（走索引）；
+            # 按 message_sender_id / message_receiver_id 删除没有索引，会扫描整个 messages 集合
+            for user_id in changes.deleted_users:
+                for match in self.match_manager.get_user_matches(user_id):
+                    deleted_matches[match.match_id] = await self._remove_match(match)
+                    result["removed_matches"] += 1
+
+            # 2. 新建的匹配：两个用户都必须存在，并且双方的 match_ids 包含该匹配
+            for match_id in changes.created_matches:
+                match = self.match_manager.get_match(match_id)
+                if match is None:
+                    continue
+                user_1 = self.user_manager.get_user_instance(match.user_id_1)
+                user_2 = self.user_manager.get_user_instance(match.user_id_2)
+                if user_1 is None or user_2 is None:
+                    logger.warning(f"新建Match {match_id} 引用了不存在的用户，删除")
+                    deleted_matches[match_id] = await self._remove_match(match)
+                    result["removed_matches"] += 1
+                    continue
+                for user in (user_1, user_2):
+                    if match_id not in user.match_ids:
+                        user.match_ids.append(match_id)
+                        self.user_manager.mark_user_dirty(user.user_id)
+                        result["repaired_users"] += 1
+
+            # 3. 删除的匹配：从双方的 match_ids 中移除，并删除该匹配的聊天室
+            for match_id, (user_id_1, user_id_2, chatroom_id) in deleted_matches.items():
+                for user_id in (user_id_1, user_id_2):
+                    user = self.user_manager.get_user_instance(user_id)
+                    if user is not None and match_id in user.match_ids:
+                        user.match_ids.remove(match_id)
+                        self.user_manager.mark_user_dirty(user_id)
+                        result["repaired_users"] += 1
+                chatroom = self.chatroom_manager.chatrooms.get(chatroom_id) if chatroom_id is not None else None
+                if chatroom is not None and chatroom.match_id == match_id:
+                    await self._remove_chatroom(chatroom_id)
+                    deleted_chatrooms.add(chatroom_id)
+                    result["removed_chatrooms"] += 1
+
+            # 4. 新建的聊天室：两个用户和对应的匹配都必须存在
+            for chatroom_id in changes.created_chatrooms:
+                chatroom = self.chatroom_manager.chatrooms.get(chatroom_id)
+                if chatroom is None:
+                    continue
+                if (self.user_manager.get_user_instance(chatroom.user1_id) is None
+                        or self.user_manager.get_user_instance(chatroom.user2_id) is None
+                        or (chatroom.match_id is not None and self.match_manager.get_match(chatroom.match_id) is None)):
+                    logger.warning(f"新建Chatroom {chatroom_id} 引用了不存在的用户或匹配，删除")
+                    await self._remove_chatroom(chatroom_id)
+                    deleted_chatrooms.add(chatroom_id)
+                    result["removed_chatrooms"] += 1
+
+            # 5. 删除的聊天室：删除其中残留的消息
+            if deleted_chatrooms:
+                result["deleted_messages"] += await Database.delete_many(
+                    "messages", {"chatroom_id": {"$in": list(deleted_chatrooms)}}
+                ) or 0
+
+            # 本轮检查中自己产生的删除已经处理过，不再重复进入下一轮
+            self.change_log.discard_processed(deleted_matches.keys(), deleted_chatrooms)
+
+            if result["removed_matches"] or result["removed_chatrooms"] or result["repaired_users"] or result["deleted_messages"]:
+                logger.info(f"增量完备性检查: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"增量完备性检查失败，变更放回日志等待重试: {e}")
+            self.change_log.restore(changes)
+            result["success"] = False
+            return result
+
+    async def _remove_match(self, match) -> tuple:
+        """从内存和数据库删除匹配，返回删除日志需要的关联ID"""
+        self.match_manager.remove_match(match.match_id)
+        await Database.delete_one("matches", {"_id": match.match_id})
+        return match.user_id_1, match.user_id_2, match.chatroom_id
+
+    async def _remove_chatroom(self, chatroom_id: int):
+        self.chatroom_manager.chatrooms.pop(chatroom_id, None)
+        self.chatroom_manager.dirty_tracker.discard(chatroom_id)
+        MessageCache().invalidate(chatroom_id)
+        await Database.delete_one("chatrooms", {"_id": chatroom_id})
+
+    def is_full_check_due(self) -> bool:
+        interval = settings.INTEGRITY_FULL_CHECK_INTERVAL
+        if interval <= 0 or self.full_check_running:
+            return False
+        return self.last_full_check_at is None or time.monotonic() - self.last_full_check_at >= interval
+
+    async def run_full_check_if_due(self, force: bool = False) -> dict:
+        """
+        限频执行全量检查（低优先级后台任务调用），同一时间只运行一个
+        未到时间时返回 None
+        """
+        if self.full_check_running or (not force and not self.is_full_check_due()):
+            return None
+        self.full_check_running = True
+        try:
+            return await self.run_integrity_check()
+        finally:
+            self.full_check_running = False
+            self.last_full_check_at = time.monotonic()
+
     async def run_integrity_check(self) -> dict:
         """
         运行完整的数据完备性检查，返回检查结果统计
@@ -378,6 +547,8 @@ class DataIntegrity:
             ]
             
             for check_name, check_func in checks:
+                # 各项检查之间让出事件循环，避免长时间占用
+                await asyncio.sleep(0)
                 try:
                     success = await check_func()
                     if success:
@@ -408,7 +579,7 @@ class DataIntegrity:
     async def run_database_only_integrity_check(self) -> dict:
         """
         仅对数据库进行完备性检查，不涉及内存管理器
-        这是一个高复杂度操作，仅用于手动脚本执行
+        各项检查用聚合管道在服务端找出孤儿数据并批量清理，仅用于手动脚本执行
         """
         try:
             logger.info("启动数据库级别完备性检查...")
@@ -486,285 +657,248 @@ class DataIntegrity:
                 }
             }
     
+    # 以下数据库级检查都在服务端用聚合管道找出孤儿数据，只把ID流回本地，再批量删除/更新
+    # 内存占用与集合大小无关；$lookup 的 localField + pipeline 写法需要 MongoDB 5.0+
+
+    @staticmethod
+    def _lookup_ids(from_collection: str, local_field: str, as_field: str) -> dict:
+        """按 _id 关联另一集合，只取回 _id，避免把整条关联文档拉进管道"""
+        return {"$lookup": {
+            "from": from_collection,
+            "localField": local_field,
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"_id": 1}}],
+            "as": as_field,
+        }}
+
+    @staticmethod
+    def _is_empty(field: str) -> dict:
+        return {"$eq": [{"$size": field}, 0]}
+
+    @staticmethod
+    def _is_set(field: str) -> dict:
+        """与原逐条检查的 `if value and ...` 一致：None/0/空字符串视为未设置，不检查"""
+        return {"$not": [{"$in": [{"$ifNull": [field, None]}, [None, 0, ""]]}]}
+
+    async def _delete_ids(self, collection_name: str, id_batches) -> int:
+        """按批 delete_many({_id: {$in: batch}})，id_batches 为聚合结果的批次"""
+        deleted_count = 0
+        async for batch in id_batches:
+            ids = [document["_id"] for document in batch]
+            deleted_count += await Database.delete_many(collection_name, {"_id": {"$in": ids}})
+            logger.info(f"从数据库{collection_name}删除 {len(ids)} 个无效记录")
+        return deleted_count
+
     async def _check_database_matches(self) -> dict:
-        """检查数据库中matches表的数据完备性"""
+        """
+        检查数据库中matches表的数据完备性
+        一次遍历matches：用户不存在的match删除；用户存在但match_ids缺少该match的用 $addToSet 补上
+        """
         try:
             logger.info("开始检查数据库matches表...")
-            
-            # 获取所有用户数据
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            users_dict = {user["_id"]: user for user in users_data}  # 用于快速查找用户数据
-            
-            # 获取所有matches
-            matches_data = await Database.find("matches")
-            invalid_match_ids = []
-            valid_matches = []  # 存储有效的match，用于反向检查
-            
-            # 第一步：检查match中的用户是否存在
-            for match_data in matches_data:
-                match_id = match_data.get("_id")
-                user_id_1 = match_data.get("user_id_1")
-                user_id_2 = match_data.get("user_id_2")
-                
-                # 检查两个用户是否都存在
-                if user_id_1 not in existing_user_ids or user_id_2 not in existing_user_ids:
-                    logger.warning(f"数据库中发现无效Match {match_id}: user1({user_id_1})存在={user_id_1 in existing_user_ids}, user2({user_id_2})存在={user_id_2 in existing_user_ids}")
-                    invalid_match_ids.append(match_id)
-                else:
-                    # 记录有效的match用于反向检查
-                    valid_matches.append({
-                        "match_id": match_id,
-                        "user_id_1": user_id_1,
-                        "user_id_2": user_id_2
-                    })
-            
-            # 删除无效matches
+
+            def user_side(local_field: str, as_field: str) -> dict:
+                return {"$lookup": {
+                    "from": "users",
+                    "localField": local_field,
+                    "foreignField": "_id",
+                    "let": {"match_id": "$_id"},
+                    "pipeline": [{"$project": {
+                        "_id": 0,
+                        "linked": {"$in": ["$$match_id", {"$ifNull": ["$match_ids", []]}]},
+                    }}],
+                    "as": as_field,
+                }}
+
+            pipeline = [
+                {"$project": {"user_id_1": 1, "user_id_2": 1}},
+                user_side("user_id_1", "user_1"),
+                user_side("user_id_2", "user_2"),
+                {"$project": {
+                    "user_id_1": 1,
+                    "user_id_2": 1,
+                    "user_1": {"$arrayElemAt": ["$user_1", 0]},
+                    "user_2": {"$arrayElemAt": ["$user_2", 0]},
+                }},
+                # 有效且双向关联完整的match不返回
+                {"$match": {"$or": [
+                    {"user_1": {"$exists": False}},
+                    {"user_2": {"$exists": False}},
+                    {"user_1.linked": False},
+                    {"user_2.linked": False},
+                ]}},
+            ]
+
             deleted_count = 0
-            for match_id in invalid_match_ids:
-                await Database.delete_one("matches", {"_id": match_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Match {match_id}")
-            
-            # 第二步：反向检查 - 确保用户的match_ids包含相应的match
             updated_users_count = 0
-            for match in valid_matches:
-                match_id = match["match_id"]
-                user_id_1 = match["user_id_1"]
-                user_id_2 = match["user_id_2"]
-                
-                # 检查user1的match_ids
-                user1_data = users_dict.get(user_id_1)
-                if user1_data:
-                    user1_match_ids = user1_data.get("match_ids", [])
-                    if match_id not in user1_match_ids:
-                        # 添加match_id到用户的match_ids列表
-                        user1_match_ids.append(match_id)
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id_1},
-                            {"$set": {"match_ids": user1_match_ids}}
-                        )
-                        updated_users_count += 1
-                        logger.info(f"为用户 {user_id_1} 添加缺失的match_id: {match_id}")
-                
-                # 检查user2的match_ids
-                user2_data = users_dict.get(user_id_2)
-                if user2_data:
-                    user2_match_ids = user2_data.get("match_ids", [])
-                    if match_id not in user2_match_ids:
-                        # 添加match_id到用户的match_ids列表
-                        user2_match_ids.append(match_id)
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id_2},
-                            {"$set": {"match_ids": user2_match_ids}}
-                        )
-                        updated_users_count += 1
-                        logger.info(f"为用户 {user_id_2} 添加缺失的match_id: {match_id}")
-            
+            async for batch in Database.aggregate("matches", pipeline):
+                invalid_match_ids = []
+                link_operations = []
+                now = datetime.now(timezone.utc)
+                for match_data in batch:
+                    match_id = match_data["_id"]
+                    user_1 = match_data.get("user_1")
+                    user_2 = match_data.get("user_2")
+                    if user_1 is None or user_2 is None:
+                        logger.warning(f"数据库中发现无效Match {match_id}: user1({match_data.get('user_id_1')})存在={user_1 is not None}, user2({match_data.get('user_id_2')})存在={user_2 is not None}")
+                        invalid_match_ids.append(match_id)
+                        continue
+                    for user_id, user_side_data in ((match_data["user_id_1"], user_1), (match_data["user_id_2"], user_2)):
+                        if not user_side_data["linked"]:
+                            link_operations.append(UpdateOne(
+                                {"_id": user_id},
+                                {"$addToSet": {"match_ids": match_id}, "$set": {"updated_at": now}}
+                            ))
+                            logger.info(f"为用户 {user_id} 添加缺失的match_id: {match_id}")
+
+                if invalid_match_ids:
+                    deleted_count += await Database.delete_many("matches", {"_id": {"$in": invalid_match_ids}})
+                if link_operations:
+                    await Database.bulk_write("users", link_operations)
+                    updated_users_count += len(link_operations)
+
             logger.info(f"数据库matches检查完成，删除了 {deleted_count} 个无效Match，为 {updated_users_count} 个用户补充了缺失的match_id")
             return {"success": True, "deleted": {"matches": deleted_count}, "updated_users": updated_users_count}
-            
+
         except Exception as e:
             logger.error(f"检查数据库matches时发生错误: {e}")
             return {"success": False, "deleted": {"matches": 0}, "updated_users": 0}
-    
+
     async def _check_database_user_match_ids(self) -> dict:
-        """检查数据库中users表的match_ids完备性"""
+        """检查数据库中users表的match_ids完备性：用 $pull 移除指向不存在match的ID"""
         try:
             logger.info("开始检查数据库users表的match_ids...")
-            
-            # 获取所有match_ids
-            matches_data = await Database.find("matches")
-            existing_match_ids = set(match["_id"] for match in matches_data)
-            
-            # 获取所有用户
-            users_data = await Database.find("users")
+
+            pipeline = [
+                {"$match": {"match_ids.0": {"$exists": True}}},
+                {"$project": {"match_ids": 1}},
+                self._lookup_ids("matches", "match_ids", "existing"),
+                {"$project": {"stale": {"$setDifference": ["$match_ids", "$existing._id"]}}},
+                {"$match": {"stale.0": {"$exists": True}}},
+            ]
+
             updated_count = 0
-            
-            for user_data in users_data:
-                user_id = user_data.get("_id")
-                match_ids = user_data.get("match_ids", [])
-                
-                if match_ids:
-                    invalid_match_ids = []
-                    
-                    # 检查每个match_id是否存在
-                    for match_id in match_ids:
-                        if match_id not in existing_match_ids:
-                            logger.warning(f"数据库用户 {user_id} 的match_ids中发现不存在的match_id: {match_id}")
-                            invalid_match_ids.append(match_id)
-                    
-                    # 更新用户的match_ids
-                    if invalid_match_ids:
-                        new_match_ids = [mid for mid in match_ids if mid not in invalid_match_ids]
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id},
-                            {"$set": {"match_ids": new_match_ids}}
-                        )
-                        updated_count += 1
-                        logger.info(f"更新数据库用户 {user_id} 的match_ids，删除了 {len(invalid_match_ids)} 个无效match_id")
-            
+            async for batch in Database.aggregate("users", pipeline):
+                now = datetime.now(timezone.utc)
+                operations = []
+                for user_data in batch:
+                    logger.warning(f"数据库用户 {user_data['_id']} 的match_ids中发现不存在的match_id: {user_data['stale']}")
+                    operations.append(UpdateOne(
+                        {"_id": user_data["_id"]},
+                        {"$pull": {"match_ids": {"$in": user_data["stale"]}}, "$set": {"updated_at": now}}
+                    ))
+                await Database.bulk_write("users", operations)
+                updated_count += len(operations)
+
             logger.info(f"数据库用户match_ids检查完成，更新了 {updated_count} 个用户")
             return {"success": True, "deleted": {"users": updated_count}}
-            
+
         except Exception as e:
             logger.error(f"检查数据库用户match_ids时发生错误: {e}")
             return {"success": False, "deleted": {"users": 0}}
-    
+
     async def _check_database_chatrooms(self) -> dict:
-        """检查数据库中chatrooms表的数据完备性"""
+        """检查数据库中chatrooms表的数据完备性：用户或match不存在的chatroom删除"""
         try:
             logger.info("开始检查数据库chatrooms表...")
-            
-            # 获取所有用户ID和match_ids
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            
-            matches_data = await Database.find("matches")
-            existing_match_ids = set(match["_id"] for match in matches_data)
-            
-            # 获取所有chatrooms
-            chatrooms_data = await Database.find("chatrooms")
-            invalid_chatroom_ids = []
-            
-            for chatroom_data in chatrooms_data:
-                chatroom_id = chatroom_data.get("_id")
-                user1_id = chatroom_data.get("user1_id")
-                user2_id = chatroom_data.get("user2_id")
-                match_id = chatroom_data.get("match_id")
-                
-                is_invalid = False
-                
-                # 检查用户是否存在
-                if user1_id not in existing_user_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 包含不存在的user1_id: {user1_id}")
-                    is_invalid = True
-                
-                if user2_id not in existing_user_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 包含不存在的user2_id: {user2_id}")
-                    is_invalid = True
-                
-                # 检查match_id是否存在
-                if match_id is not None and match_id not in existing_match_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 对应不存在的match_id: {match_id}")
-                    is_invalid = True
-                
-                if is_invalid:
-                    invalid_chatroom_ids.append(chatroom_id)
-            
-            # 删除无效chatrooms
-            deleted_count = 0
-            for chatroom_id in invalid_chatroom_ids:
-                await Database.delete_one("chatrooms", {"_id": chatroom_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Chatroom {chatroom_id}")
-            
+
+            pipeline = [
+                {"$project": {"user1_id": 1, "user2_id": 1, "match_id": 1}},
+                self._lookup_ids("users", "user1_id", "user1"),
+                self._lookup_ids("users", "user2_id", "user2"),
+                self._lookup_ids("matches", "match_id", "match"),
+                {"$match": {"$expr": {"$or": [
+                    self._is_empty("$user1"),
+                    self._is_empty("$user2"),
+                    {"$and": [{"$ne": [{"$ifNull": ["$match_id", None]}, None]}, self._is_empty("$match")]},
+                ]}}},
+                {"$project": {"_id": 1}},
+            ]
+
+            deleted_count = await self._delete_ids("chatrooms", Database.aggregate("chatrooms", pipeline))
+
             logger.info(f"数据库chatrooms检查完成，删除了 {deleted_count} 个无效Chatroom")
             return {"success": True, "deleted": {"chatrooms": deleted_count}}
-            
+
         except Exception as e:
             logger.error(f"检查数据库chatrooms时发生错误: {e}")
             return {"success": False, "deleted": {"chatrooms": 0}}
-    
+
     async def _check_database_messages(self) -> dict:
-        """检查数据库中messages表的数据完备性"""
+        """
+        检查数据库中messages表的数据完备性
+        先按 (chatroom_id, 发送者, 接收者) 分组，每个聊天室只有少数几组，
+        $lookup 只对分组执行而不是对每条消息执行；无效分组用 DeleteMany 整组删除
+        """
         try:
             logger.info("开始检查数据库messages表...")
-            
-            # 获取所有用户ID和chatroom_ids
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            
-            chatrooms_data = await Database.find("chatrooms")
-            existing_chatroom_ids = set(chatroom["_id"] for chatroom in chatrooms_data)
-            
-            # 获取所有messages
-            messages_data = await Database.find("messages")
-            invalid_message_ids = []
-            
-            for message_data in messages_data:
-                message_id = message_data.get("_id")
-                sender_id = message_data.get("message_sender_id")
-                receiver_id = message_data.get("message_receiver_id")
-                chatroom_id = message_data.get("chatroom_id")
-                
-                is_invalid = False
-                
-                # 检查发送者是否存在
-                if sender_id and sender_id not in existing_user_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的message_sender_id: {sender_id}")
-                    is_invalid = True
-                
-                # 检查接收者是否存在
-                if receiver_id and receiver_id not in existing_user_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的message_receiver_id: {receiver_id}")
-                    is_invalid = True
-                
-                # 检查chatroom_id是否存在
-                if chatroom_id and chatroom_id not in existing_chatroom_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的chatroom_id: {chatroom_id}")
-                    is_invalid = True
-                
-                if is_invalid:
-                    invalid_message_ids.append(message_id)
-            
-            # 删除无效messages
+
+            pipeline = [
+                {"$group": {"_id": {
+                    "chatroom_id": "$chatroom_id",
+                    "sender_id": "$message_sender_id",
+                    "receiver_id": "$message_receiver_id",
+                }}},
+                self._lookup_ids("chatrooms", "_id.chatroom_id", "chatroom"),
+                self._lookup_ids("users", "_id.sender_id", "sender"),
+                self._lookup_ids("users", "_id.receiver_id", "receiver"),
+                {"$match": {"$expr": {"$or": [
+                    {"$and": [self._is_set("$_id.sender_id"), self._is_empty("$sender")]},
+                    {"$and": [self._is_set("$_id.receiver_id"), self._is_empty("$receiver")]},
+                    {"$and": [self._is_set("$_id.chatroom_id"), self._is_empty("$chatroom")]},
+                ]}}},
+                {"$project": {"_id": 1}},
+            ]
+
             deleted_count = 0
-            for message_id in invalid_message_ids:
-                await Database.delete_one("messages", {"_id": message_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Message {message_id}")
-            
+            async for batch in Database.aggregate("messages", pipeline):
+                operations = []
+                for group in batch:
+                    key = group["_id"]
+                    logger.warning(f"数据库Message分组 chatroom_id={key.get('chatroom_id')}, sender={key.get('sender_id')}, receiver={key.get('receiver_id')} 引用了不存在的数据")
+                    operations.append(DeleteMany({
+                        "chatroom_id": key.get("chatroom_id"),
+                        "message_sender_id": key.get("sender_id"),
+                        "message_receiver_id": key.get("receiver_id"),
+                    }))
+                deleted_count += (await Database.bulk_write("messages", operations))["deleted"]
+
             logger.info(f"数据库messages检查完成，删除了 {deleted_count} 个无效Message")
             return {"success": True, "deleted": {"messages": deleted_count}}
-            
+
         except Exception as e:
             logger.error(f"检查数据库messages时发生错误: {e}")
             return {"success": False, "deleted": {"messages": 0}}
-    
+
     async def _check_database_chatroom_message_ids(self) -> dict:
-        """检查数据库中chatrooms表的message_ids完备性"""
+        """检查数据库中chatrooms表的message_ids完备性：用 $pull 移除指向不存在message的ID"""
         try:
             logger.info("开始检查数据库chatrooms表的message_ids...")
-            
-            # 获取所有message_ids
-            messages_data = await Database.find("messages")
-            existing_message_ids = set(message["_id"] for message in messages_data)
-            
-            # 获取所有chatrooms
-            chatrooms_data = await Database.find("chatrooms")
+
+            pipeline = [
+                {"$match": {"message_ids.0": {"$exists": True}}},
+                {"$project": {"message_ids": 1}},
+                self._lookup_ids("messages", "message_ids", "existing"),
+                {"$project": {"stale": {"$setDifference": ["$message_ids", "$existing._id"]}}},
+                {"$match": {"stale.0": {"$exists": True}}},
+            ]
+
             updated_count = 0
-            
-            for chatroom_data in chatrooms_data:
-                chatroom_id = chatroom_data.get("_id")
-                message_ids = chatroom_data.get("message_ids", [])
-                
-                if message_ids:
-                    invalid_message_ids = []
-                    
-                    # 检查每个message_id是否存在
-                    for message_id in message_ids:
-                        if message_id not in existing_message_ids:
-                            logger.warning(f"数据库Chatroom {chatroom_id} 的message_ids中发现不存在的message_id: {message_id}")
-                            invalid_message_ids.append(message_id)
-                    
-                    # 更新chatroom的message_ids
-                    if invalid_message_ids:
-                        new_message_ids = [mid for mid in message_ids if mid not in invalid_message_ids]
-                        await Database.update_one(
-                            "chatrooms",
-                            {"_id": chatroom_id},
-                            {"$set": {"message_ids": new_message_ids}}
-                        )
-                        updated_count += 1
-                        logger.info(f"更新数据库Chatroom {chatroom_id} 的message_ids，删除了 {len(invalid_message_ids)} 个无效message_id")
-            
+            async for batch in Database.aggregate("chatrooms", pipeline):
+                now = datetime.now(timezone.utc)
+                operations = []
+                for chatroom_data in batch:
+                    logger.warning(f"数据库Chatroom {chatroom_data['_id']} 的message_ids中发现 {len(chatroom_data['stale'])} 个不存在的message_id")
+                    operations.append(UpdateOne(
+                        {"_id": chatroom_data["_id"]},
+                        {"$pull": {"message_ids": {"$in": chatroom_data["stale"]}}, "$set": {"updated_at": now}}
+                    ))
+                await Database.bulk_write("chatrooms", operations)
+                updated_count += len(operations)
+
             logger.info(f"数据库chatroom message_ids检查完成，更新了 {updated_count} 个chatroom")
             return {"success": True, "deleted": {"chatrooms": updated_count}}
-            
+
         except Exception as e:
             logger.error(f"检查数据库chatroom message_ids时发生错误: {e}")
-            return {"success": False, "deleted": {"chatrooms": 0}}
\ No newline at end of file
+            return {"success": False, "deleted": {"chatrooms": 0}}
@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+from app.utils.dirty_tracker import DirtyTracker
+from app.services.https.TombstoneLog import TombstoneLog
+
+
+class IntegrityChanges:
+    """一次 drain 取出的变更集合"""
+    __slots__ = ("deleted_users", "deleted_matches", "deleted_chatrooms", "created_matches", "created_chatrooms")
+
+    def __init__(self, deleted_users: Set[int], deleted_matches: Dict[int, Tuple], deleted_chatrooms: Set[int],
+                 created_matches: Set[int], created_chatrooms: Set[int]):
+        self.deleted_users = deleted_users
+        self.deleted_matches = deleted_matches  # {match_id: (user_id_1, user_id_2, chatroom_id)}
+        self.deleted_chatrooms = deleted_chatrooms
+        self.created_matches = created_matches
+        self.created_chatrooms = created_chatrooms
+
+    def __len__(self) -> int:
+        return (len(self.deleted_users) + len(self.deleted_matches) + len(self.deleted_chatrooms)
+                + len(self.created_matches) + len(self.created_chatrooms))
+
+
+class IntegrityChangeLog:
+    """
+    数据完备性变更日志单例
+    UserManagement / MatchManager / ChatroomManager 在创建或删除实体时记录ID，
+    DataIntegrity.run_incremental_check 只检查这些受影响的实体，不再每轮遍历全部数据
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.deleted_users = DirtyTracker("deleted_users")
+            cls._instance.deleted_matches = {}  # 删除时 Match 实例已不在内存，记录检查所需的关联ID
+            cls._instance.deleted_chatrooms = DirtyTracker("deleted_chatrooms")
+            cls._instance.created_matches = DirtyTracker("created_matches")
+            cls._instance.created_chatrooms = DirtyTracker("created_chatrooms")
+        return cls._instance
+
+    # 所有删除都经过这里，同时记录删除墓碑供快照恢复回放
+    def record_user_deleted(self, user_id: int):
+        self.deleted_users.mark(user_id)
+        TombstoneLog().record("users", user_id)
+
+    def record_match_deleted(self, match_id: int, user_id_1: int, user_id_2: int, chatroom_id: Optional[int]):
+        self.deleted_matches[match_id] = (user_id_1, user_id_2, chatroom_id)
+        self.created_matches.discard(match_id)
+        TombstoneLog().record("matches", match_id)
+
+    def record_chatroom_deleted(self, chatroom_id: int):
+        self.deleted_chatrooms.mark(chatroom_id)
+        self.created_chatrooms.discard(chatroom_id)
+        TombstoneLog().record("chatrooms", chatroom_id)
+
+    def record_match_created(self, match_id: int):
+        self.created_matches.mark(match_id)
+
+    def record_chatroom_created(self, chatroom_id: int):
+        self.created_chatrooms.mark(chatroom_id)
+
+    def drain(self) -> IntegrityChanges:
+        """取出所有待检查的变更并清空"""
+        deleted_matches = self.deleted_matches
+        self.deleted_matches = {}
+        return IntegrityChanges(
+            self.deleted_users.drain(),
+            deleted_matches,
+            self.deleted_chatrooms.drain(),
+            self.created_matches.drain(),
+            self.created_chatrooms.drain(),
+        )
+
+    def discard_processed(self, match_ids: Iterable[int], chatroom_ids: Iterable[int]):
+        """检查过程中自身产生的删除已经处理完毕，从日志中移除"""
+        for match_id in match_ids:
+            self.deleted_matches.pop(match_id, None)
+        for chatroom_id in chatroom_ids:
+            self.deleted_chatrooms.discard(chatroom_id)
+
+    def restore(self, changes: IntegrityChanges):
+        """检查失败时放回，等待下一轮重试（各项检查都是幂等的）"""
+        self.deleted_users.restore(changes.deleted_users)
+        for match_id, related_ids in changes.deleted_matches.items():
+            self.deleted_matches.setdefault(match_id, related_ids)
+        self.deleted_chatrooms.restore(changes.deleted_chatrooms)
+        self.created_matches.restore(changes.created_matches)
+        self.created_chatrooms.restore(changes.created_chatrooms)
+
+    def pending(self) -> int:
+        return (len(self.deleted_users) + len(self.deleted_matches) + len(self.deleted_chatrooms)
+                + len(self.created_matches) + len(self.created_chatrooms))
@@ -1,8 +1,10 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from app.config import settings
 from app.objects.Match import Match
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
+from app.utils.dirty_tracker import DirtyTracker
+from app.services.https.IntegrityChangeLog import IntegrityChangeLog
 from datetime import datetime, timezone
 
 logger = MyLogger("MatchManager")
@@ -19,10 +21,26 @@ class MatchManager:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.match_list = {}  # Dictionary to store matches by match_id
+            cls._instance.dirty_tracker = DirtyTracker("matches")  # match_ids waiting to be persisted
+            cls._instance.user_match_index = {}  # {user_id: set(match_id)}
+            cls._instance.pair_index = {}  # {(min_user_id, max_user_id): match_id}
             logger.info("MatchManager singleton instance created")
         return cls._instance
 
-    async def construct(self) -> bool:
+    # 启动加载只读取 Match 需要的字段
+    LOAD_PROJECTION = {
+        "user_id_1": 1,
+        "user_id_2": 1,
+        "description_to_user_1": 1,
+        "description_to_user_2": 1,
+        "is_liked": 1,
+        "match_score": 1,
+        "mutual_game_scores": 1,
+        "chatroom_id": 1,
+        "match_time": 1,
+    }
+
+    async def construct(self, batch_size: int = None) -> bool:
         """
         Initialize MatchManager by initializing match counter and loading matches from database
         """
@@ -31,53 +49,13 @@ class MatchManager:
             logger.info("MatchManager construct: Initializing Match counter...")
             await Match.initialize_counter()
             
-            # Load existing matches from database
+            # Stream existing matches from database in batches
             logger.info("MatchManager construct: Loading matches from database...")
-            matches_data = await Database.find("matches")
-            logger.info(f"MatchManager construct: Found {len(matches_data)} matches in database")
-            
             loaded_count = 0
-            for match_data in matches_data:
-                try:
-                    match_id = match_data["_id"]  # match_id现在存储在_id字段中
-                    user_id_1 = match_data["user_id_1"]
-                    user_id_2 = match_data["user_id_2"]
-                    
-                    logger.info(f"MatchManager construct: Processing match {match_id} (users: {user_id_1}, {user_id_2})")
-                    
-                    # 创建Match实例但使用现有ID
-                    # 先临时禁用初始化检查
-                    Match._initialized = True
-                    original_counter = Match._match_counter
-                    
-                    # 创建Match实例
-                    match = Match(
-                        telegram_user_session_id_1=user_id_1,
-                        telegram_user_session_id_2=user_id_2,
-                        reason_to_id_1=match_data.get("description_to_user_1", ""),
-                        reason_to_id_2=match_data.get("description_to_user_2", ""),
-                        match_score=match_data.get("match_score", 0),
-                        match_time=match_data.get("match_time", "Unknown")
-                    )
-                    
-                    # 恢复原始计数器并设置正确的match_id
-                    Match._match_counter = original_counter
-                    match.match_id = match_id
-                    
-                    # 设置其他属性
-                    match.is_liked = match_data.get("is_liked", False)
-                    match.mutual_game_scores = match_data.get("mutual_game_scores", {})
-                    match.chatroom_id = match_data.get("chatroom_id")
-                    
-                    # 存储到内存
-                    self.match_list[match_id] = match
-                    loaded_count += 1
-                    
-                    logger.info(f"MatchManager construct: Successfully loaded match {match_id}")
-                    
-                except Exception as e:
-                    logger.error(f"MatchManager construct: Error loading match from database: {e}")
-                    continue
+            async for batch in Database.iterate("matches", projection=self.LOAD_PROJECTION, batch_size=batch_size):
+                for match_data in batch:
+                    if self.load_match_document(match_data):
+                        loaded_count += 1
             
             logger.info(f"MatchManager construct: Loaded {loaded_count} matches from database")
             logger.info(f"MatchManager construct completed successfully")
@@ -87,6 +65,23 @@ class MatchManager:
             logger.error(f"MatchManager construct: Error constructing MatchManager: {e}")
             return False
 
+    def load_match_document(self, match_data: dict) -> Optional[Match]:
+        """
+        把一个数据库匹配文档加载到内存并建立索引
+        已存在的匹配会被替换（快照回放）
+        """
+        try:
+            match = Match.from_document(match_data)
+            if match.match_id in self.match_list:
+                self._unindex_match(self.match_list[match.match_id])
+            self.match_list[match.match_id] = match
+            self._index_match(match)
+            logger.debug(f"MatchManager construct: Loaded match {match.match_id} (users: {match.user_id_1}, {match.user_id_2})")
+            return match
+        except Exception as e:
+            logger.error(f"MatchManager construct: Error loading match from database: {e}")
+            return None
+
     async def create_match(self, user_id_1: int, user_id_2: int, reason_1: str, reason_2: str, match_score: int) -> Match:
         """
         创建新的匹配
@@ -104,6 +99,9 @@ class MatchManager:
             
             # Store in memory
             self.match_list[new_match.match_id] = new_match
+            self._index_match(new_match)
+            self.dirty_tracker.mark(new_match.match_id)
+            IntegrityChangeLog().record_match_created(new_match.match_id)
             
             # Add match_id to corresponding user instances
             from app.services.https.UserManagement import UserManagement
@@ -115,6 +113,7 @@ class MatchManager:
             if user_1:
                 if new_match.match_id not in user_1.match_ids:
                     user_1.match_ids.append(new_match.match_id)
+                    user_manager.mark_user_dirty(user_id_1)
                     logger.info(f"Added match {new_match.match_id} to user {user_id_1} match_ids")
             else:
                 logger.warning(f"User {user_id_1} not found in UserManagement")
@@ -122,6 +121,7 @@ class MatchManager:
             if user_2:
                 if new_match.match_id not in user_2.match_ids:
                     user_2.match_ids.append(new_match.match_id)
+                    user_manager.mark_user_dirty(user_id_2)
                     logger.info(f"Added match {new_match.match_id} to user {user_id_2} match_ids")
             else:
                 logger.warning(f"User {user_id_2} not found in UserManagement")
@@ -133,6 +133,70 @@ class MatchManager:
             logger.error(f"Error creating match between users {user_id_1} and {user_id_2}: {e}")
             raise
 
+    @staticmethod
+    def _pair_key(user_id_1: int, user_id_2: int) -> Tuple[int, int]:
+        """无序用户对的索引键"""
+        return (user_id_1, user_id_2) if user_id_1 <= user_id_2 else (user_id_2, user_id_1)
+
+    def _index_match(self, match: Match):
+        """
+        把匹配加入 user_id -> match_ids 和用户对索引
+        所有写入 match_list 的地方都必须调用
+        """
+        self.user_match_index.setdefault(match.user_id_1, set()).add(match.match_id)
+        self.user_match_index.setdefault(match.user_id_2, set()).add(match.match_id)
+        # 历史数据中可能存在重复的用户对，保留先加载的那个
+        self.pair_index.setdefault(self._pair_key(match.user_id_1, match.user_id_2), match.match_id)
+
+    def _unindex_match(self, match: Match):
+        """从索引中移除匹配"""
+        for user_id in (match.user_id_1, match.user_id_2):
+            match_ids = self.user_match_index.get(user_id)
+            if match_ids is not None:
+                match_ids.discard(match.match_id)
+                if not match_ids:
+                    del self.user_match_index[user_id]
+        pair_key = self._pair_key(match.user_id_1, match.user_id_2)
+        if self.pair_index.get(pair_key) == match.match_id:
+            # 同一用户对还有重复的匹配时，索引改为指向剩下的（match_id 最小的）那个
+            remaining = [
+                match_id for match_id in self.user_match_index.get(match.user_id_1, ())
+                if match_id != match.match_id and match_id in self.match_list
+                and self._pair_key(self.match_list[match_id].user_id_1, self.match_list[match_id].user_id_2) == pair_key
+            ]
+            if remaining:
+                self.pair_index[pair_key] = min(remaining)
+            else:
+                del self.pair_index[pair_key]
+
+    def remove_match(self, match_id: int) -> Optional[Match]:
+        """
+        从内存中删除匹配并同步索引（不操作数据库）
+        Returns 被删除的 Match，不存在时返回 None
+        """
+        match = self.match_list.pop(match_id, None)
+        if match is not None:
+            self._unindex_match(match)
+            IntegrityChangeLog().record_match_deleted(match_id, match.user_id_1, match.user_id_2, match.chatroom_id)
+        self.dirty_tracker.discard(match_id)
+        return match
+
+    def get_match_by_pair(self, user_id_1: int, user_id_2: int) -> Optional[Match]:
+        """
+        O(1) 查找两个用户之间已存在的匹配（与顺序无关）
+        """
+        match_id = self.pair_index.get(self._pair_key(user_id_1, user_id_2))
+        if match_id is None:
+            return None
+        return self.match_list.get(match_id)
+
+    def mark_match_dirty(self, match_id: int):
+        """
+        标记匹配需要写回数据库，由后台自动保存任务处理
+        """
+        if match_id in self.match_list:
+            self.dirty_tracker.mark(match_id)
+
     def get_match(self, match_id) -> Optional[Match]:
         """
         根据match_id获取匹配
@@ -180,29 +244,67 @@ class MatchManager:
                 # Save specific match
                 match = self.get_match(match_id)
                 if match:
+                    # 先清除脏标记，保存期间发生的新修改会重新标记
+                    self.dirty_tracker.discard(match.match_id)
                     success = await match.save_to_database()
                     if success:
                         logger.info(f"Saved match {match_id} to database")
+                    else:
+                        self.dirty_tracker.mark(match.match_id)
                     return success
                 else:
                     logger.error(f"Cannot save: Match {match_id} not found")
                     return False
             else:
-                # Save all matches
-                success_count = 0
-                total_matches = len(self.match_list)
+                # Save all matches in bulk batches
+                matches = list(self.match_list.values())
+                for match in matches:
+                    self.dirty_tracker.discard(match.match_id)
                 
-                for match in self.match_list.values():
-                    if await match.save_to_database():
-                        success_count += 1
+                failed_ids = await self._bulk_save_matches(matches)
+                if failed_ids:
+                    self.dirty_tracker.restore(failed_ids)
                 
-                logger.info(f"Saved {success_count}/{total_matches} matches to database")
-                return success_count == total_matches
+                total_matches = len(matches)
+                logger.info(f"Saved {total_matches - len(failed_ids)}/{total_matches} matches to database")
+                return not failed_ids
                 
         except Exception as e:
             logger.error(f"Error saving matches to database: {e}")
             return False
 
+    async def _bulk_save_matches(self, matches: list) -> list:
+        """
+        Upsert matches through Database.bulk_upsert (one round trip per batch)
+        Returns the match_ids that failed to save
+        """
+        try:
+            batch_stats = await Database.bulk_upsert("matches", [match.to_document() for match in matches])
+        except Exception as e:
+            logger.error(f"Error bulk saving matches: {e}")
+            return [match.match_id for match in matches]
+        
+        failed_ids = []
+        for stats in batch_stats:
+            failed_ids.extend(stats["failed_keys"])
+        return failed_ids
+
+    async def save_dirty_to_database(self) -> tuple[int, int]:
+        """
+        write-behind 落库：只保存被标记为脏的匹配
+        Returns (saved_count, dirty_count)
+        """
+        dirty_match_ids = self.dirty_tracker.drain()
+        # Matches deleted since they were marked are skipped
+        matches = [self.match_list[match_id] for match_id in dirty_match_ids if match_id in self.match_list]
+        if not matches:
+            return 0, 0
+
+        failed_ids = await self._bulk_save_matches(matches)
+        if failed_ids:
+            self.dirty_tracker.restore(failed_ids)
+        return len(matches) - len(failed_ids), len(matches)
+
     def get_match_info(self, user_id: int, match_id: int) -> Optional[Dict[str, Any]]:
         """
         获取匹配信息，返回对特定用户的视图
@@ -243,10 +345,8 @@ class MatchManager:
         获取用户的所有匹配
         """
         try:
-            user_matches = []
-            for match in self.match_list.values():
-                if match.user_id_1 == user_id or match.user_id_2 == user_id:
-                    user_matches.append(match)
+            match_ids = self.user_match_index.get(user_id, ())
+            user_matches = [self.match_list[match_id] for match_id in match_ids if match_id in self.match_list]
             
             logger.info(f"Found {len(user_matches)} matches for user {user_id}")
             return user_matches
@@ -285,6 +385,7 @@ class MatchManager:
                     
                     # Store in memory
                     self.match_list[match.match_id] = match
+                    self._index_match(match)
                     loaded_count += 1
                     
                 except Exception as e:
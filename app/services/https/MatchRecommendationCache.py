@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from app.config import settings
+from app.services.matching.MatchEngine import get_match_engine
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("MatchRecommendationCache")
+
+
+class _RecommendationBatch:
+    """一个用户缓存的推荐批次"""
+    __slots__ = ("items", "fetched_at")
+
+    def __init__(self, items, fetched_at: float):
+        self.items = deque(items)
+        self.fetched_at = fetched_at
+
+
+class MatchRecommendationCache:
+    """
+    匹配推荐缓存单例，位于匹配引擎（n8n / 本地，见 get_match_engine）之前
+    每次向匹配引擎请求 K 个推荐，每次 /ws/match 连接从批次中取出一个；
+    剩余数量低于低水位时在后台补货，常见情况下连接时只需一次内存查找
+    缓存按 TTL 过期，并按用户数做 LRU 淘汰
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.batch_size = settings.MATCH_RECOMMENDATION_BATCH_SIZE
+            cls._instance.ttl = settings.MATCH_RECOMMENDATION_TTL
+            cls._instance.max_users = settings.MATCH_RECOMMENDATION_MAX_USERS
+            cls._instance.low_watermark = settings.MATCH_RECOMMENDATION_LOW_WATERMARK
+            cls._instance.batches = OrderedDict()  # {user_id: _RecommendationBatch}，末尾为最近使用
+            cls._instance.refills: Dict[int, asyncio.Task] = {}  # 每个用户最多一个进行中的补货
+            cls._instance.hits = 0
+            cls._instance.misses = 0
+            cls._instance.refill_count = 0
+            cls._instance.evictions = 0
+            logger.info("MatchRecommendationCache singleton instance created")
+        return cls._instance
+
+    def _is_fresh(self, batch: _RecommendationBatch) -> bool:
+        return time.monotonic() - batch.fetched_at < self.ttl
+
+    @staticmethod
+    def _is_still_valid(user_id: int, recommendation: dict) -> bool:
+        """
+        缓存期间状态可能变化：对方用户已注销或双方有拉黑关系的推荐不再发放
+        已存在的匹配仍交给 MatchSessionHandler 按 "Existing match found" 处理
+        """
+        from app.services.https.UserManagement import UserManagement
+
+        matched_user_id = recommendation.get("matched_user_id")
+        user_manager = UserManagement()
+        matched_user = user_manager.get_user_instance(matched_user_id)
+        if matched_user is None:
+            return False
+        user = user_manager.get_user_instance(user_id)
+        if user is not None and matched_user_id in user.blocked_user_ids:
+            return False
+        return user_id not in matched_user.blocked_user_ids
+
+    def _pop_valid(self, user_id: int) -> Optional[dict]:
+        batch = self.batches.get(user_id)
+        if batch is None:
+            return None
+        if not self._is_fresh(batch):
+            del self.batches[user_id]
+            return None
+        self.batches.move_to_end(user_id)
+        while batch.items:
+            recommendation = batch.items.popleft()
+            if self._is_still_valid(user_id, recommendation):
+                return recommendation
+        return None
+
+    async def get_recommendation(self, user_id: int) -> Optional[dict]:
+        """
+        取出一个推荐（与 request_matches 返回的单个元素结构相同），没有可用推荐时返回 None
+        缓存未命中时同步等待一次补货；匹配引擎请求失败时异常向上抛出
+        """
+        recommendation = self._pop_valid(user_id)
+        if recommendation is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            await self._refill(user_id)
+            recommendation = self._pop_valid(user_id)
+
+        batch = self.batches.get(user_id)
+        if batch is not None and len(batch.items) < self.low_watermark:
+            self._schedule_refill(user_id)
+        return recommendation
+
+    def _schedule_refill(self, user_id: int):
+        """后台补货，同一用户同时只有一个补货任务"""
+        if user_id in self.refills:
+            return
+        task = asyncio.create_task(self._refill_in_background(user_id))
+        self.refills[user_id] = task
+
+    async def _refill_in_background(self, user_id: int):
+        try:
+            await self._fetch(user_id)
+        except Exception as e:
+            logger.warning(f"Background recommendation refill failed for user {user_id}: {e}")
+        finally:
+            self.refills.pop(user_id, None)
+
+    async def _refill(self, user_id: int):
+        """前台补货，已有进行中的补货时等待它而不是重复请求"""
+        task = self.refills.get(user_id)
+        if task is not None:
+            await asyncio.shield(task)
+            return
+        await self._fetch(user_id)
+
+    async def _fetch(self, user_id: int):
+        recommendations = await get_match_engine().request_matches(user_id, num_of_matches=self.batch_size)
+        self.refill_count += 1
+
+        batch = self.batches.get(user_id)
+        if batch is not None and self._is_fresh(batch):
+            # 保留尚未发放的推荐，追加新推荐（去掉重复的对象用户）
+            pending = {item.get("matched_user_id") for item in batch.items}
+            batch.items.extend(item for item in recommendations if item.get("matched_user_id") not in pending)
+            batch.fetched_at = time.monotonic()
+        else:
+            self.batches[user_id] = _RecommendationBatch(recommendations, time.monotonic())
+        self.batches.move_to_end(user_id)
+
+        while len(self.batches) > self.max_users:
+            self.batches.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        self.batches.pop(user_id, None)
+
+    async def close(self):
+        """取消所有进行中的后台补货，在 lifespan 关闭时调用"""
+        tasks = list(self.refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.refills.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self.batches),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "refills": self.refill_count,
+            "refills_in_flight": len(self.refills),
+            "evictions": self.evictions,
+        }
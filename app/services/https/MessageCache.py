@@ -0,0 +1,198 @@
+import sys
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Optional, List, Tuple
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("MessageCache")
+
+# 每条缓存消息除内容外的大致固定开销（dict + 时间 + 两个int）
+_ENTRY_OVERHEAD_BYTES = 400
+
+
+class _ChatroomBuffer:
+    """
+    单个聊天室的环形缓冲区，按 _id 升序保存最近的消息
+    covers_start 为 True 表示缓冲区包含该聊天室的第一条消息，即缓冲区就是完整的聊天记录
+    """
+    __slots__ = ("entries", "ids", "size_bytes", "covers_start")
+
+    def __init__(self, covers_start: bool):
+        self.entries = deque()
+        self.ids = deque()
+        self.size_bytes = 0
+        self.covers_start = covers_start
+
+
+class MessageCache:
+    """
+    热消息缓存单例
+    每个聊天室保留最近 N 条消息（与 get_chatroom_history 的数据库投影同结构），
+    所有聊天室共享一个内存上限，超出时按 LRU 淘汰整个聊天室的缓冲区
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.max_messages_per_chatroom = settings.MESSAGE_CACHE_PER_CHATROOM
+            cls._instance.max_bytes = settings.MESSAGE_CACHE_MAX_BYTES
+            cls._instance.buffers = OrderedDict()  # {chatroom_id: _ChatroomBuffer}，末尾为最近使用
+            cls._instance.total_bytes = 0
+            cls._instance.hits = 0
+            cls._instance.misses = 0
+            cls._instance.evictions = 0
+            logger.info("MessageCache singleton instance created")
+        return cls._instance
+
+    @staticmethod
+    def entry_from_message(message) -> dict:
+        """
+        把 Message 实例转换为缓存条目
+        时间转换为与 MongoDB 读回一致的形式（naive UTC，毫秒精度），保证缓存命中与未命中输出相同
+        """
+        sent_at = message.message_send_time_in_utc
+        if sent_at.tzinfo is not None:
+            sent_at = sent_at.replace(tzinfo=None)
+        sent_at = sent_at.replace(microsecond=(sent_at.microsecond // 1000) * 1000)
+        return {
+            "_id": message.message_id,
+            "message_content": message.message_content,
+            "message_send_time_in_utc": sent_at,
+            "message_sender_id": message.message_sender_id,
+        }
+
+    @staticmethod
+    def _entry_size(entry: dict) -> int:
+        return _ENTRY_OVERHEAD_BYTES + sys.getsizeof(entry.get("message_content") or "")
+
+    def _touch(self, chatroom_id: int, buffer: _ChatroomBuffer):
+        self.buffers[chatroom_id] = buffer
+        self.buffers.move_to_end(chatroom_id)
+
+    def _trim(self, buffer: _ChatroomBuffer):
+        """单个聊天室超过 N 条时丢弃最旧的消息"""
+        while len(buffer.entries) > self.max_messages_per_chatroom:
+            oldest = buffer.entries.popleft()
+            buffer.ids.popleft()
+            entry_size = self._entry_size(oldest)
+            buffer.size_bytes -= entry_size
+            self.total_bytes -= entry_size
+            buffer.covers_start = False
+
+    def _enforce_memory_cap(self):
+        """全局内存超限时按 LRU 淘汰聊天室缓冲区（保留最近使用的一个）"""
+        while self.total_bytes > self.max_bytes and len(self.buffers) > 1:
+            _, evicted = self.buffers.popitem(last=False)
+            self.total_bytes -= evicted.size_bytes
+            self.evictions += 1
+
+    def append(self, chatroom_id: int, entry: dict, is_first_message: bool = False):
+        """
+        send_message 保存成功后调用，把新消息放入聊天室缓冲区
+        """
+        buffer = self.buffers.get(chatroom_id)
+        if buffer is None:
+            buffer = _ChatroomBuffer(covers_start=is_first_message)
+
+        message_id = entry["_id"]
+        if buffer.ids and message_id <= buffer.ids[-1]:
+            # 并发发送可能乱序完成，按 _id 插入到正确位置
+            position = bisect_left(buffer.ids, message_id)
+            if position < len(buffer.ids) and buffer.ids[position] == message_id:
+                return
+            buffer.ids.insert(position, message_id)
+            buffer.entries.insert(position, entry)
+        else:
+            buffer.ids.append(message_id)
+            buffer.entries.append(entry)
+
+        entry_size = self._entry_size(entry)
+        buffer.size_bytes += entry_size
+        self.total_bytes += entry_size
+        self._trim(buffer)
+        self._touch(chatroom_id, buffer)
+        self._enforce_memory_cap()
+
+    def seed(self, chatroom_id: int, entries: List[dict], covers_start: bool):
+        """
+        用数据库读取的最新一页（或完整记录，按 _id 升序）填充缓冲区
+        读取期间通过 append 进入缓冲区的更新消息会被保留
+        """
+        existing = self.buffers.pop(chatroom_id, None)
+        if existing is not None:
+            self.total_bytes -= existing.size_bytes
+
+        merged = list(entries)
+        if existing is not None:
+            last_id = entries[-1]["_id"] if entries else None
+            merged.extend(entry for entry in existing.entries if last_id is None or entry["_id"] > last_id)
+
+        buffer = _ChatroomBuffer(covers_start=covers_start)
+        for entry in merged:
+            buffer.entries.append(entry)
+            buffer.ids.append(entry["_id"])
+            buffer.size_bytes += self._entry_size(entry)
+        self.total_bytes += buffer.size_bytes
+        self._trim(buffer)
+        self._touch(chatroom_id, buffer)
+        self._enforce_memory_cap()
+
+    def get_all(self, chatroom_id: int) -> Optional[List[dict]]:
+        """
+        获取完整聊天记录，只有缓冲区包含第一条消息时才命中
+        未命中返回 None
+        """
+        buffer = self.buffers.get(chatroom_id)
+        if buffer is None or not buffer.covers_start:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.buffers.move_to_end(chatroom_id)
+        return list(buffer.entries)
+
+    def get_page(self, chatroom_id: int, before_message_id: Optional[int], limit: int) -> Optional[Tuple[List[dict], bool]]:
+        """
+        获取 _id < before_message_id 的最新 limit 条消息
+        命中返回 (按 _id 升序的消息, has_more)，缓冲区无法完整覆盖该页时返回 None
+        """
+        buffer = self.buffers.get(chatroom_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+
+        end = len(buffer.ids) if before_message_id is None else bisect_left(buffer.ids, before_message_id)
+        if end >= limit:
+            start = end - limit
+            has_more = start > 0 or not buffer.covers_start
+        elif buffer.covers_start:
+            start = 0
+            has_more = False
+        else:
+            # 缓冲区里没有足够旧的消息
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.buffers.move_to_end(chatroom_id)
+        return list(islice(buffer.entries, start, end)), has_more
+
+    def invalidate(self, chatroom_id: int):
+        """聊天室被删除或消息被清理时丢弃缓冲区"""
+        buffer = self.buffers.pop(chatroom_id, None)
+        if buffer is not None:
+            self.total_bytes -= buffer.size_bytes
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "chatrooms": len(self.buffers),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -1,6 +1,11 @@
+import asyncio
 import httpx
 import json
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional, Tuple
+from app.config import settings
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.metrics import N8N_REQUEST_DURATION
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger(__name__)
@@ -17,13 +22,74 @@ class N8nWebhookManager:
     
     def __init__(self):
         if not self._initialized:
-            self.base_url = "http://8.216.32.239:5678/webhook/match"
+            self.base_url = settings.N8N_WEBHOOK_URL
+            self.client: Optional[httpx.AsyncClient] = None
+            self.http2 = False
+            # 单飞合并：同一用户、同一数量的并发请求共享一个进行中的上游请求
+            self.in_flight: Dict[Tuple[int, int], asyncio.Task] = {}
+            self.upstream_requests = 0
+            self.coalesced_requests = 0
+            self.breaker = CircuitBreaker(
+                "n8n_webhook",
+                failure_threshold=settings.N8N_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.N8N_BREAKER_RECOVERY_TIMEOUT,
+                half_open_max_calls=settings.N8N_BREAKER_HALF_OPEN_MAX_CALLS,
+            )
             N8nWebhookManager._initialized = True
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _build_client(self) -> httpx.AsyncClient:
+        self.http2 = settings.N8N_HTTP2 and self._http2_available()
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.N8N_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.N8N_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.N8N_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.N8N_READ_TIMEOUT,
+                connect=settings.N8N_CONNECT_TIMEOUT,
+                pool=settings.N8N_POOL_TIMEOUT,
+            ),
+        )
+
+    async def start(self):
+        """
+        创建长连接 AsyncClient，在 lifespan 启动时调用
+        所有请求复用连接池，避免每次匹配请求重新建立 TCP/TLS 连接
+        """
+        if self.client is None or self.client.is_closed:
+            self.client = self._build_client()
+            logger.info(f"N8nWebhookManager HTTP client started (http2={self.http2}, max_connections={settings.N8N_MAX_CONNECTIONS})")
+
+    async def close(self):
+        """关闭连接池，在 lifespan 关闭时调用"""
+        if self.client is not None and not self.client.is_closed:
+            await self.client.aclose()
+            logger.info("N8nWebhookManager HTTP client closed")
+        self.client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # 未经 lifespan 启动（如独立脚本）时按需创建
+        if self.client is None or self.client.is_closed:
+            await self.start()
+        return self.client
         
     async def request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
         """
         Request matches from n8n webhook workflow
         
+        Concurrent calls for the same user_id (and num_of_matches) share one in-flight
+        upstream request. Calls fail fast with CircuitOpenError while the breaker is open.
+        
         Args:
             user_id (int): The user ID to get matches for
             num_of_matches (int): Number of matches to request (default: 1)
@@ -31,6 +97,28 @@ class N8nWebhookManager:
         Returns:
             List[Dict]: List of match dictionaries with match details
         """
+        key = (user_id, num_of_matches)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.breaker.call(self._fetch_matches, user_id, num_of_matches))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._on_request_done(key, done))
+        else:
+            self.coalesced_requests += 1
+        # shield: 某个调用方被取消（如连接断开）不会取消其他调用方共享的请求
+        return list(await asyncio.shield(task))
+
+    def _on_request_done(self, key: Tuple[int, int], task: asyncio.Task):
+        self.in_flight.pop(key, None)
+        # 所有调用方都已取消时也要取走异常，避免 "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_matches(self, user_id: int, num_of_matches: int) -> List[Dict]:
+        """向 n8n 发出一次实际请求"""
+        self.upstream_requests += 1
+        start = time.perf_counter()
+        outcome = "error"
         try:
             params = {
                 "user_id": user_id,
@@ -39,15 +127,16 @@ class N8nWebhookManager:
             
             logger.info(f"Requesting matches for user_id={user_id}, num_of_matches={num_of_matches}")
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(self.base_url, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                matches = data.get("output", [])
-                
-                logger.info(f"Received {len(matches)} matches for user {user_id}")
-                return matches
+            client = await self._get_client()
+            response = await client.get(self.base_url, params=params)
+            response.raise_for_status()
+            
+            data = response.json()
+            matches = data.get("output", [])
+            
+            logger.info(f"Received {len(matches)} matches for user {user_id}")
+            outcome = "success"
+            return matches
                 
         except httpx.HTTPError as e:
             logger.error(f"HTTP error while requesting matches: {e}")
@@ -58,6 +147,16 @@ class N8nWebhookManager:
         except Exception as e:
             logger.error(f"Unexpected error in request_matches: {e}")
             raise
+        finally:
+            N8N_REQUEST_DURATION.labels(outcome).observe(time.perf_counter() - start)
+
+    def get_stats(self) -> dict:
+        return {
+            "upstream_requests": self.upstream_requests,
+            "coalesced_requests": self.coalesced_requests,
+            "in_flight": len(self.in_flight),
+            "circuit_breaker": self.breaker.stats(),
+        }
     
     def sync_request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
         """
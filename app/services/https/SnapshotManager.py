@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import msgpack
+
+from app.config import settings
+from app.core.database import Database
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.MessageCache import MessageCache
+from app.services.https.TombstoneLog import TombstoneLog
+from app.services.matching.UserFeatureStore import UserFeatureStore
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("SnapshotManager")
+
+# 文件格式: MAGIC(6) + 版本号(uint16, big-endian) + payload 的 sha256(32) + msgpack payload
+SNAPSHOT_MAGIC = b"LLSNAP"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct(">6sH32s")
+
+# 高水位线相对快照开始时间的回退量，覆盖各实例之间的时钟误差
+HIGH_WATER_MARK_SKEW_SECONDS = 60
+
+
+class SnapshotError(Exception):
+    """快照文件缺失、损坏或版本不兼容"""
+
+
+def encode_snapshot(payload: dict) -> bytes:
+    body = msgpack.packb(payload, use_bin_type=True)
+    return _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, hashlib.sha256(body).digest()) + body
+
+
+def decode_snapshot(data: bytes) -> dict:
+    if len(data) < _HEADER.size:
+        raise SnapshotError("snapshot file is truncated")
+    magic, version, checksum = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("not a snapshot file")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"unsupported snapshot version {version}")
+    body = data[_HEADER.size:]
+    if hashlib.sha256(body).digest() != checksum:
+        raise SnapshotError("snapshot checksum mismatch")
+    # mutual_game_scores 等字段的 key 不一定是字符串
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+class SnapshotManager:
+    """
+    管理器快照单例
+    定期把 UserManagement / MatchManager / ChatroomManager 的状态序列化到本地文件；
+    启动时加载快照，再从数据库回放 updated_at 晚于高水位线的文档和删除墓碑，代价与快照之后的变更量成正比；
+    按 _id 的全量对账只作为兜底，在启动完成后由后台任务执行
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.path = Path(settings.SNAPSHOT_PATH)
+            cls._instance.max_age = settings.SNAPSHOT_MAX_AGE
+            cls._instance.last_written_at = None  # 上次写入快照的时间（epoch 秒）
+            cls._instance.restored_ids = {}  # 最近一次恢复后内存中的对象ID {collection: set}，供后台对账使用
+            logger.info("SnapshotManager singleton instance created")
+        return cls._instance
+
+    def is_due(self) -> bool:
+        """距离上次写入是否已超过 SNAPSHOT_INTERVAL"""
+        if self.last_written_at is None:
+            return True
+        return time.time() - self.last_written_at >= settings.SNAPSHOT_INTERVAL
+
+    @staticmethod
+    async def _collect_documents(objects: list) -> list:
+        """把内存对象转换为文档，定期让出事件循环；保存期间的并发修改由回放覆盖"""
+        documents = []
+        for index, obj in enumerate(objects, 1):
+            document = obj.to_document()
+            document.pop("updated_at", None)
+            documents.append(document)
+            if index % 10000 == 0:
+                await asyncio.sleep(0)
+        return documents
+
+    async def write_snapshot(self) -> bool:
+        """
+        序列化当前内存状态并原子替换快照文件
+        应在 write-behind 落库之后调用，使快照与数据库尽量一致
+        """
+        try:
+            started_at = time.time()
+            user_manager = UserManagement()
+            match_manager = MatchManager()
+            chatroom_manager = ChatroomManager()
+
+            payload = {
+                "created_at": started_at,
+                "high_water_mark": started_at - HIGH_WATER_MARK_SKEW_SECONDS,
+                "users": await self._collect_documents(list(user_manager.user_list.values())),
+                "matches": await self._collect_documents(list(match_manager.match_list.values())),
+                "chatrooms": await self._collect_documents(list(chatroom_manager.chatrooms.values())),
+            }
+            size = await asyncio.to_thread(self._write_file, payload)
+            self.last_written_at = started_at
+            logger.info(
+                f"Snapshot written to {self.path}: {len(payload['users'])} users, "
+                f"{len(payload['matches'])} matches, {len(payload['chatrooms'])} chatrooms, "
+                f"{size} bytes in {time.time() - started_at:.3f}s"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error writing snapshot: {e}")
+            return False
+
+    def _write_file(self, payload: dict) -> int:
+        data = encode_snapshot(payload)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(data)
+
+    def read_snapshot(self) -> dict:
+        """读取并校验快照，缺失、损坏或过期时抛出 SnapshotError"""
+        if not self.path.exists():
+            raise SnapshotError(f"snapshot {self.path} does not exist")
+        payload = decode_snapshot(self.path.read_bytes())
+        age = time.time() - payload["created_at"]
+        if age > self.max_age:
+            raise SnapshotError(f"snapshot is stale ({age:.0f}s old, max {self.max_age}s)")
+        return payload
+
+    async def restore(self) -> bool:
+        """
+        从快照恢复三个管理器，返回 False 时调用方应回退到全量数据库加载
+        """
+        try:
+            payload = await asyncio.to_thread(self.read_snapshot)
+        except Exception as e:
+            logger.warning(f"Snapshot not used, falling back to full database load: {e}")
+            return False
+
+        try:
+            high_water_mark = datetime.fromtimestamp(payload["high_water_mark"], tz=timezone.utc)
+            user_manager = UserManagement()
+            match_manager = MatchManager()
+            chatroom_manager = ChatroomManager()
+
+            # 计数器仍从数据库初始化，避免快照之后新建的对象ID冲突
+            from app.objects.Match import Match
+            from app.objects.Chatroom import Chatroom
+            from app.objects.Message import Message
+            await asyncio.gather(Match.initialize_counter(), Chatroom.initialize_counter(), Message.initialize_counter())
+
+            # 用户必须先于匹配和聊天室恢复，后两者在加载时解析用户实例
+            users = await self._restore_collection(
+                "users", payload["users"], high_water_mark, UserManagement.LOAD_PROJECTION,
+                user_manager.load_user_document, self._remove_user,
+            )
+            user_manager.user_counter = len(user_manager.user_list)
+            UserManagement._initialized = True
+
+            matches, chatrooms = await asyncio.gather(
+                self._restore_collection(
+                    "matches", payload["matches"], high_water_mark, MatchManager.LOAD_PROJECTION,
+                    match_manager.load_match_document, match_manager.remove_match,
+                ),
+                self._restore_collection(
+                    "chatrooms", payload["chatrooms"], high_water_mark, ChatroomManager.LOAD_PROJECTION,
+                    chatroom_manager.load_chatroom_document, self._remove_chatroom,
+                ),
+            )
+            self.restored_ids = {
+                "users": set(user_manager.user_list),
+                "matches": set(match_manager.match_list),
+                "chatrooms": set(chatroom_manager.chatrooms),
+            }
+            logger.info(f"Restored from snapshot {self.path} (high water mark {high_water_mark.isoformat()}): users {users}, matches {matches}, chatrooms {chatrooms}")
+            return True
+        except Exception as e:
+            # 已加载的对象可以被全量加载覆盖（加载器按 _id 替换）
+            logger.error(f"Error restoring from snapshot, falling back to full database load: {e}")
+            return False
+
+    async def _restore_collection(
+        self,
+        collection_name: str,
+        snapshot_documents: list,
+        high_water_mark: datetime,
+        projection: dict,
+        loader: Callable[[dict], object],
+        remover: Callable[[int], object],
+    ) -> dict:
+        """
+        加载快照文档 -> 回放高水位线之后变更的文档 -> 回放高水位线之后的删除墓碑
+        两个查询都走索引（updated_at_1 / collection_1_deleted_at_1），不读取整个集合
+        """
+        for document in snapshot_documents:
+            loader(document)
+
+        # updated_at 为 null 的查询同样走 updated_at 索引，用于补齐旧版本写入的、没有 updated_at 的文档
+        replayed = 0
+        replay_query = {"$or": [{"updated_at": {"$gte": high_water_mark}}, {"updated_at": None}]}
+        async for batch in Database.iterate(collection_name, replay_query, projection):
+            for document in batch:
+                loader(document)
+                replayed += 1
+
+        deleted = 0
+        async for object_ids in TombstoneLog.iterate_deleted_since(collection_name, high_water_mark):
+            for object_id in object_ids:
+                if remover(object_id) is not None:
+                    deleted += 1
+
+        return {
+            "snapshot": len(snapshot_documents),
+            "replayed": replayed,
+            "deleted": deleted,
+        }
+
+    async def reconcile(self) -> dict:
+        """
+        兜底对账：恢复后仍在内存、但数据库中已不存在的对象（如删除后墓碑写入前进程崩溃）从内存移除
+        需要读取各集合的全部 _id，只在启动完成后由后台任务执行（SNAPSHOT_RECONCILE_IN_BACKGROUND）
+        只检查恢复时加载的对象：之后新建的对象可能还没有落库（write-behind），不能据此删除
+        """
+        removers = {
+            "users": self._remove_user,
+            "matches": MatchManager().remove_match,
+            "chatrooms": self._remove_chatroom,
+        }
+        result = {}
+        restored_ids, self.restored_ids = self.restored_ids, {}
+        try:
+            for collection_name, remover in removers.items():
+                candidates = restored_ids.get(collection_name)
+                if not candidates:
+                    continue
+                database_ids = set()
+                async for batch in Database.iterate(collection_name, projection={"_id": 1}):
+                    database_ids.update(document["_id"] for document in batch)
+                removed = 0
+                for object_id in candidates - database_ids:
+                    if remover(object_id) is not None:
+                        removed += 1
+                result[collection_name] = removed
+        except Exception as e:
+            logger.error(f"Snapshot reconcile failed: {e}")
+            return result
+        if any(result.values()):
+            logger.warning(f"Snapshot reconcile removed objects missing from the database: {result}")
+        else:
+            logger.info(f"Snapshot reconcile found no differences: {result}")
+        return result
+
+    @staticmethod
+    def _remove_user(user_id: int):
+        # 索引和特征表在恢复过程中尚未构建时移除是空操作；后台对账时需要同步移除
+        user_manager = UserManagement()
+        user_manager._unindex_user(user_id)
+        UserFeatureStore().remove_user(user_id)
+        user_manager.male_user_list.pop(user_id, None)
+        user_manager.female_user_list.pop(user_id, None)
+        return user_manager.user_list.pop(user_id, None)
+
+    @staticmethod
+    def _remove_chatroom(chatroom_id: int):
+        MessageCache().invalidate(chatroom_id)
+        return ChatroomManager().chatrooms.pop(chatroom_id, None)
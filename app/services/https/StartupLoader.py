@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from app.config import settings
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.SnapshotManager import SnapshotManager
+from app.services.matching.UserFeatureStore import UserFeatureStore
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("StartupLoader")
+
+
+class StartupLoader:
+    """
+    启动预热：优先从本地快照恢复（只回放增量），快照缺失或过期时从数据库流式加载各管理器的缓存
+    Match 和 Chatroom 都依赖已加载的用户实例，所以先加载用户，再并发加载匹配和聊天室
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, use_snapshot: Optional[bool] = None):
+        self.batch_size = batch_size
+        self.use_snapshot = settings.SNAPSHOT_ENABLED if use_snapshot is None else use_snapshot
+        self.timings: Dict[str, float] = {}
+        self.source = None  # "snapshot" 或 "database"
+
+    async def _timed(self, phase: str, coroutine):
+        start = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            self.timings[phase] = round(time.perf_counter() - start, 3)
+
+    def _build_user_indexes(self, user_manager: UserManagement):
+        """用户加载完成后全量构建二级索引和匹配特征库，之后由 UserManagement 增量维护"""
+        start = time.perf_counter()
+        user_manager.rebuild_indexes()
+        UserFeatureStore().rebuild(user_manager.user_list.values())
+        self.timings["indexes"] = round(time.perf_counter() - start, 3)
+
+    async def run(self) -> bool:
+        """
+        执行预热，返回 Match 和 Chatroom 是否都加载成功
+        用户加载失败时直接抛出异常（服务无法在没有用户缓存的情况下运行）
+        """
+        total_start = time.perf_counter()
+        user_manager = UserManagement()
+        match_manager = MatchManager()
+        chatroom_manager = ChatroomManager()
+
+        if self.use_snapshot:
+            restored = await self._timed("snapshot", SnapshotManager().restore())
+            if restored:
+                self.source = "snapshot"
+                self._build_user_indexes(user_manager)
+                self.timings["total"] = round(time.perf_counter() - total_start, 3)
+                logger.info(
+                    f"StartupLoader: restored from snapshot in {self.timings['total']}s - "
+                    f"users={len(user_manager.user_list)}, matches={len(match_manager.match_list)}, "
+                    f"chatrooms={len(chatroom_manager.chatrooms)}"
+                )
+                return True
+        self.source = "database"
+
+        # Phase 1: users
+        await self._timed("users", user_manager.initialize_from_database(batch_size=self.batch_size))
+        logger.info(f"StartupLoader: users loaded ({len(user_manager.user_list)}) in {self.timings['users']}s")
+        self._build_user_indexes(user_manager)
+
+        # Phase 2: matches and chatrooms concurrently
+        match_success, chatroom_success = await asyncio.gather(
+            self._timed("matches", match_manager.construct(batch_size=self.batch_size)),
+            self._timed("chatrooms", chatroom_manager.construct(batch_size=self.batch_size)),
+        )
+        self.timings["total"] = round(time.perf_counter() - total_start, 3)
+
+        logger.info(
+            f"StartupLoader: warm-up finished in {self.timings['total']}s - "
+            f"users={len(user_manager.user_list)} ({self.timings['users']}s), "
+            f"matches={len(match_manager.match_list)} ({self.timings['matches']}s, success={match_success}), "
+            f"chatrooms={len(chatroom_manager.chatrooms)} ({self.timings['chatrooms']}s, success={chatroom_success})"
+        )
+        return match_success and chatroom_success
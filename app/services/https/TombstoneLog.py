@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, List
+from pymongo import UpdateOne
+from app.core.database import Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("TombstoneLog")
+
+
+class TombstoneLog:
+    """
+    删除墓碑单例
+    用户/匹配/聊天室从内存删除时记录 (集合, _id, 删除时间)，由自动保存任务批量写入 tombstones 集合；
+    快照恢复时只回放 deleted_at 晚于高水位线的墓碑，不需要读取各集合的全部 _id 来发现删除
+    墓碑只在快照有效期内有用，tombstones 集合上的 TTL 索引负责清理
+    """
+    _instance = None
+    COLLECTION = "tombstones"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.pending = {}  # {(collection, object_id): deleted_at}
+        return cls._instance
+
+    def record(self, collection_name: str, object_id: int):
+        self.pending[(collection_name, object_id)] = datetime.now(timezone.utc)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    async def flush(self) -> int:
+        """
+        把待写入的墓碑批量 upsert 到数据库（_id 由集合和对象ID组成，重复写入是幂等的）
+        写入失败时放回，等待下一轮；返回写入的数量
+        """
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        operations = [
+            UpdateOne(
+                {"_id": f"{collection_name}:{object_id}"},
+                {"$set": {"collection": collection_name, "object_id": object_id, "deleted_at": deleted_at}},
+                upsert=True,
+            )
+            for (collection_name, object_id), deleted_at in pending.items()
+        ]
+        try:
+            totals = await Database.bulk_write(self.COLLECTION, operations)
+            if not totals["errors"]:
+                return len(pending)
+            logger.error(f"写入删除墓碑部分失败: {totals['errors']} 条，等待下一轮重试")
+        except Exception as e:
+            logger.error(f"写入删除墓碑失败，等待下一轮重试: {e}")
+        # 放回时不覆盖期间新记录的删除时间
+        for key, deleted_at in pending.items():
+            self.pending.setdefault(key, deleted_at)
+        return 0
+
+    @classmethod
+    async def iterate_deleted_since(cls, collection_name: str, since: datetime) -> AsyncIterator[List[int]]:
+        """按批返回指定集合中 deleted_at >= since 的对象ID"""
+        async for batch in Database.iterate(
+            cls.COLLECTION,
+            {"deleted_at": {"$gte": since}, "collection": collection_name},
+            {"object_id": 1},
+        ):
+            yield [document["object_id"] for document in batch]
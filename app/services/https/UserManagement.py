@@ -1,8 +1,16 @@
+import asyncio
+import time
 from fastapi import HTTPException, status
+from pymongo import UpdateOne
 from app.config import settings
 from app.core.database import Database
 from app.objects.User import User
+from app.services.matching.UserFeatureStore import UserFeatureStore
+from app.services.https.IntegrityChangeLog import IntegrityChangeLog
 from app.utils.my_logger import MyLogger
+from app.utils.dirty_tracker import DirtyTracker
+from app.utils.indexes import HashIndex, SortedIndex
+from datetime import datetime, timezone
 
 logger = MyLogger("UserManagement")
 
@@ -13,6 +21,8 @@ class UserManagement:
         user_list: dict{user_id, User}  # 所有用户
         male_user_list: dict{user_id, User}
         female_user_list: dict{user_id, User}
+        gender_index / target_gender_index: HashIndex  # 字段值 -> set(user_id)
+        age_index: SortedIndex  # 按年龄排序，支持范围查询
         database_address: str
     """
     _instance = None
@@ -26,49 +36,150 @@ class UserManagement:
             cls._instance.male_user_list = {}
             cls._instance.female_user_list = {}
             cls._instance.user_counter = 0  # 用户计数器
+            cls._instance.dirty_tracker = DirtyTracker("users")  # 待保存的用户ID
+            cls._instance.gender_index = HashIndex("gender")
+            cls._instance.target_gender_index = HashIndex("target_gender")
+            cls._instance.age_index = SortedIndex("age")
+            cls._instance.indexes_built = False  # 启动加载完成后由 rebuild_indexes 一次性构建
         return cls._instance
 
-    async def initialize_from_database(self):
+    # 启动加载只读取 User 需要的字段
+    LOAD_PROJECTION = {
+        "telegram_user_name": 1,
+        "gender": 1,
+        "age": 1,
+        "target_gender": 1,
+        "user_personality_summary": 1,
+        "match_ids": 1,
+        "blocked_user_ids": 1,
+    }
+
+    async def initialize_from_database(self, batch_size: int = None):
         """从数据库初始化用户缓存 [内部方法，非API调用]"""
         if UserManagement._initialized:
             return
         
-        # 从数据库获取所有用户
-        users_from_db = await Database.find("users", {})
+        # 按批流式读取用户，不一次性物化整个集合
         loaded_count = 0
+        async for batch in Database.iterate("users", projection=self.LOAD_PROJECTION, batch_size=batch_size):
+            for user_data in batch:
+                self.load_user_document(user_data)
+                loaded_count += 1
+        
+        # 更新用户计数器
+        self.user_counter = len(self.user_list)
+        UserManagement._initialized = True
         
-        for user_data in users_from_db:
+        # 打印加载统计信息
+        print(f"UserManagement: 成功从数据库加载 {loaded_count} 个用户到内存")
+        print(f"UserManagement: 男性用户: {len(self.male_user_list)}, 女性用户: {len(self.female_user_list)}")
+
+    def load_user_document(self, user_data: dict) -> User:
+        """
+        把一个数据库用户文档加载到缓存 [内部方法，非API调用]
+        用户已在缓存中时原地更新（快照回放），保留Match/Chatroom持有的实例引用
+        """
+        user = self.user_list.get(user_data.get("_id"))
+        if user is not None:
+            self.male_user_list.pop(user.user_id, None)
+            self.female_user_list.pop(user.user_id, None)
+            user.telegram_user_name = user_data.get("telegram_user_name")
+            user.gender = user_data.get("gender")
+        else:
             # 创建User对象
             user = User(
                 telegram_user_name=user_data.get("telegram_user_name"),
                 gender=user_data.get("gender"),
                 user_id=user_data.get("_id")
             )
-            user.age = user_data.get("age")
-            user.target_gender = user_data.get("target_gender")
-            user.user_personality_summary = user_data.get("user_personality_summary")
-            user.match_ids = user_data.get("match_ids", [])
-            user.blocked_user_ids = user_data.get("blocked_user_ids", [])
-            
-            # 添加到缓存列表
-            user_id = user.user_id
-            self.user_list[user_id] = user
-            
-            # 根据性别分类
-            if user.gender == 1:
-                self.male_user_list[user_id] = user
-            elif user.gender == 2:
-                self.female_user_list[user_id] = user
-            
-            loaded_count += 1
+        user.age = user_data.get("age")
+        user.target_gender = user_data.get("target_gender")
+        user.user_personality_summary = user_data.get("user_personality_summary")
+        user.match_ids = user_data.get("match_ids", [])
+        user.blocked_user_ids = user_data.get("blocked_user_ids", [])
         
-        # 更新用户计数器
-        self.user_counter = len(self.user_list)
-        UserManagement._initialized = True
+        # 添加到缓存列表
+        user_id = user.user_id
+        self.user_list[user_id] = user
         
-        # 打印加载统计信息
-        print(f"UserManagement: 成功从数据库加载 {loaded_count} 个用户到内存")
-        print(f"UserManagement: 男性用户: {len(self.male_user_list)}, 女性用户: {len(self.female_user_list)}")
+        # 根据性别分类
+        if user.gender == 1:
+            self.male_user_list[user_id] = user
+        elif user.gender == 2:
+            self.female_user_list[user_id] = user
+        if self.indexes_built:
+            self._index_user(user)
+        return user
+
+    # 二级索引 [内部方法，非API调用]
+    def _index_user(self, user):
+        self.gender_index.add(user.user_id, user.gender)
+        self.target_gender_index.add(user.user_id, user.target_gender)
+        self.age_index.add(user.user_id, user.age)
+
+    def _unindex_user(self, user_id):
+        self.gender_index.remove(user_id)
+        self.target_gender_index.remove(user_id)
+        self.age_index.remove(user_id)
+
+    def rebuild_indexes(self):
+        """
+        全量构建二级索引，启动加载（数据库或快照）完成后调用一次
+        之后由 create_new_user / edit_* / deactivate_user 增量维护
+        """
+        self.gender_index.clear()
+        self.target_gender_index.clear()
+        for user_id, user in self.user_list.items():
+            self.gender_index.add(user_id, user.gender)
+            self.target_gender_index.add(user_id, user.target_gender)
+        self.age_index.bulk_load((user_id, user.age) for user_id, user in self.user_list.items())
+        self.indexes_built = True
+
+    @staticmethod
+    def _as_values(value):
+        return value if isinstance(value, (list, tuple, set, frozenset)) else (value,)
+
+    def _query_sets(self, gender, target_gender, age_min, age_max, include_unknown_age) -> list:
+        """按条件返回 [(估计数量, 取结果的函数)]，便于先取最小的集合"""
+        parts = []
+        for index, value in ((self.gender_index, gender), (self.target_gender_index, target_gender)):
+            if value is None:
+                continue
+            values = self._as_values(value)
+            count = sum(index.count(v) for v in values)
+            parts.append((count, lambda index=index, values=values: set().union(*(index.get(v) for v in values))))
+        if age_min is not None or age_max is not None:
+            count = self.age_index.count_range(age_min, age_max, include_unknown_age)
+            parts.append((count, lambda: self.age_index.range(age_min, age_max, include_unknown_age)))
+        parts.sort(key=lambda part: part[0])
+        return parts
+
+    def query_users(self, gender=None, target_gender=None, age_min=None, age_max=None, include_unknown_age=False) -> set:
+        """
+        按性别、目标性别和年龄范围查询用户ID [内部方法，非API调用]
+        gender / target_gender 可以是单个值或多个值（如 (1, None) 表示目标性别为1或未设置），None 表示不限
+        age_min / age_max 为闭区间，未填写年龄的用户只在 include_unknown_age=True 时出现在年龄范围查询结果中
+        从最小的索引结果开始求交集，代价取决于结果规模而不是用户总数
+        """
+        if not self.indexes_built:
+            self.rebuild_indexes()
+        parts = self._query_sets(gender, target_gender, age_min, age_max, include_unknown_age)
+        if not parts:
+            return set(self.user_list)
+        _, fetch = parts[0]
+        result = set(fetch())
+        for _, fetch in parts[1:]:
+            if not result:
+                break
+            result.intersection_update(fetch())
+        return result
+
+    def estimate_query_size(self, gender=None, target_gender=None, age_min=None, age_max=None, include_unknown_age=False) -> int:
+        """query_users 结果数量的上界（各条件中最小的数量），O(log n)"""
+        if not self.indexes_built:
+            self.rebuild_indexes()
+        parts = self._query_sets(gender, target_gender, age_min, age_max, include_unknown_age)
+        return parts[0][0] if parts else len(self.user_list)
 
     # 创建新用户 [API调用]
     def create_new_user(self, telegram_user_name, telegram_user_id, gender):
@@ -82,6 +193,9 @@ class UserManagement:
         
         # 更新用户计数器
         self.user_counter = len(self.user_list)
+        self.dirty_tracker.mark(user_id)
+        self._index_user(user)
+        UserFeatureStore().upsert_user(user)
         return user_id
 
     # 编辑用户年龄 [API调用]
@@ -90,6 +204,8 @@ class UserManagement:
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(age=age)
+        self.age_index.add(user_id, user.age)
+        UserFeatureStore().upsert_user(user)
         return True
 
     # 编辑用户目标性别 [API调用]
@@ -98,6 +214,8 @@ class UserManagement:
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(target_gender=target_gender)
+        self.target_gender_index.add(user_id, user.target_gender)
+        UserFeatureStore().upsert_user(user)
         return True
 
     # 编辑用户总结 [API调用]
@@ -106,95 +224,94 @@ class UserManagement:
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(user_personality_summary=summary)
+        UserFeatureStore().upsert_user(user)
         return True
 
+    # 标记用户为待保存 [内部方法，非API调用]
+    def mark_user_dirty(self, user_id):
+        """用户数据发生修改时调用，由后台自动保存任务写回数据库"""
+        if user_id in self.user_list:
+            self.dirty_tracker.mark(user_id)
+
+    # 批量保存用户 [内部方法，非API调用]
+    async def _bulk_save_users(self, users):
+        """
+        通过 Database.bulk_upsert 批量保存用户，每批一次数据库往返
+        返回保存失败的 user_id 列表
+        """
+        batch_stats = await Database.bulk_upsert("users", [user.to_document() for user in users])
+        failed_ids = []
+        for stats in batch_stats:
+            failed_ids.extend(stats["failed_keys"])
+        return failed_ids
+
     # 保存用户信息到数据库 [API调用]
     async def save_to_database(self, user_id=None):
         """
         保存用户到MongoDB，并使用user_id作为文档的_id。
         如果指定了user_id，则保存该用户；如果没有指定，则保存所有内存中的用户。
-        如果用户在数据库中已存在，则更新；否则，创建新记录。
+        如果用户在数据库中已存在，则更新；否则，创建新记录（upsert）。
         [API调用]
         """
         if user_id is None:
             # 保存所有内存中的用户
-            success_count = 0
-            total_users = len(self.user_list)
+            users = list(self.user_list.values())
+            for user in users:
+                self.dirty_tracker.discard(user.user_id)
             
-            for user in self.user_list.values():
-                try:
-                    # 使用 user_id 作为 MongoDB 的 _id
-                    user_dict = {
-                        "_id": user.user_id,
-                        "telegram_user_name": user.telegram_user_name,
-                        "gender": user.gender,
-                        "age": user.age,
-                        "target_gender": user.target_gender,
-                        "user_personality_summary": user.user_personality_summary,
-                        "match_ids": user.match_ids,
-                        "blocked_user_ids": user.blocked_user_ids,
-                    }
-
-                    # 检查用户是否已在数据库中
-                    existing_user_in_db = await Database.find_one("users", {"_id": user.user_id})
-
-                    if existing_user_in_db:
-                        # 如果存在，则更新。$set 的内容不能包含 _id
-                        update_payload = user_dict.copy()
-                        del update_payload["_id"]
-                        await Database.update_one(
-                            "users",
-                            {"_id": user.user_id},
-                            {"$set": update_payload}
-                        )
-                    else:
-                        # 如果不存在，则插入 (包含 _id)
-                        await Database.insert_one("users", user_dict)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    # 记录单个用户保存失败，但继续保存其他用户
-                    print(f"保存用户 {user.user_id} 失败: {e}")
-                    continue
+            try:
+                failed_ids = await self._bulk_save_users(users)
+            except Exception as e:
+                logger.error(f"批量保存用户失败: {e}")
+                failed_ids = [user.user_id for user in users]
             
-            return success_count == total_users
+            if failed_ids:
+                # 记录保存失败的用户，等待下一轮保存
+                self.dirty_tracker.restore(failed_ids)
+                logger.error(f"保存用户失败: {failed_ids}")
+            return not failed_ids
         else:
             # 保存指定的用户
             user = self.user_list.get(user_id)
             if not user:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="要保存的用户在内存中不存在")
 
-            # 使用 user_id 作为 MongoDB 的 _id
-            user_dict = {
-                "_id": user.user_id,
-                "telegram_user_name": user.telegram_user_name,
-                "gender": user.gender,
-                "age": user.age,
-                "target_gender": user.target_gender,
-                "user_personality_summary": user.user_personality_summary,
-                "match_ids": user.match_ids,
-                "blocked_user_ids": user.blocked_user_ids,
-            }
-
-            # 检查用户是否已在数据库中
-            existing_user_in_db = await Database.find_one("users", {"_id": user.user_id})
-
-            if existing_user_in_db:
-                # 如果存在，则更新。$set 的内容不能包含 _id
-                update_payload = user_dict.copy()
-                del update_payload["_id"]
-                await Database.update_one(
-                    "users",
-                    {"_id": user.user_id},
-                    {"$set": update_payload}
-                )
-            else:
-                # 如果不存在，则插入 (包含 _id)
-                await Database.insert_one("users", user_dict)
+            # 先清除脏标记，保存期间发生的新修改会重新标记
+            self.dirty_tracker.discard(user_id)
+            try:
+                failed_ids = await self._bulk_save_users([user])
+            except Exception:
+                self.dirty_tracker.mark(user_id)
+                raise
 
+            if failed_ids:
+                self.dirty_tracker.mark(user_id)
+                return False
             return True
 
+    # 仅保存被修改过的用户 [内部方法，非API调用]
+    async def save_dirty_to_database(self):
+        """
+        write-behind 落库：只保存自上次保存以来被标记为脏的用户
+        保存失败的用户会重新标记，等待下一轮
+        返回 (成功数量, 脏用户数量)
+        """
+        dirty_user_ids = self.dirty_tracker.drain()
+        # 已被注销的用户无需保存
+        users = [self.user_list[user_id] for user_id in dirty_user_ids if user_id in self.user_list]
+        if not users:
+            return 0, 0
+
+        try:
+            failed_ids = await self._bulk_save_users(users)
+        except Exception as e:
+            logger.error(f"批量保存脏用户失败: {e}")
+            failed_ids = [user.user_id for user in users]
+
+        if failed_ids:
+            self.dirty_tracker.restore(failed_ids)
+        return len(users) - len(failed_ids), len(users)
+
     # 根据id获取用户信息 [API调用]
     def get_user_info_with_user_id(self, user_id):
         # Check if input is string and all numbers, convert to int if so
@@ -245,121 +362,149 @@ class UserManagement:
     async def deactivate_user(self, user_id):
         """
         用户注销功能，删除用户及其相关的匹配数据、聊天室和消息
+        级联删除由 deactivate_users 批量完成，这里只是单个用户的入口
+        [API调用]
+        """
+        # Convert string to int if needed
+        if isinstance(user_id, str) and user_id.isdigit():
+            user_id = int(user_id)
+
+        if user_id not in self.user_list:
+            logger.info("用户不存在")
+            return False
+
+        result = await self.deactivate_users([user_id])
+        return result["success"] and user_id in result["deactivated"]
+
+    async def deactivate_users(self, user_ids) -> dict:
+        """
+        批量注销用户，一次完成所有级联删除
         数据流程：
-        1. 检查用户是否存在
-        2. 获取用户的所有match_ids
-        3. 从MatchManager获取相关Match实例
-        4. 获取Match中涉及的其他用户
-        5. 收集需要删除的Chatroom和Message数据
-        6. 删除用户（内存+数据库）
-        7. 从其他用户的match_ids中移除相关match_id
-        8. 删除相关Match实例（内存+数据库）
-        9. 删除相关Chatroom实例（内存+数据库）
-        10. 删除相关Message实例（数据库）
+        1. 过滤不存在的用户
+        2. 合并所有用户的match_ids和MatchManager用户索引，收集相关Match
+        3. 收集Match涉及的其他用户（本批次内被注销的用户除外）和相关Chatroom
+        4. 从内存删除用户、Match、Chatroom，并从其他用户的match_ids中移除
+        5. 数据库按集合分组批量写入，互不依赖的写操作并发执行：
+           users delete_many / 其他用户 $pull bulk_write / matches delete_many /
+           chatrooms delete_many / messages 按 chatroom_id delete_many
+        返回结果汇总（各项数量和耗时）
         [API调用]
         """
+        start = time.perf_counter()
+        result = {
+            "success": True,
+            "deactivated": [],
+            "not_found": [],
+            "deleted_matches": 0,
+            "deleted_chatrooms": 0,
+            "deleted_messages": 0,
+            "updated_users": 0,
+            "elapsed_ms": 0.0,
+            "error": None,
+        }
         try:
-            # Convert string to int if needed
-            if isinstance(user_id, str) and user_id.isdigit():
-                user_id = int(user_id)
-            
-            # Step 1: 检查用户是否存在
-            target_user = self.user_list.get(user_id)
-            if not target_user:
-                logger.info("用户不存在")
-                return False
-            
-            # Step 2: 获取用户的所有match_ids
-            user_match_ids = target_user.match_ids.copy()  # 创建副本，避免修改时的问题
-            
-            # Step 3: 从MatchManager获取相关Match实例
             from app.services.https.MatchManager import MatchManager
+            from app.services.https.ChatroomManager import ChatroomManager
+            from app.services.https.MessageCache import MessageCache
             match_manager = MatchManager()
-            
-            matches_to_delete = []
-            other_users_to_update = set()  # 使用set避免重复
-            chatrooms_to_delete = []  # 需要删除的聊天室
-            messages_to_delete = []   # 需要删除的消息
-            
-            for match_id in user_match_ids:
-                match_instance = match_manager.get_match(match_id)
-                if match_instance:
-                    matches_to_delete.append(match_instance)
-                    
-                    # Step 4: 获取Match中涉及的其他用户
-                    other_user_id = match_instance.get_target_user_id(user_id)
-                    if other_user_id:
-                        other_user = self.get_user_instance(other_user_id)
-                        if other_user:
-                            other_users_to_update.add((other_user, match_id))
-                    
-                    # Step 5: 收集需要删除的Chatroom和Message数据
+            chatroom_manager = ChatroomManager()
+
+            # Step 1: 过滤不存在的用户（兼容字符串ID，保持输入顺序去重）
+            targets = {}
+            for user_id in user_ids:
+                if isinstance(user_id, str) and user_id.isdigit():
+                    user_id = int(user_id)
+                user = self.user_list.get(user_id)
+                if user:
+                    targets[user_id] = user
+                else:
+                    result["not_found"].append(user_id)
+            if not targets:
+                return result
+
+            # Step 2-3: 收集相关Match、其他用户需要移除的match_id、相关Chatroom
+            # 合并用户索引，避免用户match_ids缺失时留下孤立的Match
+            matches_to_delete = {}
+            pulls_by_user = {}  # {other_user_id: [match_id]}
+            chatrooms_to_delete = {}
+            for user_id, user in targets.items():
+                for match_id in dict.fromkeys(list(user.match_ids) + sorted(match_manager.user_match_index.get(user_id, ()))):
+                    match_instance = match_manager.get_match(match_id)
+                    if not match_instance or match_id in matches_to_delete:
+                        continue
+                    matches_to_delete[match_id] = match_instance
+                    for other_user_id in (match_instance.user_id_1, match_instance.user_id_2):
+                        if other_user_id not in targets and other_user_id in self.user_list:
+                            pulls_by_user.setdefault(other_user_id, []).append(match_id)
                     if match_instance.chatroom_id:
-                        from app.services.https.ChatroomManager import ChatroomManager
-                        chatroom_manager = ChatroomManager()
-                        
                         chatroom = chatroom_manager.chatrooms.get(match_instance.chatroom_id)
                         if chatroom:
-                            chatrooms_to_delete.append(chatroom)
-                            # 收集该聊天室中的所有消息ID
-                            messages_to_delete.extend(chatroom.message_ids)
-            
-            # Step 6: 删除本人用户实例（内存+数据库）
-            # 从内存中删除
-            del self.user_list[user_id]
-            
-            # 从性别分类列表中删除
-            if target_user.gender == 1:
-                self.male_user_list.pop(user_id, None)
-            elif target_user.gender == 2:
-                self.female_user_list.pop(user_id, None)
-                
-            # 从数据库中删除
-            await Database.delete_one("users", {"_id": user_id})
-            
-            # Step 7: 从其他用户的match_ids中移除相关match_id
-            for other_user, match_id in other_users_to_update:
-                if match_id in other_user.match_ids:
-                    other_user.match_ids.remove(match_id)
-                    # 更新数据库中的用户数据
-                    await Database.update_one(
-                        "users",
-                        {"_id": other_user.user_id},
-                        {"$pull": {"match_ids": match_id}}
-                    )
-            
-            # Step 8: 删除相关Match实例（内存+数据库）
-            for match_instance in matches_to_delete:
-                # 从MatchManager内存中删除
-                match_manager.match_list.pop(match_instance.match_id, None)
-                
-                # 从数据库中删除
-                await Database.delete_one("matches", {"_id": match_instance.match_id})
-            
-            # Step 9: 删除相关Chatroom实例（内存+数据库）
-            from app.services.https.ChatroomManager import ChatroomManager
-            chatroom_manager = ChatroomManager()
-            
-            for chatroom in chatrooms_to_delete:
-                # 从ChatroomManager内存中删除
-                chatroom_manager.chatrooms.pop(chatroom.chatroom_id, None)
-                
-                # 从数据库中删除
-                await Database.delete_one("chatrooms", {"_id": chatroom.chatroom_id})
-            
-            # Step 10: 删除相关Message实例（数据库）
-            # 使用批量删除操作提高效率
-            if messages_to_delete:
-                await Database.delete_many("messages", {"_id": {"$in": messages_to_delete}})
-            
-            # 更新用户计数器
+                            chatrooms_to_delete[chatroom.chatroom_id] = chatroom
+
+            # Step 4: 内存删除
+            change_log = IntegrityChangeLog()
+            feature_store = UserFeatureStore()
+            for user_id, user in targets.items():
+                del self.user_list[user_id]
+                # 从性别分类列表中删除
+                if user.gender == 1:
+                    self.male_user_list.pop(user_id, None)
+                elif user.gender == 2:
+                    self.female_user_list.pop(user_id, None)
+                self._unindex_user(user_id)
+                feature_store.remove_user(user_id)
+                change_log.record_user_deleted(user_id)
+                self.dirty_tracker.discard(user_id)
+
+            for other_user_id, match_ids in pulls_by_user.items():
+                other_user = self.user_list[other_user_id]
+                other_user.match_ids = [match_id for match_id in other_user.match_ids if match_id not in match_ids]
+
+            for match_id in matches_to_delete:
+                match_manager.remove_match(match_id)
+
+            message_cache = MessageCache()
+            for chatroom_id in chatrooms_to_delete:
+                chatroom_manager.chatrooms.pop(chatroom_id, None)
+                chatroom_manager.dirty_tracker.discard(chatroom_id)
+                change_log.record_chatroom_deleted(chatroom_id)
+                message_cache.invalidate(chatroom_id)
+
             self.user_counter = len(self.user_list)
-            
-            print(f"用户注销成功: 删除用户 {user_id}，清理了 {len(matches_to_delete)} 个匹配，"
-                  f"{len(chatrooms_to_delete)} 个聊天室，{len(messages_to_delete)} 条消息，"
-                  f"更新了 {len(other_users_to_update)} 个其他用户")
-            return True
-            
+
+            # Step 5: 数据库批量写入
+            now = datetime.now(timezone.utc)
+            pull_operations = [
+                UpdateOne({"_id": other_user_id}, {"$pull": {"match_ids": {"$in": match_ids}}, "$set": {"updated_at": now}})
+                for other_user_id, match_ids in pulls_by_user.items()
+            ]
+            writes = [Database.delete_many("users", {"_id": {"$in": list(targets)}})]
+            if pull_operations:
+                writes.append(Database.bulk_write("users", pull_operations))
+            if matches_to_delete:
+                writes.append(Database.delete_many("matches", {"_id": {"$in": list(matches_to_delete)}}))
+            if chatrooms_to_delete:
+                chatroom_ids = list(chatrooms_to_delete)
+                writes.append(Database.delete_many("chatrooms", {"_id": {"$in": chatroom_ids}}))
+                # 按 chatroom_id 删除走 messages 索引，也能删掉未记录在 message_ids 中的消息
+                writes.append(Database.delete_many("messages", {"chatroom_id": {"$in": chatroom_ids}}))
+            write_results = await asyncio.gather(*writes)
+            if chatrooms_to_delete:
+                result["deleted_messages"] = write_results[-1]
+
+            result["deactivated"] = list(targets)
+            result["deleted_matches"] = len(matches_to_delete)
+            result["deleted_chatrooms"] = len(chatrooms_to_delete)
+            result["updated_users"] = len(pulls_by_user)
+
         except Exception as e:
-            print(f"用户注销失败: {e}")
-            return False
\ No newline at end of file
+            result["success"] = False
+            result["error"] = str(e)
+            logger.error(f"用户注销失败: {e}")
+
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        if result["deactivated"]:
+            logger.info(f"用户注销成功: 删除用户 {result['deactivated']}，清理了 {result['deleted_matches']} 个匹配，"
+                        f"{result['deleted_chatrooms']} 个聊天室，{result['deleted_messages']} 条消息，"
+                        f"更新了 {result['updated_users']} 个其他用户，耗时 {result['elapsed_ms']}ms")
+        return result
@@ -0,0 +1,162 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from app.config import settings
+from app.services.matching.UserFeatureStore import UserFeatureStore, tokenize_summary
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("MatchEngine")
+
+ENGINE_N8N = "n8n"
+ENGINE_LOCAL = "local"
+ENGINE_FALLBACK = "fallback"
+ENGINES = (ENGINE_N8N, ENGINE_LOCAL, ENGINE_FALLBACK)
+
+
+def build_match_dict(user, candidate, score: int) -> Dict:
+    """生成与 n8n 工作流相同结构的匹配结果"""
+    shared = sorted(set(tokenize_summary(user.user_personality_summary)) & set(tokenize_summary(candidate.user_personality_summary)))[:3]
+    if shared:
+        common = f"You both mention {', '.join(shared)}."
+    else:
+        common = "Your profiles complement each other."
+    return {
+        "self_user_id": user.user_id,
+        "matched_user_id": candidate.user_id,
+        "match_score": score,
+        "reason_of_match_given_to_self_user": f"{candidate.telegram_user_name} could be a good match for you. {common}",
+        "reason_of_match_given_to_matched_user": f"{user.telegram_user_name} could be a good match for you. {common}",
+    }
+
+
+class MatchEngine(ABC):
+    """
+    匹配引擎接口，request_matches 返回的列表元素结构与 n8n 工作流的输出一致:
+    self_user_id, matched_user_id, match_score,
+    reason_of_match_given_to_self_user, reason_of_match_given_to_matched_user
+    """
+    name = "base"
+
+    @abstractmethod
+    async def request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
+        ...
+
+
+class N8nMatchEngine(MatchEngine):
+    """通过 n8n webhook 工作流匹配"""
+    name = ENGINE_N8N
+
+    async def request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
+        from app.services.https.N8nWebhookManager import N8nWebhookManager
+        return await N8nWebhookManager().request_matches(user_id, num_of_matches=num_of_matches)
+
+
+class LocalMatchEngine(MatchEngine):
+    """
+    进程内匹配引擎，不需要网络请求
+    候选来自 UserFeatureStore 的一次向量化过滤 + 打分（性别/目标性别/年龄范围、拉黑关系和已有匹配的排除位图，
+    简介哈希向量余弦相似度 + 年龄接近程度）
+    条件足够有选择性时（UserManagement 二级索引估计的候选数不超过总数的 MATCH_ENGINE_INDEX_SELECTIVITY），
+    先用索引取出候选，只对这些行打分，不再扫描全部用户
+    """
+    name = ENGINE_LOCAL
+
+    def __init__(self, age_range: Optional[int] = None, index_selectivity: Optional[float] = None):
+        self.age_range = age_range or settings.MATCH_ENGINE_AGE_RANGE
+        self.index_selectivity = settings.MATCH_ENGINE_INDEX_SELECTIVITY if index_selectivity is None else index_selectivity
+        self.index_queries = 0
+        self.scan_queries = 0
+
+    def _candidate_user_ids(self, user_manager, user, store_size: int):
+        """条件有选择性时返回索引查询出的候选ID，否则返回 None（全量向量化扫描）"""
+        query = {
+            "gender": user.target_gender or None,
+            "target_gender": (user.gender, None),
+            "include_unknown_age": True,
+        }
+        if user.age is not None:
+            query["age_min"] = user.age - self.age_range
+            query["age_max"] = user.age + self.age_range
+        if user_manager.estimate_query_size(**query) > store_size * self.index_selectivity:
+            self.scan_queries += 1
+            return None
+        self.index_queries += 1
+        return user_manager.query_users(**query)
+
+    async def request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
+        from app.services.https.UserManagement import UserManagement
+        from app.services.https.MatchManager import MatchManager
+        user_manager = UserManagement()
+        user = user_manager.get_user_instance(user_id)
+        if user is None:
+            return []
+
+        store = UserFeatureStore()
+        if not store.built:
+            # 未经 StartupLoader 预热（如独立脚本）时按需全量构建
+            store.rebuild(user_manager.user_list.values())
+
+        matched_user_ids = set()
+        for match in MatchManager().get_user_matches(user_id):
+            matched_user_ids.add(match.user_id_1)
+            matched_user_ids.add(match.user_id_2)
+
+        # 多取一些，拉黑关系在特征库之外被修改的候选会在下面被跳过
+        user_ids, scores = store.top_k(
+            user,
+            num_of_matches * 2 + 5,
+            matched_user_ids,
+            self.age_range,
+            candidate_user_ids=self._candidate_user_ids(user_manager, user, len(store)),
+        )
+
+        matches = []
+        for candidate_id, score in zip(user_ids.tolist(), scores.tolist()):
+            candidate = user_manager.get_user_instance(candidate_id)
+            if candidate is None or user_id in candidate.blocked_user_ids:
+                continue
+            matches.append(build_match_dict(user, candidate, int(round(score))))
+            if len(matches) >= num_of_matches:
+                break
+        return matches
+
+
+class FallbackMatchEngine(MatchEngine):
+    """
+    先使用主引擎（n8n），失败（包括熔断器打开）时改用备用引擎（本地）
+    """
+    name = ENGINE_FALLBACK
+
+    def __init__(self, primary: MatchEngine, fallback: MatchEngine):
+        self.primary = primary
+        self.fallback = fallback
+        self.fallback_count = 0
+
+    async def request_matches(self, user_id: int, num_of_matches: int = 1) -> List[Dict]:
+        try:
+            return await self.primary.request_matches(user_id, num_of_matches=num_of_matches)
+        except Exception as e:
+            self.fallback_count += 1
+            logger.warning(f"{self.primary.name} match engine failed for user {user_id}, using {self.fallback.name}: {e}")
+            return await self.fallback.request_matches(user_id, num_of_matches=num_of_matches)
+
+
+_engine: Optional[MatchEngine] = None
+
+
+def get_match_engine() -> MatchEngine:
+    """
+    按 settings.MATCH_ENGINE 创建并缓存匹配引擎: n8n / local / fallback
+    """
+    global _engine
+    if _engine is None:
+        engine_name = settings.MATCH_ENGINE
+        if engine_name == ENGINE_N8N:
+            _engine = N8nMatchEngine()
+        elif engine_name == ENGINE_LOCAL:
+            _engine = LocalMatchEngine()
+        elif engine_name == ENGINE_FALLBACK:
+            _engine = FallbackMatchEngine(N8nMatchEngine(), LocalMatchEngine())
+        else:
+            raise ValueError(f"Unknown match engine: {engine_name}, expected one of {ENGINES}")
+        logger.info(f"Match engine: {_engine.name}")
+    return _engine
@@ -0,0 +1,220 @@
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("UserFeatureStore")
+
+# 用户简介哈希向量的维度（1M 用户约占 256MB）
+SUMMARY_VECTOR_DIM = 64
+# 打分权重：简介相似度与年龄接近程度
+SUMMARY_WEIGHT = 0.7
+AGE_WEIGHT = 0.3
+# 初始行数，不够时按倍数扩容
+INITIAL_CAPACITY = 1024
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize_summary(summary: Optional[str]) -> List[str]:
+    """英文按单词切分，中文按相邻两字切分"""
+    if not summary:
+        return []
+    tokens = []
+    for word in _WORD_PATTERN.findall(summary.lower()):
+        if "一" <= word[0] <= "鿿" and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def summary_vector(summary: Optional[str]) -> np.ndarray:
+    """把用户简介哈希成定长的归一化向量，点积即余弦相似度"""
+    vector = np.zeros(SUMMARY_VECTOR_DIM, dtype=np.float32)
+    for token in tokenize_summary(summary):
+        vector[zlib.crc32(token.encode()) % SUMMARY_VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class UserFeatureStore:
+    """
+    用户特征列存单例，与 UserManagement 并列维护，供本地匹配做向量化打分
+    每个用户占一行: gender / target_gender / age / 简介哈希向量 / active
+    UserManagement 在创建、编辑、注销用户时增量更新对应行；启动预热完成后全量 rebuild 一次
+    注销用户的行标记为 inactive 并在之后复用
+    blocked_by 是反向拉黑索引 {user_id: 拉黑了该用户的用户ID}，查询时与正向拉黑、已有匹配一起
+    组成排除位图
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._allocate(INITIAL_CAPACITY)
+            cls._instance.built = False
+        return cls._instance
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0  # 已使用的最大行号 + 1
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.genders = np.zeros(capacity, dtype=np.int8)
+        self.target_genders = np.zeros(capacity, dtype=np.int8)  # 0 表示未设置（不限）
+        self.ages = np.full(capacity, np.nan, dtype=np.float32)  # NaN 表示未填写
+        self.vectors = np.zeros((capacity, SUMMARY_VECTOR_DIM), dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.row_of: Dict[int, int] = {}
+        self.free_rows: List[int] = []
+        self.blocked_by: Dict[int, Set[int]] = {}
+
+    def _grow(self, min_capacity: int):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        extra = capacity - self.capacity
+        self.user_ids = np.concatenate([self.user_ids, np.zeros(extra, dtype=np.int64)])
+        self.genders = np.concatenate([self.genders, np.zeros(extra, dtype=np.int8)])
+        self.target_genders = np.concatenate([self.target_genders, np.zeros(extra, dtype=np.int8)])
+        self.ages = np.concatenate([self.ages, np.full(extra, np.nan, dtype=np.float32)])
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, SUMMARY_VECTOR_DIM), dtype=np.float32)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def rebuild(self, users: Iterable):
+        """从用户实例全量构建（启动预热完成后调用）"""
+        users = list(users)
+        self._allocate(max(INITIAL_CAPACITY, len(users)))
+        count = len(users)
+        self.size = count
+        self.user_ids[:count] = np.fromiter((user.user_id for user in users), dtype=np.int64, count=count)
+        self.genders[:count] = np.fromiter((user.gender or 0 for user in users), dtype=np.int8, count=count)
+        self.target_genders[:count] = np.fromiter((user.target_gender or 0 for user in users), dtype=np.int8, count=count)
+        self.ages[:count] = np.fromiter((np.nan if user.age is None else user.age for user in users), dtype=np.float32, count=count)
+        for row, user in enumerate(users):
+            self.vectors[row] = summary_vector(user.user_personality_summary)
+            self.row_of[user.user_id] = row
+            for blocked_id in user.blocked_user_ids:
+                self.blocked_by.setdefault(blocked_id, set()).add(user.user_id)
+        self.active[:count] = True
+        self.built = True
+        logger.info(f"UserFeatureStore built: {count} users")
+
+    def upsert_user(self, user):
+        """新建或更新一个用户的特征行"""
+        row = self.row_of.get(user.user_id)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                if self.size >= self.capacity:
+                    self._grow(self.size + 1)
+                row = self.size
+                self.size += 1
+            self.row_of[user.user_id] = row
+        self.user_ids[row] = user.user_id
+        self.genders[row] = user.gender or 0
+        self.target_genders[row] = user.target_gender or 0
+        self.ages[row] = np.nan if user.age is None else user.age
+        self.vectors[row] = summary_vector(user.user_personality_summary)
+        self.active[row] = True
+
+    def remove_user(self, user_id: int):
+        row = self.row_of.pop(user_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.free_rows.append(row)
+        self.blocked_by.pop(user_id, None)
+
+    def record_block(self, user_id: int, blocked_user_id: int):
+        self.blocked_by.setdefault(blocked_user_id, set()).add(user_id)
+
+    def top_k(
+        self,
+        user,
+        k: int,
+        excluded_ids: Iterable[int] = (),
+        age_range: Optional[float] = None,
+        candidate_user_ids: Optional[Iterable[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次向量化的过滤 + 打分，返回分数最高的 k 个候选 (user_ids, scores)，按分数降序，分数范围 0-100
+        过滤条件: 候选性别等于 user.target_gender（未设置则不限），候选的 target_gender 包含 user.gender，
+        年龄差不超过 age_range（未填写年龄的用户不受限制），不在排除位图中
+        传入 candidate_user_ids（如二级索引的查询结果）时只在这些行上过滤和打分，否则扫描全部行
+        """
+        n = self.size
+        if candidate_user_ids is None:
+            rows = slice(0, n)
+        else:
+            row_of = self.row_of
+            rows = np.fromiter((row_of[user_id] for user_id in candidate_user_ids if user_id in row_of), dtype=np.int64)
+
+        mask = self.active[rows].copy()
+        if user.target_gender:
+            mask &= self.genders[rows] == user.target_gender
+        target_genders = self.target_genders[rows]
+        mask &= (target_genders == 0) | (target_genders == (user.gender or 0))
+
+        ages = self.ages[rows]
+        if user.age is not None and age_range is not None:
+            mask &= np.isnan(ages) | (np.abs(ages - user.age) <= age_range)
+
+        # 排除位图：本人、正向拉黑、反向拉黑、调用方传入的ID（如已有匹配）
+        excluded = set(excluded_ids)
+        excluded.add(user.user_id)
+        excluded.update(user.blocked_user_ids)
+        excluded.update(self.blocked_by.get(user.user_id, ()))
+        excluded_rows = [self.row_of[user_id] for user_id in excluded if user_id in self.row_of]
+        if excluded_rows:
+            if candidate_user_ids is None:
+                mask[excluded_rows] = False
+            else:
+                mask &= ~np.isin(rows, excluded_rows)
+
+        if candidate_user_ids is None:
+            candidate_rows = np.flatnonzero(mask)
+        else:
+            candidate_rows = rows[mask]
+        if len(candidate_rows) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        query_vector = summary_vector(user.user_personality_summary)
+        if candidate_user_ids is None:
+            # 对全部行做一次矩阵向量乘，比先按候选行拷贝向量再计算占用的内存少
+            similarity = (self.vectors[:n] @ query_vector)[candidate_rows]
+        else:
+            similarity = self.vectors[candidate_rows] @ query_vector
+        candidate_ages = self.ages[candidate_rows]
+        if user.age is None:
+            age_score = np.full(len(candidate_rows), 0.5, dtype=np.float32)
+        else:
+            span = age_range or 10
+            age_score = np.clip(1.0 - np.abs(candidate_ages - user.age) / span, 0.0, 1.0)
+            age_score = np.where(np.isnan(candidate_ages), 0.5, age_score)
+        scores = 100.0 * (SUMMARY_WEIGHT * similarity + AGE_WEIGHT * age_score)
+
+        k = min(k, len(candidate_rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.user_ids[candidate_rows[top]], scores[top]
+
+    def get_stats(self) -> dict:
+        return {
+            "users": len(self.row_of),
+            "rows": self.size,
+            "capacity": self.capacity,
+            "free_rows": len(self.free_rows),
+            "memory_bytes": int(
+                self.user_ids.nbytes + self.genders.nbytes + self.target_genders.nbytes
+                + self.ages.nbytes + self.vectors.nbytes + self.active.nbytes
+            ),
+        }
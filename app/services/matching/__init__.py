@@ -0,0 +1 @@
+# Match engines: n8n webhook, local in-process matching and fallback
@@ -0,0 +1,115 @@
+"""
+Circuit Breaker
+上游服务（如 n8n webhook）不健康时快速失败，而不是让每个请求都等到超时
+"""
+import time
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发往上游"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    熔断器，状态流转:
+      - closed: 正常放行，连续失败达到 failure_threshold 次后打开
+      - open: 直接抛出 CircuitOpenError，经过 recovery_timeout 秒后进入半开
+      - half_open: 最多放行 half_open_max_calls 个探测请求，成功则关闭，失败则重新打开
+    只在单个事件循环内使用，不需要加锁
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+
+        # 计数器
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = 0
+        return self._state
+
+    def before_call(self):
+        """请求前调用，不允许放行时抛出 CircuitOpenError"""
+        state = self.state
+        if state == STATE_OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        if state == STATE_HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._half_open_in_flight += 1
+        self.calls += 1
+
+    def record_success(self):
+        self.successes += 1
+        self._consecutive_failures = 0
+        if self._state == STATE_HALF_OPEN:
+            self._state = STATE_CLOSED
+            self._half_open_in_flight = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self._consecutive_failures += 1
+        if self._state == STATE_HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+        self.times_opened += 1
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """通过熔断器执行一个协程函数"""
+        self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # 被取消的请求不计入成败，但要释放半开状态的探测名额
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
@@ -0,0 +1,44 @@
+"""
+Dirty Tracker
+用于记录内存中被修改过、尚未写回数据库的对象ID（write-behind）
+"""
+from typing import Hashable, Iterable, Set
+
+
+class DirtyTracker:
+    """
+    脏对象追踪器，每个管理器单例持有一个
+    对象发生修改时调用 mark()，后台保存任务通过 drain() 取出待保存的ID
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._dirty_ids: Set[Hashable] = set()
+
+    def mark(self, object_id: Hashable):
+        """标记对象为脏"""
+        if object_id is not None:
+            self._dirty_ids.add(object_id)
+
+    def discard(self, object_id: Hashable):
+        """移除对象的脏标记（对象已保存或已删除）"""
+        self._dirty_ids.discard(object_id)
+
+    def restore(self, object_ids: Iterable[Hashable]):
+        """保存失败时重新标记，等待下一轮保存"""
+        self._dirty_ids.update(object_ids)
+
+    def drain(self) -> Set[Hashable]:
+        """
+        取出当前所有脏对象ID并清空
+        在保存过程中发生的新修改会进入新的集合，不会丢失
+        """
+        dirty_ids = self._dirty_ids
+        self._dirty_ids = set()
+        return dirty_ids
+
+    def is_dirty(self, object_id: Hashable) -> bool:
+        return object_id in self._dirty_ids
+
+    def __len__(self) -> int:
+        return len(self._dirty_ids)
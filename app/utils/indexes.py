@@ -0,0 +1,123 @@
+"""
+In-memory secondary indexes
+为内存中的对象维护按字段的二级索引，避免按条件查询时全量扫描
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+_MISSING = object()
+
+
+class HashIndex:
+    """
+    等值索引: {字段值: set(对象ID)}，字段值可以是 None
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._ids_by_value: Dict[Any, Set[Hashable]] = {}
+        self._value_of: Dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._value_of)
+
+    def add(self, object_id: Hashable, value: Any):
+        """添加或更新一个对象的字段值"""
+        old = self._value_of.get(object_id, _MISSING)
+        if old is not _MISSING:
+            if old == value:
+                return
+            self._discard(object_id, old)
+        self._value_of[object_id] = value
+        self._ids_by_value.setdefault(value, set()).add(object_id)
+
+    def remove(self, object_id: Hashable):
+        old = self._value_of.pop(object_id, _MISSING)
+        if old is not _MISSING:
+            self._discard(object_id, old)
+
+    def _discard(self, object_id: Hashable, value: Any):
+        ids = self._ids_by_value.get(value)
+        if ids is not None:
+            ids.discard(object_id)
+            if not ids:
+                del self._ids_by_value[value]
+
+    def get(self, value: Any) -> Set[Hashable]:
+        """返回字段值等于 value 的对象ID（只读视图，调用方不要修改）"""
+        return self._ids_by_value.get(value, set())
+
+    def count(self, value: Any) -> int:
+        return len(self._ids_by_value.get(value, ()))
+
+    def clear(self):
+        self._ids_by_value.clear()
+        self._value_of.clear()
+
+
+class SortedIndex:
+    """
+    范围索引: 按 (字段值, 对象ID) 排序的列表，范围查询 O(log n + k)
+    字段值为 None 的对象不参与排序，单独记录在 missing 集合中
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._entries: List[Tuple[Any, Hashable]] = []
+        self._value_of: Dict[Hashable, Any] = {}
+        self.missing: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self.missing)
+
+    def add(self, object_id: Hashable, value: Any):
+        """添加或更新一个对象的字段值"""
+        old = self._value_of.get(object_id, _MISSING)
+        if old is not _MISSING:
+            if old == value:
+                return
+            self.remove(object_id)
+        self._value_of[object_id] = value
+        if value is None:
+            self.missing.add(object_id)
+            return
+        insort(self._entries, (value, object_id))
+
+    def remove(self, object_id: Hashable):
+        old = self._value_of.pop(object_id, _MISSING)
+        if old is _MISSING:
+            return
+        if old is None:
+            self.missing.discard(object_id)
+            return
+        position = bisect_left(self._entries, (old, object_id))
+        if position < len(self._entries) and self._entries[position] == (old, object_id):
+            del self._entries[position]
+
+    def bulk_load(self, items: Iterable[Tuple[Hashable, Any]]):
+        """一次性构建（启动时使用），比逐个 insort 快得多"""
+        self._value_of = dict(items)
+        self.missing = {object_id for object_id, value in self._value_of.items() if value is None}
+        self._entries = sorted((value, object_id) for object_id, value in self._value_of.items() if value is not None)
+
+    def _bounds(self, low: Optional[Any], high: Optional[Any]) -> Tuple[int, int]:
+        start = 0 if low is None else bisect_left(self._entries, (low, float("-inf")))
+        end = len(self._entries) if high is None else bisect_right(self._entries, (high, float("inf")))
+        return start, max(start, end)
+
+    def range(self, low: Optional[Any] = None, high: Optional[Any] = None, include_missing: bool = False) -> List[Hashable]:
+        """返回 low <= 字段值 <= high 的对象ID（边界为 None 表示不限），include_missing 时附带字段值为 None 的对象"""
+        start, end = self._bounds(low, high)
+        object_ids = [object_id for _, object_id in self._entries[start:end]]
+        if include_missing:
+            object_ids.extend(self.missing)
+        return object_ids
+
+    def count_range(self, low: Optional[Any] = None, high: Optional[Any] = None, include_missing: bool = False) -> int:
+        start, end = self._bounds(low, high)
+        return end - start + (len(self.missing) if include_missing else 0)
+
+    def clear(self):
+        self._entries = []
+        self._value_of = {}
+        self.missing = set()
@@ -0,0 +1,227 @@
+"""
+In-process metrics registry
+进程内的 Counter / Gauge / Histogram，按 Prometheus 文本格式（0.0.4）输出，不依赖外部服务或第三方库
+所有更新都发生在事件循环线程内，因此不加锁
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """按标签值分组的指标；labels(*values) 返回对应子项（首次访问时创建）"""
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _unlabeled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self._children[()]
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """
+        function 返回 {标签值元组: 数值}（无标签时键为 ()），输出前调用并覆盖对应子项
+        用于读取其他组件自己维护的数值（对象数量、累计计数等），热路径上不需要额外更新
+        """
+        self._function = function
+
+    def collect(self) -> List[str]:
+        if self._function is not None:
+            for key, value in self._function().items():
+                self.labels(*key).set(value)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._sample_lines(key, child))
+        return lines
+
+    def _sample_lines(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    """只增不减的计数（如发送的消息总数），速率由 Prometheus rate() 计算"""
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._unlabeled().inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；set_function 的回调在每次输出时读取（用于对象数量等）"""
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._unlabeled().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._unlabeled().dec(amount)
+
+    def set(self, value: float):
+        self._unlabeled().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """延迟分布；每个桶单独计数，输出时累加为 Prometheus 要求的累积桶"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._unlabeled().observe(value)
+
+    def _sample_lines(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.upper_bounds + (float("inf"),), child.bucket_counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(upper_bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """按名称保存所有指标；重复声明同名指标返回已有实例"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as {metric.metric_type}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 服务内各热点路径使用的指标
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency for /api/v1 routes", ("method", "route", "status"))
+WEBSOCKET_CONNECTIONS = REGISTRY.gauge(
+    "websocket_connections", "Open WebSocket connections", ("route",))
+CHAT_MESSAGES_SENT = REGISTRY.counter(
+    "chat_messages_sent_total", "Messages sent through ChatroomManager.send_message", ("result",))
+DB_OPERATION_DURATION = REGISTRY.histogram(
+    "db_operation_duration_seconds", "MongoDB operation latency", ("collection", "operation"))
+N8N_REQUEST_DURATION = REGISTRY.histogram(
+    "n8n_request_duration_seconds", "n8n match webhook latency", ("outcome",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+AUTO_SAVE_DURATION = REGISTRY.histogram(
+    "auto_save_duration_seconds", "Duration of one auto-save cycle (integrity check + dirty flush)")
+MANAGER_OBJECTS = REGISTRY.gauge(
+    "manager_objects", "Objects held in memory by the singleton managers", ("manager",))
+WEBSOCKET_SEND_QUEUE_DEPTH = REGISTRY.gauge(
+    "websocket_send_queue_depth", "Messages waiting in WebSocket send queues", ("handler",))
+WEBSOCKET_SEND_QUEUE_MAX_DEPTH = REGISTRY.gauge(
+    "websocket_send_queue_max_depth", "Deepest WebSocket send queue", ("handler",))
+WEBSOCKET_SEND_DROPPED = REGISTRY.counter(
+    "websocket_send_dropped_total", "Messages dropped from full WebSocket send queues (drop_oldest policy)")
+WEBSOCKET_OVERFLOW_DISCONNECTS = REGISTRY.counter(
+    "websocket_overflow_disconnects_total", "WebSocket connections closed because their send queue was full (disconnect policy)")
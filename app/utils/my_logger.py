@@ -1,38 +1,206 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
+from app.config import settings
+
 # 定义日志文件路径
 LOG_DIR = Path(__file__).resolve().parents[2] / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "app.log"
 
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    队列满时直接丢弃日志并计数，调用方（事件循环）永远不会因为磁盘IO阻塞
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 同进程内的队列不需要像默认实现那样复制记录并预先格式化（那是为跨进程 pickle 准备的），
+        # 格式化留给后台线程，事件循环里只做一次 put
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 logger 对 INFO 及以下级别采样和限速，WARNING 及以上总是保留
+    sample_rate: 保留比例 (0, 1]，按计数确定性采样（每 1/sample_rate 条保留一条），<=0 表示全部丢弃
+    max_per_second: 每秒最多保留的条数，<=0 表示不限
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: int = 0):
+        super().__init__()
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.max_per_second = max_per_second
+        self.seen = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._window = 0
+        self._window_count = 0
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        self.seen += 1
+        if self.sample_every == 0 or (self.seen - 1) % self.sample_every:
+            self.sampled_out += 1
+            return False
+        if self.max_per_second > 0:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._window_count = 0
+            if self._window_count >= self.max_per_second:
+                self.rate_limited += 1
+                return False
+            self._window_count += 1
+        return True
+
+
+def _parse_pairs(text: str, cast) -> dict:
+    """解析 "name=value,name=value" 形式的配置"""
+    pairs = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            pairs[name.strip()] = cast(value.strip())
+    return pairs
+
+
+class _LoggingPipeline:
+    """
+    所有 MyLogger 共享的输出管道：控制台 + RotatingFileHandler 只创建一次
+    异步模式下各 logger 只挂一个 DroppingQueueHandler，由 QueueListener 后台线程写出
+    """
+
+    def __init__(self):
+        self.async_mode = False
+        self.queue_size = 0
+        self.output_handlers = []
+        self.queue_handler = None
+        self.listener = None
+        self.filters = {}  # logger名 -> SamplingFilter
+        self.sample_rates = {}
+        self.rate_limits = {}
+        self.logger_names = set()
+        self.configured = False
+
+    def configure(self, async_mode=None, queue_size=None, sample_rates=None, rate_limits=None):
+        """(重新)构建管道，并重新挂到所有已创建的 MyLogger 上；参数为 None 时使用配置"""
+        self.shutdown()
+        self.async_mode = settings.LOG_ASYNC if async_mode is None else async_mode
+        self.queue_size = settings.LOG_QUEUE_SIZE if queue_size is None else queue_size
+        self.sample_rates = _parse_pairs(settings.LOG_SAMPLE_RATES, float) if sample_rates is None else dict(sample_rates)
+        self.rate_limits = _parse_pairs(settings.LOG_RATE_LIMITS, int) if rate_limits is None else dict(rate_limits)
+
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        # 控制台输出
+        console_handler = logging.StreamHandler(sys.stdout)
+        # 文件输出 (RotatingFileHandler)
+        file_handler = RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=10 * 1024 * 1024,  # 10 MB
+            backupCount=5,  # 保留5个备份文件
+            encoding='utf-8'
+        )
+        self.output_handlers = [console_handler, file_handler]
+        for handler in self.output_handlers:
+            handler.setFormatter(formatter)
+
+        if self.async_mode:
+            self.queue_handler = DroppingQueueHandler(queue.Queue(self.queue_size))
+            self.listener = QueueListener(self.queue_handler.queue, *self.output_handlers, respect_handler_level=True)
+            self.listener.start()
+
+        self.configured = True
+        for name in self.logger_names:
+            self._attach(logging.getLogger(name))
+
+    def register(self, logger: logging.Logger):
+        if not self.configured:
+            self.configure()
+        if logger.name not in self.logger_names:
+            self.logger_names.add(logger.name)
+            self._attach(logger)
+
+    def _attach(self, logger: logging.Logger):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        old_filter = self.filters.pop(logger.name, None)
+        if old_filter is not None:
+            logger.removeFilter(old_filter)
+
+        if self.async_mode:
+            logger.addHandler(self.queue_handler)
+        else:
+            for handler in self.output_handlers:
+                logger.addHandler(handler)
+
+        sample_rate = self.sample_rates.get(logger.name, 1.0)
+        max_per_second = self.rate_limits.get(logger.name, 0)
+        if sample_rate < 1.0 or max_per_second > 0:
+            sampling_filter = SamplingFilter(sample_rate, max_per_second)
+            logger.addFilter(sampling_filter)
+            self.filters[logger.name] = sampling_filter
+
+    def shutdown(self):
+        """停止后台线程并写出队列中剩余的日志"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        for handler in self.output_handlers:
+            handler.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "async": self.async_mode,
+            "queue_size": self.queue_size,
+            "queued": self.queue_handler.queue.qsize() if self.async_mode else 0,
+            "dropped": self.queue_handler.dropped if self.async_mode else 0,
+            "sampled_out": {name: f.sampled_out for name, f in self.filters.items()},
+            "rate_limited": {name: f.rate_limited for name, f in self.filters.items()},
+        }
+
+
+_pipeline = _LoggingPipeline()
+atexit.register(_pipeline.shutdown)
+
+
+def configure_logging(async_mode=None, queue_size=None, sample_rates=None, rate_limits=None):
+    """按参数（或 settings 中的 LOG_* 配置）重建日志管道"""
+    _pipeline.configure(async_mode, queue_size, sample_rates, rate_limits)
+
+
+def shutdown_logging():
+    """服务关闭时调用，确保队列中的日志全部写出"""
+    _pipeline.shutdown()
+
+
+def get_logging_stats() -> dict:
+    return _pipeline.get_stats()
+
+
 class MyLogger:
     def __init__(self, name="my_app", level=logging.INFO):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
 
-        # 避免重复添加handler
-        if not self.logger.handlers:
-            # 控制台输出
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setFormatter(self._get_formatter())
-            self.logger.addHandler(console_handler)
-
-            # 文件输出 (RotatingFileHandler)
-            file_handler = RotatingFileHandler(
-                LOG_FILE,
-                maxBytes=10 * 1024 * 1024,  # 10 MB
-                backupCount=5,  # 保留5个备份文件
-                encoding='utf-8'
-            )
-            file_handler.setFormatter(self._get_formatter())
-            self.logger.addHandler(file_handler)
-
-    def _get_formatter(self):
-        # 统一的日志格式
-        return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        # 同名 logger 只注册一次，避免重复添加handler
+        _pipeline.register(self.logger)
 
     def info(self, message):
         self.logger.info(message)
@@ -64,4 +232,4 @@ if __name__ == "__main__":
 
     # 测试不同的日志器名称
     another_logger = MyLogger("another_module")
-    another_logger.info("这是来自另一个模块的信息") 
\ No newline at end of file
+    another_logger.info("这是来自另一个模块的信息")
@@ -1,74 +1,130 @@
 """
 Singleton Status Reporter
 用于报告所有单例服务中字典和列表的状态
+只读取各容器的大小（len 为 O(1)，由字典在插入/删除时维护）和各服务已有的计数器，不遍历任何键；
+结果缓存为快照，由后台任务按 SINGLETON_STATUS_REFRESH_INTERVAL 定时刷新
 """
-from typing import Dict, Any
 import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
 
 
 class SingletonStatusReporter:
     """
     单例状态报告器，收集所有单例服务的状态信息
+    get_singleton_status 每次重新采集；get_cached_status / get_status_summary 返回缓存的快照
+    未创建的单例不会被创建，只报告 not_initialized
     """
-    
+    _snapshot: Optional[Dict[str, Any]] = None
+    _summary: Optional[str] = None
+    _snapshot_at: float = 0.0  # time.monotonic()
+
+    @staticmethod
+    def _instance_of(cls):
+        return getattr(cls, "_instance", None)
+
     @staticmethod
     def get_singleton_status() -> Dict[str, Any]:
         """
-        获取所有单例服务的状态信息
-        返回包含所有单例字典大小和内容摘要的字典
+        获取所有单例服务的状态信息（只含大小和计数器，耗时与数据量无关）
         """
         status = {}
-        
+
         # UserManagement 状态
         try:
             from app.services.https.UserManagement import UserManagement
-            user_mgmt = UserManagement()
-            status["UserManagement"] = {
-                "user_list": {
-                    "size": len(user_mgmt.user_list),
-                    "keys": list(user_mgmt.user_list.keys()) if len(user_mgmt.user_list) <= 10 else f"Too many keys ({len(user_mgmt.user_list)}), showing first 10: {list(user_mgmt.user_list.keys())[:10]}"
-                },
-                "male_user_list": {
-                    "size": len(user_mgmt.male_user_list),
-                    "keys": list(user_mgmt.male_user_list.keys()) if len(user_mgmt.male_user_list) <= 10 else f"Too many keys ({len(user_mgmt.male_user_list)}), showing first 10: {list(user_mgmt.male_user_list.keys())[:10]}"
-                },
-                "female_user_list": {
-                    "size": len(user_mgmt.female_user_list),
-                    "keys": list(user_mgmt.female_user_list.keys()) if len(user_mgmt.female_user_list) <= 10 else f"Too many keys ({len(user_mgmt.female_user_list)}), showing first 10: {list(user_mgmt.female_user_list.keys())[:10]}"
-                },
-                "_user_id_counter": getattr(user_mgmt, '_user_id_counter', 'Not initialized')
-            }
+            user_mgmt = SingletonStatusReporter._instance_of(UserManagement)
+            if user_mgmt is None:
+                status["UserManagement"] = {"error": "not_initialized"}
+            else:
+                status["UserManagement"] = {
+                    "user_list": {"size": len(user_mgmt.user_list)},
+                    "male_user_list": {"size": len(user_mgmt.male_user_list)},
+                    "female_user_list": {"size": len(user_mgmt.female_user_list)},
+                    "dirty": {"size": len(user_mgmt.dirty_tracker)},
+                    "_user_id_counter": getattr(user_mgmt, '_user_id_counter', 'Not initialized')
+                }
         except Exception as e:
             status["UserManagement"] = {"error": str(e)}
-        
+
         # MatchManager 状态
         try:
             from app.services.https.MatchManager import MatchManager
-            match_mgr = MatchManager()
-            status["MatchManager"] = {
-                "match_list": {
-                    "size": len(match_mgr.match_list),
-                    "items": match_mgr.match_list if len(match_mgr.match_list) <= 5 else f"Too many items ({len(match_mgr.match_list)}), showing first 5: {match_mgr.match_list[:5]}"
+            match_mgr = SingletonStatusReporter._instance_of(MatchManager)
+            if match_mgr is None:
+                status["MatchManager"] = {"error": "not_initialized"}
+            else:
+                status["MatchManager"] = {
+                    "match_list": {"size": len(match_mgr.match_list)},
+                    "dirty": {"size": len(match_mgr.dirty_tracker)},
                 }
-            }
         except Exception as e:
             status["MatchManager"] = {"error": str(e)}
-        
+
         # ChatroomManager 状态
         try:
             from app.services.https.ChatroomManager import ChatroomManager
-            chatroom_mgr = ChatroomManager()
-            status["ChatroomManager"] = {
-                "chatrooms": {
-                    "size": len(chatroom_mgr.chatrooms),
-                    "keys": list(chatroom_mgr.chatrooms.keys()) if len(chatroom_mgr.chatrooms) <= 10 else f"Too many keys ({len(chatroom_mgr.chatrooms)}), showing first 10: {list(chatroom_mgr.chatrooms.keys())[:10]}"
+            chatroom_mgr = SingletonStatusReporter._instance_of(ChatroomManager)
+            if chatroom_mgr is None:
+                status["ChatroomManager"] = {"error": "not_initialized"}
+            else:
+                status["ChatroomManager"] = {
+                    "chatrooms": {"size": len(chatroom_mgr.chatrooms)},
+                    "dirty": {"size": len(chatroom_mgr.dirty_tracker)},
                 }
-            }
         except Exception as e:
             status["ChatroomManager"] = {"error": str(e)}
-        
+
+        # 数据完备性待检查的变更
+        try:
+            from app.services.https.IntegrityChangeLog import IntegrityChangeLog
+            change_log = SingletonStatusReporter._instance_of(IntegrityChangeLog)
+            if change_log is not None:
+                status["IntegrityChangeLog"] = {"pending": {"size": change_log.pending()}}
+        except Exception as e:
+            status["IntegrityChangeLog"] = {"error": str(e)}
+
+        # 其余服务自带的计数器
+        try:
+            from app.services.https.MatchRecommendationCache import MatchRecommendationCache
+            from app.services.https.N8nWebhookManager import N8nWebhookManager
+            for name, cls in (("MatchRecommendationCache", MatchRecommendationCache), ("N8nWebhookManager", N8nWebhookManager)):
+                instance = SingletonStatusReporter._instance_of(cls)
+                if instance is not None:
+                    status[name] = {"stats": instance.get_stats()}
+        except Exception as e:
+            status["services"] = {"error": str(e)}
+
+        try:
+            from app.utils.my_logger import get_logging_stats
+            status["logging"] = {"stats": get_logging_stats()}
+        except Exception as e:
+            status["logging"] = {"error": str(e)}
+
         return status
-    
+
+    @staticmethod
+    def refresh() -> Dict[str, Any]:
+        """重新采集并更新缓存的快照和摘要"""
+        status = SingletonStatusReporter.get_singleton_status()
+        status["generated_at"] = datetime.now(timezone.utc).isoformat()
+        SingletonStatusReporter._snapshot = status
+        SingletonStatusReporter._summary = SingletonStatusReporter._build_summary(status)
+        SingletonStatusReporter._snapshot_at = time.monotonic()
+        return status
+
+    @staticmethod
+    def get_cached_status(max_age: float = None) -> Dict[str, Any]:
+        """
+        返回缓存的快照；尚未生成或超过 max_age 秒时先刷新一次
+        """
+        if SingletonStatusReporter._snapshot is None or (
+            max_age is not None and time.monotonic() - SingletonStatusReporter._snapshot_at > max_age
+        ):
+            return SingletonStatusReporter.refresh()
+        return SingletonStatusReporter._snapshot
+
     @staticmethod
     def format_status_for_logging(status: Dict[str, Any]) -> str:
         """
@@ -78,28 +134,34 @@ class SingletonStatusReporter:
             return json.dumps(status, indent=2, ensure_ascii=False, default=str)
         except Exception as e:
             return f"Error formatting status: {e}\nRaw status: {status}"
-    
+
+    @staticmethod
+    def _build_summary(status: Dict[str, Any]) -> str:
+        summary_parts = []
+        for service_name, service_data in status.items():
+            if not isinstance(service_data, dict):
+                continue
+            if "error" in service_data:
+                summary_parts.append(f"{service_name}: ERROR - {service_data['error']}")
+                continue
+            sizes = []
+            for dict_name, dict_info in service_data.items():
+                if isinstance(dict_info, dict) and "size" in dict_info:
+                    sizes.append(f"{dict_name}({dict_info['size']})")
+                elif dict_name == "_user_id_counter":
+                    sizes.append(f"counter({dict_info})")
+            if sizes:
+                summary_parts.append(f"{service_name}: {', '.join(sizes)}")
+        return " | ".join(summary_parts)
+
     @staticmethod
     def get_status_summary() -> str:
         """
-        获取状态摘要的简短版本
+        获取状态摘要的简短版本（返回缓存的快照，常数时间）
         """
         try:
-            status = SingletonStatusReporter.get_singleton_status()
-            summary_parts = []
-            
-            for service_name, service_data in status.items():
-                if "error" in service_data:
-                    summary_parts.append(f"{service_name}: ERROR - {service_data['error']}")
-                else:
-                    sizes = []
-                    for dict_name, dict_info in service_data.items():
-                        if isinstance(dict_info, dict) and "size" in dict_info:
-                            sizes.append(f"{dict_name}({dict_info['size']})")
-                        elif dict_name == "_user_id_counter":
-                            sizes.append(f"counter({dict_info})")
-                    summary_parts.append(f"{service_name}: {', '.join(sizes)}")
-            
-            return " | ".join(summary_parts)
+            if SingletonStatusReporter._summary is None:
+                SingletonStatusReporter.refresh()
+            return SingletonStatusReporter._summary
         except Exception as e:
-            return f"Error generating summary: {e}"
\ No newline at end of file
+            return f"Error generating summary: {e}"
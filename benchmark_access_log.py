@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+访问日志中间件基准：对比不加中间件、旧的逐行记录请求头/请求体并缓冲重建响应的中间件，
+以及 AccessLogMiddleware 各模式下的请求吞吐量
+请求经 httpx.ASGITransport 直接进入 FastAPI 应用（POST JSON，返回约 2KB JSON）
+日志使用默认的队列模式，写到临时目录
+
+用法:
+    python benchmark_access_log.py              # 每种配置 3000 个请求，并发 50
+    python benchmark_access_log.py 10000 100    # 指定请求数和并发数
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+from app.core.access_log import AccessLogMiddleware
+from app.utils import my_logger
+from app.utils.my_logger import MyLogger, configure_logging, shutdown_logging
+
+PAYLOAD = {"user_id": 123456789, "summary": "hiking jazz coffee " * 10}
+RESPONSE_ITEMS = [{"match_id": i, "score": 80, "reason": "shared interests in hiking and jazz"} for i in range(30)]
+
+
+def legacy_middleware(app: FastAPI):
+    """旧中间件的主要开销：逐行记录请求头、格式化请求体、读空 body_iterator 并重建 Response"""
+    legacy_logger = MyLogger("benchmark_legacy_http")
+
+    @app.middleware("http")
+    async def log_requests_and_responses(request: Request, call_next):
+        request_id = f"req_{int(time.time() * 1000)}"
+        legacy_logger.info(f"🔵 [{request_id}] 方法: {request.method} URL: {request.url}")
+        for header_name, header_value in request.headers.items():
+            legacy_logger.info(f"🔵 [{request_id}] {header_name}: {header_value}")
+        body = await request.body()
+        legacy_logger.info(f"🔵 [{request_id}] JSON数据: {json.dumps(json.loads(body), indent=2, ensure_ascii=False)}")
+        response = await call_next(request)
+        for header_name, header_value in response.headers.items():
+            legacy_logger.info(f"🟢 [{request_id}] {header_name}: {header_value}")
+        response_body = b""
+        async for chunk in response.body_iterator:
+            response_body += chunk
+        legacy_logger.info(f"🟢 [{request_id}] JSON响应: {json.dumps(json.loads(response_body), indent=2, ensure_ascii=False)}")
+        return Response(content=response_body, status_code=response.status_code,
+                        headers=dict(response.headers), media_type=response.media_type)
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/matches")
+    async def matches(request: Request):
+        await request.json()
+        return {"matches": RESPONSE_ITEMS}
+
+    if variant == "legacy":
+        legacy_middleware(app)
+    elif variant != "none":
+        mode, _, rate = variant.partition("@")
+        app.add_middleware(AccessLogMiddleware, mode=mode, debug_sample_rate=float(rate or 0))
+    return app
+
+
+async def drive(app: FastAPI, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            response = await client.post("/matches", json=PAYLOAD)
+            assert response.status_code == 200
+
+        start = time.perf_counter()
+        for offset in range(0, total, concurrency):
+            await asyncio.gather(*(one() for _ in range(min(concurrency, total - offset))))
+        return total / (time.perf_counter() - start)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    variants = [
+        ("no middleware", "none"),
+        ("legacy middleware", "legacy"),
+        ("access log off", "off"),
+        ("access log", "access"),
+        ("access + 1% debug dumps", "access@0.01"),
+        ("full (every request)", "full"),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        my_logger.LOG_FILE = os.path.join(tmp, "app.log")
+        real_stdout = sys.stdout
+        console = open(os.path.join(tmp, "console.log"), "w", encoding="utf-8")
+        print(f"{total} requests, concurrency {concurrency}")
+        print(f"{'middleware':<28}{'req/s':>10}{'vs none':>10}")
+        baseline = None
+        for label, variant in variants:
+            # 控制台 handler 在 configure 时绑定 sys.stdout，这里让它写到临时文件
+            sys.stdout = console
+            try:
+                configure_logging(async_mode=True, queue_size=100000, sample_rates={}, rate_limits={})
+            finally:
+                sys.stdout = real_stdout
+            rps = asyncio.run(drive(build_app(variant), total, concurrency))
+            shutdown_logging()
+            baseline = baseline or rps
+            print(f"{label:<28}{rps:>10.0f}{rps / baseline:>10.2f}")
+        console.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+本地匹配候选打分基准：对比逐个遍历用户的 Python 循环与 UserFeatureStore 的向量化 top_k
+使用随机生成的用户（性别、目标性别、年龄、由词库拼成的简介），不需要数据库
+
+用法:
+    python benchmark_feature_store.py                 # 100k / 1M 用户
+    python benchmark_feature_store.py 10000 50000     # 指定用户数
+"""
+
+import random
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.User import User
+from app.services.matching.UserFeatureStore import UserFeatureStore, summary_vector, SUMMARY_WEIGHT, AGE_WEIGHT
+
+TOP_K = 10
+AGE_RANGE = 10
+VECTORIZED_QUERIES = 200
+LOOP_QUERIES = 5
+
+WORDS = [
+    "hiking", "jazz", "cooking", "reading", "travel", "gaming", "music", "movies", "coffee", "yoga",
+    "running", "photography", "art", "cats", "dogs", "startup", "finance", "anime", "football", "chess",
+]
+
+
+def make_users(count: int) -> list:
+    rng = random.Random(42)
+    users = []
+    for user_id in range(1, count + 1):
+        user = User(f"user_{user_id}", rng.choice((1, 2)), user_id)
+        user.target_gender = 2 if user.gender == 1 else 1
+        user.age = rng.randint(18, 60)
+        user.user_personality_summary = " ".join(rng.sample(WORDS, 5))
+        users.append(user)
+    return users
+
+
+def loop_top_k(me, users: list, vectors: dict) -> list:
+    """旧式逐用户循环：过滤 + 打分 + 排序"""
+    my_vector = summary_vector(me.user_personality_summary)
+    scored = []
+    for user in users:
+        if user.user_id == me.user_id or user.gender != me.target_gender:
+            continue
+        if user.target_gender not in (None, me.gender):
+            continue
+        if abs(user.age - me.age) > AGE_RANGE:
+            continue
+        similarity = float(vectors[user.user_id] @ my_vector)
+        age_score = max(0.0, 1.0 - abs(user.age - me.age) / AGE_RANGE)
+        scored.append((100.0 * (SUMMARY_WEIGHT * similarity + AGE_WEIGHT * age_score), user.user_id))
+    scored.sort(reverse=True)
+    return scored[:TOP_K]
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def run_case(count: int):
+    users = make_users(count)
+    store = UserFeatureStore.__new__(UserFeatureStore)
+    start = time.perf_counter()
+    store.rebuild(users)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(VECTORIZED_QUERIES):
+        me = users[rng.randrange(count)]
+        start = time.perf_counter()
+        store.top_k(me, TOP_K, age_range=AGE_RANGE)
+        latencies.append(time.perf_counter() - start)
+
+    # 循环基准预先算好向量，只计过滤和打分本身
+    vectors = {user.user_id: store.vectors[store.row_of[user.user_id]] for user in users}
+    loop_latencies = []
+    for _ in range(LOOP_QUERIES):
+        me = users[rng.randrange(count)]
+        start = time.perf_counter()
+        loop_top_k(me, users, vectors)
+        loop_latencies.append(time.perf_counter() - start)
+
+    loop_p50 = percentile(loop_latencies, 0.5)
+    vectorized_p50 = percentile(latencies, 0.5)
+    print(
+        f"{count:>10,}{build_seconds:>10.2f}{store.get_stats()['memory_bytes'] / 1024 / 1024:>10.1f}"
+        f"{loop_p50 * 1000:>12.1f}{vectorized_p50 * 1000:>12.2f}{percentile(latencies, 0.99) * 1000:>12.2f}"
+        f"{loop_p50 / vectorized_p50:>9.0f}x"
+    )
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    print(f"top_k={TOP_K}, age_range={AGE_RANGE}, {VECTORIZED_QUERIES} vectorized / {LOOP_QUERIES} loop queries per case")
+    print(f"{'users':>10}{'build s':>10}{'MB':>10}{'loop p50':>12}{'vec p50':>12}{'vec p99':>12}{'speedup':>10}")
+    for count in counts:
+        run_case(count)
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger("UserFeatureStore").setLevel(logging.WARNING)
+    main()
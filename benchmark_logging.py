@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+日志管道基准：在开启日志的情况下测量请求吞吐量
+对比同步写控制台+文件（旧方式）、QueueHandler 后台线程写出、以及对热点 logger 采样后的结果
+请求经 httpx.ASGITransport 直接进入 FastAPI 应用，中间件每个请求写与 server_run 相近数量的 INFO 日志
+日志写到临时目录，不会污染 logs/app.log
+分两组运行：本地磁盘（写入基本落在页缓存）和模拟慢盘（每次写入阻塞 SLOW_WRITE_MS，类似网络盘/磁盘繁忙）
+
+用法:
+    python benchmark_logging.py              # 每种模式 3000 个请求，并发 50
+    python benchmark_logging.py 10000 100    # 指定请求数和并发数
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI, Request
+
+from app.utils import my_logger
+from app.utils.my_logger import MyLogger, configure_logging, get_logging_stats, shutdown_logging
+
+LOG_LINES_PER_REQUEST = 15
+SLOW_WRITE_MS = 0.2
+
+
+class SlowStream:
+    """每次 write 阻塞一段时间，模拟慢盘"""
+
+    def __init__(self, stream, delay_ms: float):
+        self.stream = stream
+        self.delay = delay_ms / 1000
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def __getattr__(self, name):
+        # seek/tell 等其余方法（RotatingFileHandler 判断是否轮转时会用到）直接转发
+        return getattr(self.stream, name)
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    http_logger = MyLogger("benchmark_http")
+    match_logger = MyLogger("benchmark_match")
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        request_id = f"req_{time.time_ns()}"
+        for header_name, header_value in request.headers.items():
+            http_logger.info(f"🔵 [{request_id}] {header_name}: {header_value}")
+        for line in range(LOG_LINES_PER_REQUEST - len(request.headers)):
+            http_logger.info(f"🔵 [{request_id}] {request.method} {request.url.path} line {line}")
+        response = await call_next(request)
+        http_logger.info(f"🟢 [{request_id}] 状态码: {response.status_code}")
+        return response
+
+    @app.get("/match/{match_id}")
+    async def get_match(match_id: int):
+        match_logger.info(f"Retrieved match {match_id}")
+        return {"match_id": match_id}
+
+    return app
+
+
+async def drive(app: FastAPI, total: int, concurrency: int) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            start = time.perf_counter()
+            response = await client.get(f"/match/{i}")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+
+        start = time.perf_counter()
+        for offset in range(0, total, concurrency):
+            await asyncio.gather(*(one(i) for i in range(offset, min(total, offset + concurrency))))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return total / elapsed, latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def run_case(label: str, total: int, concurrency: int):
+    app = build_app()
+    rps, p50, p99 = asyncio.run(drive(app, total, concurrency))
+    stats = get_logging_stats()
+    # 异步模式下关闭时写出剩余队列，单独计时，不计入请求吞吐
+    flush_start = time.perf_counter()
+    shutdown_logging()
+    flush_ms = (time.perf_counter() - flush_start) * 1000
+    sampled = sum(stats["sampled_out"].values()) + sum(stats["rate_limited"].values())
+    print(f"{label:<24}{rps:>10.0f}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}{stats['dropped']:>10}{sampled:>10}{flush_ms:>10.0f}")
+
+
+def logging_output_handlers() -> list:
+    return my_logger._pipeline.output_handlers
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 控制台和文件输出都落到临时目录中的真实文件上
+        my_logger.LOG_FILE = os.path.join(tmp, "app.log")
+        real_stdout = sys.stdout
+        console = open(os.path.join(tmp, "console.log"), "w", encoding="utf-8")
+
+        print(f"{total} requests, concurrency {concurrency}, ~{LOG_LINES_PER_REQUEST + 2} INFO lines per request")
+        print(f"{'mode':<24}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'dropped':>10}{'sampled':>10}{'flush ms':>10}")
+        cases = [
+            ("sync (before)", {"async_mode": False}),
+            ("queue", {"async_mode": True, "queue_size": 100000}),
+            ("queue, small queue", {"async_mode": True, "queue_size": 1000}),
+            ("queue + sampling 0.1", {"async_mode": True, "queue_size": 100000,
+                                      "sample_rates": {"benchmark_http": 0.1, "benchmark_match": 0.1}}),
+        ]
+        for disk_label, delay_ms, count in (("local disk", 0, total), (f"slow disk {SLOW_WRITE_MS}ms/write", SLOW_WRITE_MS, max(concurrency, total // 5))):
+            print(f"-- {disk_label}, {count} requests")
+            for label, options in cases:
+                # 控制台 handler 在 configure 时绑定 sys.stdout，这里让它写到临时文件
+                sys.stdout = console
+                try:
+                    configure_logging(sample_rates=options.get("sample_rates", {}), rate_limits={},
+                                      async_mode=options["async_mode"], queue_size=options.get("queue_size"))
+                finally:
+                    sys.stdout = real_stdout
+                if delay_ms:
+                    for handler in logging_output_handlers():
+                        handler.setStream(SlowStream(handler.stream, delay_ms))
+                run_case(label, count, concurrency)
+        console.close()
+
+
+if __name__ == "__main__":
+    main()
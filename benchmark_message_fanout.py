@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+消息更新事件扇出基准：对比旧的全量广播与定向投递（发送者 + 接收者 + 订阅者）的每秒消息数
+使用假 WebSocket（send_text 为空操作），只测服务端的扇出开销
+
+用法:
+    python benchmark_message_fanout.py                    # 1k / 10k / 50k 连接
+    python benchmark_message_fanout.py 1000 5000          # 指定连接数
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.WebSocketsService.MessageConnectionHandler import MessageConnectionHandler
+from app.WebSocketsService.OutboundQueue import OutboundQueue
+
+# 每轮发送的聊天消息数量，以及显式订阅者数量（模拟管理员/监控连接）
+MESSAGES = 100
+SUBSCRIBERS = 2
+
+
+class NullWebSocket:
+    async def send_text(self, message):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+async def drain(queues):
+    """等待所有发送队列写空"""
+    for queue in queues:
+        while queue.depth:
+            await asyncio.sleep(0)
+
+
+async def run_case(connections: int):
+    MessageConnectionHandler.sessions = {}
+    MessageConnectionHandler.message_update_subscribers = set()
+    queues = []
+    for user_id in range(connections):
+        queue = OutboundQueue(NullWebSocket(), max_size=MESSAGES + 1)
+        MessageConnectionHandler.sessions[str(user_id)] = queue
+        queues.append(queue)
+    for user_id in range(SUBSCRIBERS):
+        MessageConnectionHandler.message_update_subscribers.add(str(user_id))
+    await asyncio.sleep(0)
+
+    payload = '{"type": "user_message_update", "message": "User 2 (2) receives a message from user 1 (1)"}'
+
+    # 旧方式：每条消息广播给所有连接
+    start = time.perf_counter()
+    for index in range(MESSAGES):
+        await MessageConnectionHandler.broadcast(payload, exclude_id=None)
+    await drain(queues)
+    broadcast_rate = MESSAGES / (time.perf_counter() - start)
+
+    # 新方式：每条消息只投递给发送者、接收者和订阅者
+    start = time.perf_counter()
+    for index in range(MESSAGES):
+        sender = index % connections
+        target = (index + 1) % connections
+        await MessageConnectionHandler.publish_message_update(sender, target, payload)
+    await drain(queues)
+    targeted_rate = MESSAGES / (time.perf_counter() - start)
+
+    for queue in queues:
+        await queue.close()
+    MessageConnectionHandler.sessions = {}
+    MessageConnectionHandler.message_update_subscribers = set()
+    return broadcast_rate, targeted_rate
+
+
+async def main():
+    connection_counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    print(f"{MESSAGES} chat messages per case, {SUBSCRIBERS} explicit subscribers")
+    print(f"{'connections':>12}{'broadcast msg/s':>18}{'targeted msg/s':>18}{'speedup':>10}")
+    for connections in connection_counts:
+        broadcast_rate, targeted_rate = await run_case(connections)
+        print(f"{connections:>12,}{broadcast_rate:>18,.1f}{targeted_rate:>18,.1f}{targeted_rate / broadcast_rate:>9.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
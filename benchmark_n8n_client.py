@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+n8n webhook 客户端基准：对比每次请求新建 AsyncClient（旧实现）与 N8nWebhookManager 的长连接池
+使用本地 asyncio 模拟的 webhook 服务器（独立进程，HTTP/1.1 keep-alive，返回固定匹配结果），报告 p50/p99 延迟
+
+用法:
+    python benchmark_n8n_client.py              # 并发 1 / 50 / 500
+    python benchmark_n8n_client.py 1 50         # 指定并发
+"""
+
+import asyncio
+import json
+import multiprocessing
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from app.services.https.N8nWebhookManager import N8nWebhookManager
+
+REQUESTS_PER_LEVEL = 1000
+# 模拟 n8n 工作流的处理时间（秒）
+SERVER_WORK_SECONDS = 0.002
+
+RESPONSE_BODY = json.dumps({"output": [{
+    "self_user_id": 1,
+    "matched_user_id": 2,
+    "match_score": 88,
+    "reason_of_match_given_to_self_user": "r1",
+    "reason_of_match_given_to_matched_user": "r2",
+}]}).encode()
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """最小的 HTTP/1.1 keep-alive 服务器，只处理无 body 的 GET"""
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            await asyncio.sleep(SERVER_WORK_SECONDS)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n"
+                b"Connection: keep-alive\r\n\r\n" + RESPONSE_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(port_queue):
+    """在独立进程中运行模拟服务器，避免与客户端争用同一个事件循环"""
+    async def run():
+        server = await asyncio.start_server(handle_client, "127.0.0.1", 0, backlog=2048)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+
+async def per_call_request(url: str, user_id: int):
+    """旧实现：每次请求新建客户端"""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(url, params={"user_id": user_id, "num_of_matches": 1})
+        response.raise_for_status()
+        return response.json().get("output", [])
+
+
+async def run_level(request_fn, concurrency: int, total: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(user_id: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await request_fn(user_id)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(user_id) for user_id in range(total)))
+    return latencies
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def main():
+    levels = [int(arg) for arg in sys.argv[1:]] or [1, 50, 500]
+    port_queue = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=serve, args=(port_queue,), daemon=True)
+    server_process.start()
+    port = port_queue.get(timeout=10)
+    url = f"http://127.0.0.1:{port}/webhook/match"
+
+    manager = N8nWebhookManager()
+    manager.base_url = url
+    await manager.start()
+
+    print(f"{REQUESTS_PER_LEVEL} requests per level, server work {SERVER_WORK_SECONDS * 1000:.0f} ms")
+    print(f"{'concurrency':>12}{'client':>12}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    try:
+        for concurrency in levels:
+            for name, request_fn in (
+                ("per-call", lambda user_id: per_call_request(url, user_id)),
+                ("pooled", lambda user_id: manager.request_matches(user_id)),
+            ):
+                start = time.perf_counter()
+                latencies = await run_level(request_fn, concurrency, REQUESTS_PER_LEVEL)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{concurrency:>12}{name:>12}{percentile(latencies, 0.5) * 1000:>10.2f}"
+                    f"{percentile(latencies, 0.99) * 1000:>10.2f}{len(latencies) / elapsed:>10.0f}"
+                )
+    finally:
+        await manager.close()
+        server_process.terminate()
+
+
+if __name__ == "__main__":
+    # 基准中不需要每个请求的 INFO 日志
+    import logging
+    logging.getLogger("app.services.https.N8nWebhookManager").setLevel(logging.WARNING)
+    asyncio.run(main())
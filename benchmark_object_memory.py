@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+内存基准：对比旧的 dict 属性对象（持有 User/Chatroom 强引用）与当前 __slots__ 对象的每对象字节数
+
+用法:
+    python benchmark_object_memory.py            # 默认每种对象 1,000,000 个
+    python benchmark_object_memory.py 200000     # 指定数量
+"""
+
+import gc
+import sys
+import os
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.User import User
+from app.objects.Match import Match
+from app.objects.Chatroom import Chatroom
+
+
+# ---- 旧实现的内存布局（与改动前的属性完全一致） ----
+
+class LegacyUser:
+    def __init__(self, telegram_user_name=None, gender=None, user_id=None):
+        self.user_id = user_id
+        self.telegram_user_name = telegram_user_name
+        self.gender = gender
+        self.age = None
+        self.target_gender = None
+        self.user_personality_summary = None
+        self.match_ids = []
+        self.blocked_user_ids = []
+
+
+class LegacyMatch:
+    def __init__(self, match_id, user_1, user_2):
+        self.match_id = match_id
+        self.user_id_1 = user_1.user_id
+        self.user_id_2 = user_2.user_id
+        self.description_to_user_1 = "reason"
+        self.description_to_user_2 = "reason"
+        self.is_liked = False
+        self.match_score = 80
+        self.mutual_game_scores = {}
+        self.chatroom_id = None
+        self.match_time = "2024-01-01 00:00:00 UTC"
+        self.chatroom = None
+        self.user_1 = user_1
+        self.user_2 = user_2
+
+
+class LegacyChatroom:
+    def __init__(self, chatroom_id, user1, user2, match_id):
+        self.chatroom_id = chatroom_id
+        self.message_ids = []
+        self.user1_id = user1.user_id
+        self.user2_id = user2.user_id
+        self.match_id = match_id
+        self.user1 = user1
+        self.user2 = user2
+
+
+# ---- 构造函数 ----
+
+def make_users(user_class, n):
+    users = []
+    for i in range(n):
+        user = user_class(telegram_user_name="user", gender=1 + i % 2, user_id=i)
+        user.age = 25
+        users.append(user)
+    return users
+
+
+def make_legacy_matches(users, n):
+    return [LegacyMatch(i, users[i % len(users)], users[(i + 1) % len(users)]) for i in range(n)]
+
+
+def make_matches(users, n):
+    return [
+        Match.from_document({
+            "_id": i,
+            "user_id_1": users[i % len(users)].user_id,
+            "user_id_2": users[(i + 1) % len(users)].user_id,
+            "description_to_user_1": "reason",
+            "description_to_user_2": "reason",
+            "match_score": 80,
+            "match_time": "2024-01-01 00:00:00 UTC",
+        })
+        for i in range(n)
+    ]
+
+
+def make_legacy_chatrooms(users, n):
+    return [LegacyChatroom(i, users[i % len(users)], users[(i + 1) % len(users)], i) for i in range(n)]
+
+
+def make_chatrooms(users, n):
+    return [
+        Chatroom.from_document({"_id": i, "message_ids": [], "match_id": i}, users[i % len(users)], users[(i + 1) % len(users)])
+        for i in range(n)
+    ]
+
+
+def measure(build):
+    """返回 build() 保留的对象的总字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    gc.collect()
+    return after - before
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    # Match.from_document 会检查用户是否存在，基准里不需要这条日志
+    Match._check_user_instances = lambda self: None
+
+    print(f"Objects per type: {n:,}")
+    print(f"{'type':<10}{'legacy B/obj':>15}{'slots B/obj':>15}{'saved':>10}")
+
+    legacy_users = make_users(LegacyUser, n)
+    users = make_users(User, n)
+    results = [
+        ("User", measure(lambda: make_users(LegacyUser, n)), measure(lambda: make_users(User, n))),
+        ("Match", measure(lambda: make_legacy_matches(legacy_users, n)), measure(lambda: make_matches(users, n))),
+        ("Chatroom", measure(lambda: make_legacy_chatrooms(legacy_users, n)), measure(lambda: make_chatrooms(users, n))),
+    ]
+    for name, legacy_bytes, slot_bytes in results:
+        legacy_per_object = legacy_bytes / n
+        slot_per_object = slot_bytes / n
+        saved = 1 - slot_per_object / legacy_per_object if legacy_per_object else 0
+        print(f"{name:<10}{legacy_per_object:>15.1f}{slot_per_object:>15.1f}{saved:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试访问日志中间件：每个请求一行日志、X-Request-ID 透传、流式响应不被缓冲、调试请求头触发完整记录
+"""
+
+import asyncio
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.access_log import AccessLogMiddleware
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def build_app(**middleware_options) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"received": await request.json(), "request_id": request.state.request_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk{i};".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(AccessLogMiddleware, **middleware_options)
+    return app
+
+
+def run_requests(app, requests):
+    async def run():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.request(method, path, **kwargs) for method, path, kwargs in requests]
+    return asyncio.run(run())
+
+
+def capture_access_log():
+    handler = ListHandler()
+    logging.getLogger("access").addHandler(handler)
+    return handler
+
+
+def test_access_mode_logs_one_line_and_streams_through():
+    handler = capture_access_log()
+    try:
+        app = build_app(mode="access", debug_sample_rate=0)
+        echo, stream = run_requests(app, [
+            ("POST", "/echo", {"json": {"hello": "world"}, "headers": {"X-Request-ID": "abc123"}}),
+            ("GET", "/stream", {}),
+        ])
+        assert echo.json() == {"received": {"hello": "world"}, "request_id": "abc123"}
+        assert echo.headers["x-request-id"] == "abc123"
+        assert stream.text == "chunk0;chunk1;chunk2;"
+        assert len(stream.headers["x-request-id"]) == 16
+
+        assert len(handler.messages) == 2
+        assert handler.messages[0].startswith("method=POST path=/echo status=200 latency_ms=")
+        assert "request_id=abc123" in handler.messages[0]
+        assert f"bytes={len(stream.content)}" in handler.messages[1]
+    finally:
+        logging.getLogger("access").removeHandler(handler)
+    print("✓ Access mode test passed!")
+
+
+def test_debug_header_dumps_request_and_redacts_secrets():
+    handler = capture_access_log()
+    try:
+        app = build_app(mode="access", debug_sample_rate=0, max_body_bytes=8)
+        run_requests(app, [("POST", "/echo", {
+            "json": {"hello": "world"},
+            "headers": {"X-Debug-Log": "1", "Authorization": "Bearer secret-token"},
+        })])
+        dump = "\n".join(handler.messages)
+        assert len(handler.messages) == 5
+        assert "secret-token" not in dump and "('authorization', '***')" in dump
+        assert "request_body=" in dump and "...(truncated)" in dump
+    finally:
+        logging.getLogger("access").removeHandler(handler)
+    print("✓ Debug dump test passed!")
+
+
+def test_off_mode_and_errors():
+    handler = capture_access_log()
+    try:
+        response, = run_requests(build_app(mode="off"), [("GET", "/stream", {})])
+        assert "x-request-id" in response.headers and handler.messages == []
+
+        run_requests(build_app(mode="access"), [("GET", "/boom", {})])
+        assert len(handler.messages) == 1 and "status=500" in handler.messages[0]
+    finally:
+        logging.getLogger("access").removeHandler(handler)
+    print("✓ Off mode/error test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_access_mode_logs_one_line_and_streams_through()
+        test_debug_header_dumps_request_and_redacts_secrets()
+        test_off_mode_and_errors()
+        print("\n🎉 All access log tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
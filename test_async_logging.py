@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试 MyLogger 的队列模式：后台线程写出、队列满时丢弃计数、按 logger 采样和限速
+"""
+
+import logging
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils import my_logger
+from app.utils.my_logger import MyLogger, SamplingFilter, configure_logging, get_logging_stats, shutdown_logging
+
+
+def read_log_file():
+    with open(my_logger.LOG_FILE, encoding="utf-8") as f:
+        return f.read()
+
+
+def with_temp_log_file(test):
+    def wrapper():
+        original = my_logger.LOG_FILE
+        with tempfile.TemporaryDirectory() as tmp:
+            my_logger.LOG_FILE = os.path.join(tmp, "app.log")
+            try:
+                test()
+            finally:
+                shutdown_logging()
+                my_logger.LOG_FILE = original
+                configure_logging()
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@with_temp_log_file
+def test_queue_mode_writes_in_background_and_counts_drops():
+    configure_logging(async_mode=True, queue_size=100, sample_rates={}, rate_limits={})
+    logger = MyLogger("test_async_logging_queue")
+    logger.info("queued line")
+    shutdown_logging()  # 停止后台线程时写出队列剩余记录
+    assert "queued line" in read_log_file()
+
+    # 后台线程已停止，队列写满之后的记录被丢弃而不是阻塞
+    for i in range(150):
+        logger.info(f"overflow {i}")
+    stats = get_logging_stats()
+    assert stats["async"] and stats["dropped"] == 50 and stats["queued"] == 100
+    print("✓ Queue mode test passed!")
+
+
+@with_temp_log_file
+def test_sync_mode_shares_handlers():
+    configure_logging(async_mode=False, sample_rates={}, rate_limits={})
+    first = MyLogger("test_async_logging_sync_a")
+    second = MyLogger("test_async_logging_sync_b")
+    MyLogger("test_async_logging_sync_a")  # 重复创建不会重复添加handler
+    assert len(first.logger.handlers) == 2
+    assert first.logger.handlers == second.logger.handlers
+    first.info("sync line")
+    assert "sync line" in read_log_file()
+    print("✓ Sync mode test passed!")
+
+
+def test_sampling_and_rate_limit_filter():
+    sampled = SamplingFilter(sample_rate=0.25)
+    record = logging.LogRecord("hot", logging.INFO, __file__, 0, "msg", None, None)
+    kept = sum(sampled.filter(record) for _ in range(100))
+    assert kept == 25 and sampled.sampled_out == 75
+
+    warning = logging.LogRecord("hot", logging.WARNING, __file__, 0, "msg", None, None)
+    assert all(sampled.filter(warning) for _ in range(10))
+
+    limited = SamplingFilter(max_per_second=5)
+    kept = sum(limited.filter(record) for _ in range(20))
+    assert kept == 5 and limited.rate_limited == 15
+    assert SamplingFilter(sample_rate=0).filter(record) is False
+    print("✓ Sampling/rate limit filter test passed!")
+
+
+@with_temp_log_file
+def test_configured_sampling_is_per_logger():
+    configure_logging(async_mode=False, sample_rates={"test_async_logging_hot": 0.5}, rate_limits={})
+    hot = MyLogger("test_async_logging_hot")
+    cold = MyLogger("test_async_logging_cold")
+    for i in range(10):
+        hot.info(f"hot {i}")
+        cold.info(f"cold {i}")
+    content = read_log_file()
+    assert content.count("INFO - hot ") == 5 and content.count("INFO - cold ") == 10
+    assert get_logging_stats()["sampled_out"] == {"test_async_logging_hot": 5}
+    print("✓ Per-logger sampling test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_queue_mode_writes_in_background_and_counts_drops()
+        test_sync_mode_shares_handlers()
+        test_sampling_and_rate_limit_filter()
+        test_configured_sampling_is_per_logger()
+        print("\n🎉 All async logging tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+测试批量注销：级联删除合并为按集合分组的 delete_many / bulk_write（假集合记录写操作，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import Database
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+
+BASE_USER_ID = 895000000
+
+
+class Result:
+    def __init__(self, deleted_count=0, modified_count=0):
+        self.deleted_count = deleted_count
+        self.matched_count = modified_count
+        self.modified_count = modified_count
+        self.upserted_count = 0
+
+
+class RecordingCollection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    async def delete_one(self, query):
+        raise AssertionError("deactivation should not delete documents one by one")
+
+    async def update_one(self, query, update):
+        raise AssertionError("deactivation should not update users one by one")
+
+    async def delete_many(self, query):
+        self.calls.append((self.name, "delete_many", query))
+        return Result(deleted_count=3)
+
+    async def bulk_write(self, operations, ordered=False):
+        self.calls.append((self.name, "bulk_write", operations))
+        return Result(modified_count=len(operations))
+
+
+async def make_user_with_matches(heavy_id, partner_ids):
+    user_manager = UserManagement()
+    match_manager = MatchManager()
+    chatroom_manager = ChatroomManager()
+    for user_id in [heavy_id] + partner_ids:
+        user_manager.create_new_user(f"user_{user_id}", user_id, 1)
+    match_ids, chatroom_ids = [], []
+    for partner_id in partner_ids:
+        match = await match_manager.create_match(heavy_id, partner_id, "r1", "r2", 60)
+        chatroom = Chatroom(user_manager.get_user_instance(heavy_id), user_manager.get_user_instance(partner_id), match.match_id)
+        chatroom_manager.chatrooms[chatroom.chatroom_id] = chatroom
+        match.chatroom_id = chatroom.chatroom_id
+        match_ids.append(match.match_id)
+        chatroom_ids.append(chatroom.chatroom_id)
+    return match_ids, chatroom_ids
+
+
+def cleanup(user_ids, match_ids, chatroom_ids):
+    user_manager = UserManagement()
+    for user_id in user_ids:
+        user = user_manager.user_list.pop(user_id, None)
+        if user:
+            user_manager.male_user_list.pop(user_id, None)
+            user_manager._unindex_user(user_id)
+        user_manager.dirty_tracker.discard(user_id)
+    for match_id in match_ids:
+        MatchManager().remove_match(match_id)
+    for chatroom_id in chatroom_ids:
+        ChatroomManager().chatrooms.pop(chatroom_id, None)
+        ChatroomManager().dirty_tracker.discard(chatroom_id)
+
+
+def test_heavy_user_deactivation_uses_grouped_writes():
+    Match._initialized = True
+    Chatroom._initialized = True
+    heavy_id = BASE_USER_ID
+    partner_ids = [BASE_USER_ID + offset for offset in range(1, 31)]
+    calls = []
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: RecordingCollection(name, calls))
+    match_ids, chatroom_ids = asyncio.run(make_user_with_matches(heavy_id, partner_ids))
+    try:
+        user_manager = UserManagement()
+        assert asyncio.run(user_manager.deactivate_user(heavy_id)) is True
+        assert heavy_id not in user_manager.user_list
+        assert all(MatchManager().get_match(match_id) is None for match_id in match_ids)
+        assert all(chatroom_id not in ChatroomManager().chatrooms for chatroom_id in chatroom_ids)
+        assert all(user_manager.get_user_instance(partner_id).match_ids == [] for partner_id in partner_ids)
+
+        # 每个集合一次往返：users 删除、其他用户 $pull、matches、chatrooms、messages
+        assert len(calls) == 5
+        pulls = next(call[2] for call in calls if call[1] == "bulk_write")
+        assert len(pulls) == len(partner_ids)
+        assert ("messages", "delete_many", {"chatroom_id": {"$in": chatroom_ids}}) in calls
+        assert ("matches", "delete_many", {"_id": {"$in": match_ids}}) in calls
+
+        assert asyncio.run(user_manager.deactivate_user(heavy_id)) is False
+    finally:
+        Database.get_collection = original
+        cleanup([heavy_id] + partner_ids, match_ids, chatroom_ids)
+    print("✓ Heavy user deactivation test passed!")
+
+
+def test_batch_deactivation_skips_pulls_between_deactivated_users():
+    Match._initialized = True
+    Chatroom._initialized = True
+    user_a, user_b, user_c = BASE_USER_ID + 100, BASE_USER_ID + 101, BASE_USER_ID + 102
+    calls = []
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: RecordingCollection(name, calls))
+    match_ids, chatroom_ids = asyncio.run(make_user_with_matches(user_a, [user_b, user_c]))
+    try:
+        result = asyncio.run(UserManagement().deactivate_users([user_a, user_b, BASE_USER_ID + 999]))
+        assert result["success"] and result["deactivated"] == [user_a, user_b]
+        assert result["not_found"] == [BASE_USER_ID + 999]
+        assert result["deleted_matches"] == 2 and result["deleted_chatrooms"] == 2
+        # 只有 user_c 需要 $pull，user_b 本身已被注销
+        assert result["updated_users"] == 1
+        pulls = next(call[2] for call in calls if call[1] == "bulk_write")
+        assert [op._filter for op in pulls] == [{"_id": user_c}]
+        assert ("users", "delete_many", {"_id": {"$in": [user_a, user_b]}}) in calls
+        assert result["elapsed_ms"] >= 0
+    finally:
+        Database.get_collection = original
+        cleanup([user_a, user_b, user_c], match_ids, chatroom_ids)
+    print("✓ Batch deactivation test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_heavy_user_deactivation_uses_grouped_writes()
+        test_batch_deactivation_skips_pulls_between_deactivated_users()
+        print("\n🎉 All bulk deactivation tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试 Database.bulk_upsert 的分批与错误统计（使用假集合，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pymongo.errors import BulkWriteError
+from app.core.database import Database
+
+
+class FakeBulkResult:
+    def __init__(self, size):
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = size
+
+
+class FakeCollection:
+    """记录每次 bulk_write 调用，可指定某一批失败"""
+    def __init__(self, failing_batch=None):
+        self.calls = []
+        self.failing_batch = failing_batch
+
+    async def bulk_write(self, operations, ordered=False):
+        self.calls.append(operations)
+        if self.failing_batch == len(self.calls) - 1:
+            raise BulkWriteError({
+                "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate"}],
+                "nUpserted": len(operations) - 1,
+            })
+        return FakeBulkResult(len(operations))
+
+
+def run_bulk_upsert(collection, docs, **kwargs):
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: collection)
+    try:
+        return asyncio.run(Database.bulk_upsert("test_collection", docs, **kwargs))
+    finally:
+        Database.get_collection = original
+
+
+def test_bulk_upsert_batches():
+    """文档按 batch_size 分批，每批一次 bulk_write"""
+    collection = FakeCollection()
+    docs = [{"_id": i, "value": i} for i in range(25)]
+    stats = run_bulk_upsert(collection, docs, batch_size=10)
+
+    assert len(collection.calls) == 3
+    assert [s["size"] for s in stats] == [10, 10, 5]
+    assert sum(s["upserted"] for s in stats) == 25
+    assert all(not s["failed_keys"] for s in stats)
+    print("✓ bulk_upsert batching tests passed!")
+
+
+def test_bulk_upsert_reports_failed_keys():
+    """BulkWriteError 中失败的文档 key 会出现在统计里"""
+    collection = FakeCollection(failing_batch=1)
+    docs = [{"_id": i} for i in range(6)]
+    stats = run_bulk_upsert(collection, docs, batch_size=3)
+
+    assert stats[0]["failed_keys"] == []
+    assert stats[1]["failed_keys"] == [4]
+    assert stats[1]["upserted"] == 2
+    print("✓ bulk_upsert failure reporting tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_bulk_upsert_batches()
+        test_bulk_upsert_reports_failed_keys()
+        print("\n🎉 All bulk_upsert tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试熔断器状态流转，以及 N8nWebhookManager 的单飞合并与熔断（使用 httpx.MockTransport，不需要n8n）
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.https.N8nWebhookManager import N8nWebhookManager
+
+
+async def succeed():
+    return "ok"
+
+
+async def fail():
+    raise RuntimeError("upstream down")
+
+
+def test_breaker_opens_and_recovers_through_half_open():
+    """连续失败后打开，恢复时间后半开只放行一个探测，探测成功后关闭"""
+    async def run():
+        breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.05)
+        for _ in range(2):
+            try:
+                await breaker.call(fail)
+            except RuntimeError:
+                pass
+        assert breaker.state == "open"
+
+        try:
+            await breaker.call(succeed)
+            assert False, "open breaker should reject"
+        except CircuitOpenError as e:
+            assert e.retry_after > 0
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == "half_open"
+        breaker.before_call()  # 占用唯一的探测名额
+        try:
+            breaker.before_call()
+            assert False, "only one probe allowed while half-open"
+        except CircuitOpenError:
+            pass
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        await asyncio.sleep(0.06)
+        assert await breaker.call(succeed) == "ok"
+        assert breaker.state == "closed"
+        stats = breaker.stats()
+        assert stats["failures"] == 3 and stats["rejected"] == 2 and stats["times_opened"] == 2
+
+    asyncio.run(run())
+    print("✓ Circuit breaker state test passed!")
+
+
+def test_n8n_requests_are_coalesced_and_fail_fast_when_open():
+    """同一用户的并发请求只发出一次上游请求；上游连续失败后快速失败"""
+    async def run():
+        upstream_calls = []
+        healthy = True
+
+        async def handler(request):
+            upstream_calls.append(request.url.params["user_id"])
+            await asyncio.sleep(0.02)
+            if not healthy:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"output": [{"self_user_id": 1, "matched_user_id": 2}]})
+
+        manager = N8nWebhookManager()
+        original_client, original_breaker = manager.client, manager.breaker
+        manager.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        manager.breaker = CircuitBreaker("n8n_webhook", failure_threshold=2, recovery_timeout=60)
+        manager.upstream_requests = manager.coalesced_requests = 0
+        try:
+            results = await asyncio.gather(*(manager.request_matches(1) for _ in range(5)), manager.request_matches(7))
+            assert upstream_calls == ["1", "7"]
+            assert all(result == [{"self_user_id": 1, "matched_user_id": 2}] for result in results)
+            assert manager.coalesced_requests == 4
+            assert not manager.in_flight
+
+            healthy = False
+            for _ in range(2):
+                try:
+                    await manager.request_matches(1)
+                except httpx.HTTPStatusError:
+                    pass
+            start = time.perf_counter()
+            try:
+                await manager.request_matches(1)
+                assert False, "breaker should be open"
+            except CircuitOpenError:
+                pass
+            assert time.perf_counter() - start < 0.01
+            assert len(upstream_calls) == 4
+            stats = manager.get_stats()
+            assert stats["upstream_requests"] == 4
+            assert stats["circuit_breaker"]["state"] == "open"
+        finally:
+            await manager.client.aclose()
+            manager.client, manager.breaker = original_client, original_breaker
+
+    asyncio.run(run())
+    print("✓ n8n coalescing and circuit breaker test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_breaker_opens_and_recovers_through_half_open()
+        test_n8n_requests_are_coalesced_and_fail_fast_when_open()
+        print("\n🎉 All circuit breaker tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
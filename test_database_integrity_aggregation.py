@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试数据库级完备性检查的聚合实现：聚合结果按批流回，孤儿数据用 delete_many / bulk_write 批量清理，
+不再用 find 拉取整个集合（假集合按管道第一个阶段返回预设结果，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pymongo import DeleteMany, UpdateOne
+from app.core.database import Database
+from app.services.https.DataIntegrity import DataIntegrity
+
+
+class Result:
+    def __init__(self, deleted_count=0, matched_count=0, modified_count=0, upserted_count=0):
+        self.deleted_count = deleted_count
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_count = upserted_count
+
+
+class AggregateCursor:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.documents:
+            raise StopAsyncIteration
+        return self.documents.pop(0)
+
+
+class FakeCollection:
+    def __init__(self, name, aggregate_results, calls):
+        self.name = name
+        self.aggregate_results = aggregate_results
+        self.calls = calls
+
+    def find(self, *args, **kwargs):
+        raise AssertionError(f"database check should not load {self.name} with find")
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append((self.name, "aggregate", pipeline, kwargs))
+        return AggregateCursor(self.aggregate_results.get(self.name, []))
+
+    async def delete_many(self, query):
+        self.calls.append((self.name, "delete_many", query))
+        return Result(deleted_count=len(query["_id"]["$in"]))
+
+    async def bulk_write(self, operations, ordered=False):
+        self.calls.append((self.name, "bulk_write", operations))
+        deleted = sum(2 for op in operations if isinstance(op, DeleteMany))
+        updated = sum(1 for op in operations if isinstance(op, UpdateOne))
+        return Result(deleted_count=deleted, matched_count=updated, modified_count=updated)
+
+
+def run_with_collections(aggregate_results, coroutine_factory):
+    calls = []
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: FakeCollection(name, aggregate_results, calls))
+    try:
+        return asyncio.run(coroutine_factory()), calls
+    finally:
+        Database.get_collection = original
+
+
+def test_aggregate_and_bulk_write_batching():
+    async def run():
+        batches = [batch async for batch in Database.aggregate("users", [{"$match": {}}], batch_size=2)]
+        totals = await Database.bulk_write(
+            "users", [UpdateOne({"_id": i}, {"$set": {"x": 1}}) for i in range(5)], batch_size=2
+        )
+        return batches, totals
+
+    (batches, totals), calls = run_with_collections({"users": [{"_id": i} for i in range(5)]}, run)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert calls[0][3]["allowDiskUse"] is True
+    assert totals["modified"] == 5
+    assert [len(call[2]) for call in calls if call[1] == "bulk_write"] == [2, 2, 1]
+    print("✓ Aggregate/bulk_write batching test passed!")
+
+
+def test_database_checks_turn_orphans_into_batched_writes():
+    aggregate_results = {
+        # user_1 缺失的 match 删除；user_2 存在但未关联的 match 补 $addToSet
+        "matches": [
+            {"_id": 1, "user_id_1": 10, "user_id_2": 11, "user_2": {"linked": True}},
+            {"_id": 2, "user_id_1": 12, "user_id_2": 13, "user_1": {"linked": True}, "user_2": {"linked": False}},
+        ],
+        "messages": [
+            {"_id": {"chatroom_id": 7, "sender_id": 10, "receiver_id": 11}},
+            {"_id": {"sender_id": 12}},
+        ],
+    }
+    data_integrity = DataIntegrity()
+
+    async def run():
+        return await data_integrity._check_database_matches(), await data_integrity._check_database_messages()
+
+    (match_result, message_result), calls = run_with_collections(aggregate_results, run)
+    assert match_result == {"success": True, "deleted": {"matches": 1}, "updated_users": 1}
+    assert ("matches", "delete_many", {"_id": {"$in": [1]}}) in calls
+    user_writes = [call[2] for call in calls if call[0] == "users" and call[1] == "bulk_write"]
+    assert len(user_writes) == 1 and user_writes[0][0]._filter == {"_id": 13}
+    assert user_writes[0][0]._doc["$addToSet"] == {"match_ids": 2}
+
+    assert message_result == {"success": True, "deleted": {"messages": 4}}
+    message_writes = [call[2] for call in calls if call[0] == "messages" and call[1] == "bulk_write"][0]
+    assert message_writes[0]._filter == {"chatroom_id": 7, "message_sender_id": 10, "message_receiver_id": 11}
+    assert message_writes[1]._filter == {"chatroom_id": None, "message_sender_id": 12, "message_receiver_id": None}
+
+    # 消息检查先按分组聚合，$lookup 针对分组而不是逐条消息
+    message_pipeline = next(call[2] for call in calls if call[0] == "messages" and call[1] == "aggregate")
+    assert "$group" in message_pipeline[0]
+    print("✓ Database orphan cleanup test passed!")
+
+
+def test_database_only_check_runs_all_checks_without_find():
+    result, calls = run_with_collections({}, DataIntegrity().run_database_only_integrity_check)
+    assert result["success"] and result["checks_completed"] == result["total_checks"] == 5
+    assert {call[0] for call in calls if call[1] == "aggregate"} == {"matches", "users", "chatrooms", "messages"}
+    print("✓ Database-only integrity check test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_aggregate_and_bulk_write_batching()
+        test_database_checks_turn_orphans_into_batched_writes()
+        test_database_only_check_runs_all_checks_without_find()
+        print("\n🎉 All database integrity aggregation tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+测试增量数据完备性检查：只根据变更日志检查受影响的实体（使用假集合记录删除操作，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import Database
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.objects.Message import Message
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.DataIntegrity import DataIntegrity
+from app.services.https.IntegrityChangeLog import IntegrityChangeLog
+
+BASE_USER_ID = 894000000
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class RecordingCollection:
+    """只记录删除请求；find 一旦被调用说明增量检查退化成了全量扫描"""
+    def __init__(self, name, deletes):
+        self.name = name
+        self.deletes = deletes
+
+    async def delete_one(self, query):
+        self.deletes.append((self.name, "one", query))
+        return DeleteResult(1)
+
+    async def delete_many(self, query):
+        self.deletes.append((self.name, "many", query))
+        return DeleteResult(2)
+
+    def find(self, *args, **kwargs):
+        raise AssertionError(f"incremental check should not scan {self.name}")
+
+
+def add_user(offset):
+    user = User(f"user_{offset}", 1, BASE_USER_ID + offset)
+    UserManagement().user_list[user.user_id] = user
+    return user
+
+
+def test_incremental_check_only_touches_changed_entities():
+    async def run():
+        user_manager = UserManagement()
+        match_manager = MatchManager()
+        chatroom_manager = ChatroomManager()
+        data_integrity = DataIntegrity()
+        change_log = IntegrityChangeLog()
+        change_log.drain()
+
+        a, b, c = add_user(0), add_user(1), add_user(2)
+        Match._initialized = True
+        Chatroom._initialized = True
+        match_ab = await match_manager.create_match(a.user_id, b.user_id, "r1", "r2", 80)
+        match_ac = await match_manager.create_match(a.user_id, c.user_id, "r1", "r2", 70)
+        chatroom = Chatroom(a, b, match_ab.match_id)
+        chatroom_manager.chatrooms[chatroom.chatroom_id] = chatroom
+        match_ab.chatroom_id = chatroom.chatroom_id
+        change_log.record_chatroom_created(chatroom.chatroom_id)
+
+        # 制造不一致：c 在内存中消失，a 的 match_ids 缺少 match_ab
+        del user_manager.user_list[c.user_id]
+        a.match_ids.remove(match_ab.match_id)
+
+        deletes = []
+        original = Database.get_collection
+        Database.get_collection = classmethod(lambda cls, name: RecordingCollection(name, deletes))
+        try:
+            result = await data_integrity.run_incremental_check()
+            assert result["success"] and result["changes"] == 3
+            assert match_manager.get_match(match_ac.match_id) is None
+            assert ("matches", "one", {"_id": match_ac.match_id}) in deletes
+            assert match_ab.match_id in a.match_ids and match_ac.match_id not in a.match_ids
+            assert chatroom.chatroom_id in chatroom_manager.chatrooms
+            assert change_log.pending() == 0
+
+            # 用户 b 被删除：移除仍引用 b 的匹配和聊天室，按 chatroom_id 删除聊天室内的消息
+            deletes.clear()
+            del user_manager.user_list[b.user_id]
+            change_log.record_user_deleted(b.user_id)
+            result = await data_integrity.run_incremental_check()
+            assert result["removed_matches"] == 1 and result["removed_chatrooms"] == 1
+            assert match_manager.get_match(match_ab.match_id) is None
+            assert chatroom.chatroom_id not in chatroom_manager.chatrooms
+            assert match_ab.match_id not in a.match_ids
+            assert ("messages", "many", {"chatroom_id": {"$in": [chatroom.chatroom_id]}}) in deletes
+            # 不按没有索引的 message_sender_id / message_receiver_id 删除
+            assert not any(name == "messages" and "$or" in query for name, _, query in deletes)
+            assert change_log.pending() == 0
+
+            # 没有变更时不访问数据库
+            deletes.clear()
+            result = await data_integrity.run_incremental_check()
+            assert result["changes"] == 0 and deletes == []
+        finally:
+            Database.get_collection = original
+            for user in (a, b, c):
+                user_manager.user_list.pop(user.user_id, None)
+                user_manager.dirty_tracker.discard(user.user_id)
+            for match in (match_ab, match_ac):
+                match_manager.remove_match(match.match_id)
+            chatroom_manager.chatrooms.pop(chatroom.chatroom_id, None)
+            change_log.drain()
+
+    asyncio.run(run())
+    print("✓ Incremental integrity check test passed!")
+
+
+def test_failed_check_is_retried_and_full_check_is_rate_limited():
+    async def run():
+        data_integrity = DataIntegrity()
+        change_log = IntegrityChangeLog()
+        change_log.drain()
+        change_log.record_chatroom_deleted(BASE_USER_ID + 9)
+
+        async def failing_delete_many(collection_name, query):
+            raise ConnectionError("database unavailable")
+
+        original = Database.delete_many
+        Database.delete_many = failing_delete_many
+        try:
+            result = await data_integrity.run_incremental_check()
+        finally:
+            Database.delete_many = original
+        assert not result["success"]
+        assert change_log.pending() == 1
+        change_log.drain()
+
+        calls = []
+
+        async def fake_full_check():
+            calls.append(1)
+            return {"success": True, "checks_completed": 5, "total_checks": 5, "errors": []}
+
+        data_integrity.run_integrity_check = fake_full_check
+        data_integrity.last_full_check_at = None
+        try:
+            assert await data_integrity.run_full_check_if_due() is not None
+            assert await data_integrity.run_full_check_if_due() is None
+            assert await data_integrity.run_full_check_if_due(force=True) is not None
+            assert len(calls) == 2
+        finally:
+            del data_integrity.run_integrity_check
+
+    asyncio.run(run())
+    print("✓ Retry and rate-limit test passed!")
+
+
+class StreamingMessages:
+    """模拟流式读取 messages：读完第一条后执行 on_first_batch，模拟读取期间仍在进行的聊天"""
+    def __init__(self, documents, on_first_batch, queries, deletes):
+        self.documents = documents
+        self.on_first_batch = on_first_batch
+        self.queries = queries
+        self.deletes = deletes
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        limit = query["_id"]["$lte"]
+        self.cursor_documents = [doc for doc in self.documents if doc["_id"] <= limit]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self.position = 0
+        return self
+
+    async def __anext__(self):
+        if self.position >= len(self.cursor_documents):
+            raise StopAsyncIteration
+        if self.position == 1:
+            self.on_first_batch()
+        self.position += 1
+        return dict(self.cursor_documents[self.position - 1])
+
+    async def delete_one(self, query):
+        self.deletes.append(query["_id"])
+        return DeleteResult(1)
+
+    async def bulk_write(self, operations, ordered=False):
+        raise ConnectionError("not needed in this test")
+
+
+def test_full_message_check_ignores_data_created_during_the_sweep():
+    async def run():
+        user_manager = UserManagement()
+        chatroom_manager = ChatroomManager()
+        data_integrity = DataIntegrity()
+        a, b = add_user(20), add_user(21)
+        Chatroom._initialized = True
+        existing = Chatroom(a, b, None)
+        chatroom_manager.chatrooms[existing.chatroom_id] = existing
+        late_chatroom = Chatroom(a, b, None)
+        late_user_id = BASE_USER_ID + 22
+        saved_counter = Message._message_counter
+        Message._message_counter = 1000
+
+        def chat_continues():
+            # 读取过程中：新用户和新聊天室出现，并有新消息发送到已有聊天室
+            add_user(22)
+            chatroom_manager.chatrooms[late_chatroom.chatroom_id] = late_chatroom
+            existing.message_ids.append(1001)
+
+        documents = [
+            {"_id": 990, "chatroom_id": existing.chatroom_id, "message_sender_id": a.user_id, "message_receiver_id": b.user_id},
+            {"_id": 991, "chatroom_id": late_chatroom.chatroom_id, "message_sender_id": late_user_id, "message_receiver_id": a.user_id},
+            {"_id": 992, "chatroom_id": 1, "message_sender_id": a.user_id, "message_receiver_id": b.user_id},
+            {"_id": 1001, "chatroom_id": existing.chatroom_id, "message_sender_id": a.user_id, "message_receiver_id": b.user_id},
+        ]
+        existing.message_ids = [990, 993]
+        queries, deletes = [], []
+        collection = StreamingMessages(documents, chat_continues, queries, deletes)
+        original = Database.get_collection
+        Database.get_collection = classmethod(lambda cls, name: collection)
+        try:
+            assert await data_integrity.check_and_clean_database_messages()
+            assert queries[-1] == {"_id": {"$lte": 1000}}
+            # 只有聊天室 1 不存在的消息被删除；读取期间出现的用户和聊天室的消息保留
+            assert deletes == [992]
+
+            collection.on_first_batch = lambda: None
+            assert await data_integrity._check_and_clean_chatroom_message_ids()
+            # 993 在高水位之下且不存在，被清理；1001 晚于高水位，保留
+            assert existing.message_ids == [990, 1001]
+        finally:
+            Database.get_collection = original
+            Message._message_counter = saved_counter
+            for user_id in (a.user_id, b.user_id, late_user_id):
+                user_manager.user_list.pop(user_id, None)
+            for chatroom in (existing, late_chatroom):
+                chatroom_manager.chatrooms.pop(chatroom.chatroom_id, None)
+                chatroom_manager.dirty_tracker.discard(chatroom.chatroom_id)
+
+    asyncio.run(run())
+    print("✓ Full message check race test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_incremental_check_only_touches_changed_entities()
+        test_failed_check_is_retried_and_full_check_is_rate_limited()
+        test_full_message_check_ignores_data_created_during_the_sweep()
+        print("\n🎉 All incremental integrity tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试本地匹配引擎的候选过滤、打分和输出结构，以及 n8n 失败时的回退（不需要n8n和数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.Match import Match
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.matching.MatchEngine import LocalMatchEngine, FallbackMatchEngine, MatchEngine
+from app.services.matching.UserFeatureStore import UserFeatureStore
+
+BASE_USER_ID = 891000000
+MATCH_KEYS = {
+    "self_user_id",
+    "matched_user_id",
+    "match_score",
+    "reason_of_match_given_to_self_user",
+    "reason_of_match_given_to_matched_user",
+}
+
+
+def add_user(offset, gender, target_gender, age, summary):
+    user_manager = UserManagement()
+    user_id = BASE_USER_ID + offset
+    user = User(f"user_{offset}", gender, user_id)
+    user.target_gender = target_gender
+    user.age = age
+    user.user_personality_summary = summary
+    user_manager.user_list[user_id] = user
+    (user_manager.male_user_list if gender == 1 else user_manager.female_user_list)[user_id] = user
+    UserFeatureStore().upsert_user(user)
+    return user
+
+
+def cleanup():
+    user_manager = UserManagement()
+    for user_list in (user_manager.user_list, user_manager.male_user_list, user_manager.female_user_list):
+        for user_id in [user_id for user_id in user_list if isinstance(user_id, int) and BASE_USER_ID <= user_id < BASE_USER_ID + 1000]:
+            del user_list[user_id]
+            UserFeatureStore().remove_user(user_id)
+            user_manager.dirty_tracker.discard(user_id)
+
+
+def test_local_engine_filters_and_ranks_candidates():
+    """按性别/目标性别/年龄过滤，排除拉黑和已有匹配，简介更相似的排在前面"""
+    async def run():
+        me = add_user(0, 1, 2, 28, "I love hiking, jazz music and cooking")
+        best = add_user(1, 2, 1, 27, "hiking and jazz music every weekend")
+        add_user(2, 2, 1, 29, "I enjoy gaming")
+        add_user(3, 2, 2, 28, "hiking and jazz music")          # 目标性别不符
+        add_user(4, 1, 2, 28, "hiking and jazz music")          # 性别不符
+        add_user(5, 2, 1, 60, "hiking and jazz music")          # 年龄超出范围
+        blocker = add_user(6, 2, 1, 28, "hiking and jazz music")
+        blocker.block_user(me.user_id)                           # 对方拉黑了我
+        add_user(7, 2, 1, 28, "hiking and jazz music cooking")
+        me.blocked_user_ids.append(BASE_USER_ID + 7)             # 我拉黑了对方
+        add_user(8, 2, 1, 28, "hiking and jazz music")
+
+        Match._initialized = True
+        match = await MatchManager().create_match(me.user_id, BASE_USER_ID + 8, "r1", "r2", 90)
+        try:
+            engine = LocalMatchEngine(age_range=10)
+            matches = await engine.request_matches(me.user_id, num_of_matches=10)
+            matched_ids = [m["matched_user_id"] for m in matches if BASE_USER_ID <= m["matched_user_id"] < BASE_USER_ID + 1000]
+            assert matched_ids == [best.user_id, BASE_USER_ID + 2]
+            assert all(set(m) == MATCH_KEYS for m in matches)
+            assert matches[0]["self_user_id"] == me.user_id
+            assert isinstance(matches[0]["match_score"], int)
+            assert matches[0]["match_score"] > matches[1]["match_score"]
+            assert "hiking" in matches[0]["reason_of_match_given_to_self_user"]
+        finally:
+            MatchManager().remove_match(match.match_id)
+
+    try:
+        asyncio.run(run())
+    finally:
+        cleanup()
+    print("✓ Local match engine test passed!")
+
+
+class FailingEngine(MatchEngine):
+    name = "failing"
+
+    async def request_matches(self, user_id, num_of_matches=1):
+        raise ConnectionError("n8n is down")
+
+
+def test_fallback_engine_uses_local_when_primary_fails():
+    """主引擎失败时回退到本地引擎"""
+    async def run():
+        me = add_user(10, 2, 1, 30, "reading")
+        add_user(11, 1, 2, 31, "reading books")
+        engine = FallbackMatchEngine(FailingEngine(), LocalMatchEngine())
+        matches = await engine.request_matches(me.user_id, num_of_matches=1)
+        assert len(matches) == 1 and engine.fallback_count == 1
+        assert await LocalMatchEngine().request_matches(BASE_USER_ID + 999) == []
+
+    try:
+        asyncio.run(run())
+    finally:
+        cleanup()
+    print("✓ Fallback match engine test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_local_engine_filters_and_ranks_candidates()
+        test_fallback_engine_uses_local_when_primary_fails()
+        print("\n🎉 All match engine tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
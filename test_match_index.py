@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+测试 MatchManager 的用户匹配索引和用户对索引（不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.Match import Match
+from app.services.https.MatchManager import MatchManager
+
+
+def test_match_indexes_follow_create_and_remove():
+    """create_match 写入索引，remove_match 同步移除"""
+    Match._initialized = True
+    match_manager = MatchManager()
+
+    match = asyncio.run(match_manager.create_match(880000001, 880000002, "r1", "r2", 90))
+    other = asyncio.run(match_manager.create_match(880000003, 880000001, "r1", "r2", 70))
+
+    # 用户对索引与顺序无关
+    assert match_manager.get_match_by_pair(880000002, 880000001) is match
+    assert match_manager.get_match_by_pair(880000001, 880000003) is other
+    assert match_manager.get_match_by_pair(880000002, 880000003) is None
+
+    user_matches = match_manager.get_user_matches(880000001)
+    assert {m.match_id for m in user_matches} == {match.match_id, other.match_id}
+
+    assert match_manager.remove_match(match.match_id) is match
+    assert match_manager.get_match_by_pair(880000001, 880000002) is None
+    assert [m.match_id for m in match_manager.get_user_matches(880000001)] == [other.match_id]
+    assert 880000002 not in match_manager.user_match_index
+    assert not match_manager.dirty_tracker.is_dirty(match.match_id)
+
+    # 清理
+    match_manager.remove_match(other.match_id)
+    assert 880000001 not in match_manager.user_match_index
+    print("✓ MatchManager index tests passed!")
+
+
+def test_pair_index_falls_back_to_duplicate_pair():
+    """历史数据中重复的用户对：删除被索引的匹配后，索引指向剩下的那个"""
+    Match._initialized = True
+    match_manager = MatchManager()
+
+    first = asyncio.run(match_manager.create_match(880000011, 880000012, "r1", "r2", 90))
+    duplicate = asyncio.run(match_manager.create_match(880000012, 880000011, "r1", "r2", 80))
+    assert match_manager.get_match_by_pair(880000011, 880000012) is first
+
+    match_manager.remove_match(first.match_id)
+    assert match_manager.get_match_by_pair(880000011, 880000012) is duplicate
+
+    match_manager.remove_match(duplicate.match_id)
+    assert match_manager.get_match_by_pair(880000011, 880000012) is None
+    assert (880000011, 880000012) not in match_manager.pair_index
+    print("✓ Duplicate pair index tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_match_indexes_follow_create_and_remove()
+        test_pair_index_falls_back_to_duplicate_pair()
+        print("\n🎉 All match index tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+测试匹配推荐缓存：批量预取、单次发放、低水位后台补货、并发未命中合并和LRU淘汰（不需要n8n和数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.https.N8nWebhookManager import N8nWebhookManager
+from app.services.https.MatchRecommendationCache import MatchRecommendationCache
+
+BASE_USER_ID = 890000000
+
+
+class FakeN8n:
+    """替代 request_matches：为每个用户返回 num_of_matches 个候选，记录调用次数"""
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        self.next_candidate = BASE_USER_ID + 100
+
+    async def request_matches(self, user_id, num_of_matches=1):
+        self.calls.append((user_id, num_of_matches))
+        await asyncio.sleep(self.delay)
+        matches = []
+        for _ in range(num_of_matches):
+            candidate = self.next_candidate
+            self.next_candidate += 1
+            register_user(candidate)
+            matches.append({
+                "self_user_id": user_id,
+                "matched_user_id": candidate,
+                "match_score": 80,
+                "reason_of_match_given_to_self_user": "r1",
+                "reason_of_match_given_to_matched_user": "r2",
+            })
+        return matches
+
+
+def register_user(user_id):
+    UserManagement().user_list[user_id] = User(f"user_{user_id}", 1, user_id)
+
+
+def fresh_cache(fake, batch_size=4, low_watermark=2, max_users=100):
+    MatchRecommendationCache._instance = None
+    cache = MatchRecommendationCache()
+    cache.batch_size = batch_size
+    cache.low_watermark = low_watermark
+    cache.max_users = max_users
+    N8nWebhookManager().request_matches = fake.request_matches
+    return cache
+
+
+def cleanup():
+    N8nWebhookManager().__dict__.pop("request_matches", None)
+    user_list = UserManagement().user_list
+    for user_id in [user_id for user_id in user_list if isinstance(user_id, int) and user_id >= BASE_USER_ID]:
+        del user_list[user_id]
+    MatchRecommendationCache._instance = None
+
+
+def test_batch_is_handed_out_one_per_connect_and_refilled():
+    """一次请求 K 个推荐，之后的连接只查内存；低于低水位时后台补货"""
+    async def run():
+        fake = FakeN8n()
+        cache = fresh_cache(fake)
+        user_id = BASE_USER_ID
+        register_user(user_id)
+
+        first = await cache.get_recommendation(user_id)
+        assert fake.calls == [(user_id, 4)]
+        second = await cache.get_recommendation(user_id)
+        assert len(fake.calls) == 1
+        assert first["matched_user_id"] != second["matched_user_id"]
+        assert cache.hits == 1 and cache.misses == 1
+
+        # 剩余1个，低于低水位2，触发一次后台补货
+        third = await cache.get_recommendation(user_id)
+        assert user_id in cache.refills
+        await cache.refills[user_id]
+        assert len(fake.calls) == 2
+        assert len(cache.batches[user_id].items) == 5
+        assert third["matched_user_id"] not in {item["matched_user_id"] for item in cache.batches[user_id].items}
+        await cache.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        cleanup()
+    print("✓ Batch hand-out and refill test passed!")
+
+
+def test_stale_recommendations_are_skipped():
+    """对方已注销或拉黑了当前用户的推荐不再发放"""
+    async def run():
+        fake = FakeN8n()
+        cache = fresh_cache(fake, batch_size=3, low_watermark=0)
+        user_id = BASE_USER_ID
+        register_user(user_id)
+
+        first = await cache.get_recommendation(user_id)
+        pending = [item["matched_user_id"] for item in cache.batches[user_id].items]
+        del UserManagement().user_list[pending[0]]
+        UserManagement().user_list[pending[1]].blocked_user_ids.append(user_id)
+
+        # 批次中剩余的两个都失效，重新请求一批
+        recommendation = await cache.get_recommendation(user_id)
+        assert recommendation["matched_user_id"] not in pending + [first["matched_user_id"]]
+        assert len(fake.calls) == 2
+
+    try:
+        asyncio.run(run())
+    finally:
+        cleanup()
+    print("✓ Stale recommendation test passed!")
+
+
+def test_concurrent_misses_share_one_refill_and_lru_evicts():
+    """同一用户的并发连接只触发一次请求；超过最大用户数时淘汰最久未使用的用户"""
+    async def run():
+        fake = FakeN8n(delay=0.01)
+        cache = fresh_cache(fake, batch_size=4, low_watermark=0, max_users=2)
+        user_id = BASE_USER_ID
+        register_user(user_id)
+
+        # 第一个连接在请求中时，后台补货已登记；后续连接等待同一个补货
+        cache._schedule_refill(user_id)
+        results = await asyncio.gather(*(cache.get_recommendation(user_id) for _ in range(3)))
+        assert len(fake.calls) == 1
+        assert len({result["matched_user_id"] for result in results}) == 3
+
+        for other in (BASE_USER_ID + 1, BASE_USER_ID + 2):
+            register_user(other)
+            await cache.get_recommendation(other)
+        assert list(cache.batches) == [BASE_USER_ID + 1, BASE_USER_ID + 2]
+        assert cache.evictions == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        cleanup()
+    print("✓ Single-flight refill and LRU test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_batch_is_handed_out_one_per_connect_and_refilled()
+        test_stale_recommendations_are_skipped()
+        test_concurrent_misses_share_one_refill_and_lru_evicts()
+        print("\n🎉 All match recommendation cache tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试热消息缓存 MessageCache（不需要数据库）
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.https.MessageCache import MessageCache
+
+
+def make_entry(message_id, content="hello"):
+    return {
+        "_id": message_id,
+        "message_content": content,
+        "message_send_time_in_utc": datetime(2024, 1, 1),
+        "message_sender_id": 1,
+    }
+
+
+def fresh_cache(per_chatroom=5, max_bytes=10 * 1024 * 1024):
+    """重置单例状态，避免测试之间互相影响"""
+    MessageCache._instance = None
+    cache = MessageCache()
+    cache.max_messages_per_chatroom = per_chatroom
+    cache.max_bytes = max_bytes
+    return cache
+
+
+def test_ring_buffer_pages():
+    """从第一条消息开始缓存的聊天室可以完整命中"""
+    cache = fresh_cache(per_chatroom=5)
+    for message_id in range(1, 4):
+        cache.append(100, make_entry(message_id), is_first_message=(message_id == 1))
+
+    entries = cache.get_all(100)
+    assert [e["_id"] for e in entries] == [1, 2, 3]
+
+    docs, has_more = cache.get_page(100, None, 2)
+    assert [d["_id"] for d in docs] == [2, 3] and has_more
+
+    docs, has_more = cache.get_page(100, 2, 10)
+    assert [d["_id"] for d in docs] == [1] and not has_more
+
+    # 超过环形缓冲区容量后，最旧的消息被丢弃，完整记录不再命中
+    for message_id in range(4, 8):
+        cache.append(100, make_entry(message_id))
+    assert cache.get_all(100) is None
+    assert cache.get_page(100, 4, 3) is None  # 缓冲区里只剩 3..7，不足以覆盖
+    docs, has_more = cache.get_page(100, None, 5)
+    assert [d["_id"] for d in docs] == [3, 4, 5, 6, 7] and has_more
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 4 and stats["misses"] == 2
+    print("✓ MessageCache ring buffer tests passed!")
+
+
+def test_seed_keeps_newer_appends():
+    """数据库回填不会覆盖读取期间新发送的消息"""
+    cache = fresh_cache(per_chatroom=10)
+    cache.append(200, make_entry(10))
+    cache.seed(200, [make_entry(8), make_entry(9)], covers_start=True)
+    assert [e["_id"] for e in cache.get_all(200)] == [8, 9, 10]
+    print("✓ MessageCache seed tests passed!")
+
+
+def test_lru_eviction_across_chatrooms():
+    """超过全局内存上限时淘汰最久未使用的聊天室"""
+    cache = fresh_cache(per_chatroom=10)
+    cache.append(1, make_entry(1), is_first_message=True)
+    cache.append(2, make_entry(2), is_first_message=True)
+    # 访问聊天室1，使聊天室2成为最久未使用
+    cache.get_all(1)
+    cache.max_bytes = cache.total_bytes
+    cache.append(3, make_entry(3), is_first_message=True)
+
+    assert 2 not in cache.buffers
+    assert 1 in cache.buffers and 3 in cache.buffers
+    assert cache.get_stats()["evictions"] == 1
+    cache.invalidate(1)
+    assert 1 not in cache.buffers
+    print("✓ MessageCache LRU eviction tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_ring_buffer_pages()
+        test_seed_keeps_newer_appends()
+        test_lru_eviction_across_chatrooms()
+        print("\n🎉 All MessageCache tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
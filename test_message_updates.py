@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+测试 user_message_update 定向投递与订阅（使用假 WebSocket，不需要服务器）
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import settings
+from app.WebSocketsService.MessageConnectionHandler import MessageConnectionHandler
+from app.WebSocketsService.OutboundQueue import OutboundQueue
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_message_update_only_reaches_participants_and_subscribers():
+    """只有发送者、接收者和订阅者收到 user_message_update"""
+    async def run():
+        MessageConnectionHandler.sessions = {}
+        MessageConnectionHandler.message_update_subscribers = set()
+        sockets = {}
+        for user_id in ("1", "2", "3", "4"):
+            sockets[user_id] = FakeWebSocket()
+            MessageConnectionHandler.sessions[user_id] = OutboundQueue(sockets[user_id])
+
+        other = MessageConnectionHandler(sockets["3"])
+        other.user_id = "3"
+        other.outbound = MessageConnectionHandler.sessions["3"]
+        monitor = MessageConnectionHandler(sockets["4"])
+        monitor.user_id = "4"
+        monitor.outbound = MessageConnectionHandler.sessions["4"]
+
+        original_allowlist = settings.WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST
+        try:
+            # 名单为空时拒绝所有订阅
+            settings.WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST = ""
+            await other.on_message({"type": "subscribe_message_updates"})
+
+            # 用户4在名单内可以订阅，用户3仍被名单拒绝
+            settings.WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST = "4"
+            await monitor.on_message({"type": "subscribe_message_updates"})
+            await other.on_message({"type": "subscribe_message_updates"})
+        finally:
+            settings.WS_MESSAGE_UPDATE_SUBSCRIBER_ALLOWLIST = original_allowlist
+
+        delivered = await MessageConnectionHandler.publish_message_update(1, 2, json.dumps({"type": "user_message_update"}))
+        await asyncio.sleep(0.01)
+
+        assert delivered == 3
+        received = {user_id: [frame["type"] for frame in websocket.sent] for user_id, websocket in sockets.items()}
+        assert received["1"] == ["user_message_update"]
+        assert received["2"] == ["user_message_update"]
+        assert received["3"] == ["subscription_status", "subscription_status"]
+        assert received["4"] == ["subscription_status", "user_message_update"]
+        assert all(frame["subscribed"] is False for frame in sockets["3"].sent)
+        assert sockets["4"].sent[0]["subscribed"] is True
+
+        for outbound in MessageConnectionHandler.sessions.values():
+            await outbound.close()
+        MessageConnectionHandler.sessions = {}
+        MessageConnectionHandler.message_update_subscribers = set()
+
+    asyncio.run(run())
+    print("✓ Targeted message update tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_message_update_only_reaches_participants_and_subscribers()
+        print("\n🎉 All message update tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试进程内指标：文本输出格式与累积桶、中间件的路由模板标签和 WebSocket 连接数、
+send_message 计数器，以及 /metrics 端点
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import APIRouter, FastAPI, WebSocket
+from starlette.testclient import TestClient
+
+from app.api import monitoring
+from app.core.metrics_middleware import MetricsMiddleware
+from app.services.https.ChatroomManager import ChatroomManager
+from app.utils.metrics import (
+    CHAT_MESSAGES_SENT, HTTP_REQUEST_DURATION, REGISTRY, WEBSOCKET_CONNECTIONS, MetricsRegistry,
+)
+
+
+def test_render_format_and_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.labels("find").observe(value)
+    registry.counter("events_total", "Events").inc(2)
+    assert registry.histogram("op_seconds", "again", ("op",)) is latency
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="find",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{op="find",le="1.0"} 3' in text
+    assert 'op_seconds_bucket{op="find",le="+Inf"} 4' in text
+    assert 'op_seconds_count{op="find"} 4' in text
+    assert "events_total 2" in text
+    try:
+        registry.gauge("events_total", "clash")
+        assert False, "registering a different type under the same name should fail"
+    except ValueError:
+        pass
+    print("✓ Render format test passed!")
+
+
+def test_middleware_route_labels_and_websocket_gauge():
+    api = APIRouter(prefix="/api/v1")
+
+    @api.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"item_id": item_id}
+
+    ws = APIRouter()
+
+    @ws.websocket("/ws/test_metrics")
+    async def ws_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_text(str(WEBSOCKET_CONNECTIONS.labels("/ws/test_metrics").get()))
+        await websocket.close()
+
+    app = FastAPI()
+    app.include_router(api)
+    app.include_router(ws)
+    app.add_middleware(MetricsMiddleware, http_prefix="/api/v1", websocket_paths=["/ws/test_metrics"])
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for item_id in (1, 2, 3):
+                assert (await client.get(f"/api/v1/items/{item_id}")).status_code == 200
+            assert (await client.get("/api/v1/missing/42")).status_code == 404
+
+    asyncio.run(run())
+    templated = HTTP_REQUEST_DURATION.labels("GET", "/api/v1/items/{item_id}", "200")
+    unmatched = HTTP_REQUEST_DURATION.labels("GET", "unmatched", "404")
+    assert templated.count == 3 and unmatched.count >= 1
+    assert ("GET", "/api/v1/items/1", "200") not in HTTP_REQUEST_DURATION._children
+
+    with TestClient(app).websocket_connect("/ws/test_metrics") as websocket:
+        assert websocket.receive_text() == "1"
+    assert WEBSOCKET_CONNECTIONS.labels("/ws/test_metrics").get() == 0
+    print("✓ Middleware labels test passed!")
+
+
+def test_send_message_counter():
+    failed = CHAT_MESSAGES_SENT.labels("failed")
+    before = failed.get()
+    result = asyncio.run(ChatroomManager().send_message(897000001, 1, "hello"))
+    assert result["success"] is False
+    assert failed.get() == before + 1
+    print("✓ send_message counter test passed!")
+
+
+def test_metrics_endpoint():
+    app = FastAPI()
+    app.include_router(monitoring.router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in ("http_request_duration_seconds", "db_operation_duration_seconds",
+                 "auto_save_duration_seconds", "manager_objects", "chat_messages_sent_total"):
+        assert f"# TYPE {name}" in response.text
+    assert 'manager_objects{manager="chatrooms"}' in response.text
+    assert response.text == REGISTRY.render()
+    print("✓ /metrics endpoint test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_render_format_and_cumulative_buckets()
+        test_middleware_route_labels_and_websocket_gauge()
+        test_send_message_counter()
+        test_metrics_endpoint()
+        print("\n🎉 All metrics tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试 WebSocket 发送队列与广播扇出（使用假 WebSocket，不需要服务器）
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.api.monitoring import metrics
+from app.WebSocketsService.ConnectionHandler import ConnectionHandler
+from app.WebSocketsService.MatchSessionHandler import MatchSessionHandler
+from app.WebSocketsService.OutboundQueue import OutboundQueue
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0, gate=None):
+        self.delay = delay
+        self.gate = gate  # asyncio.Event，设置前 send_text 一直阻塞
+        self.sent = []
+        self.closed_code = None
+
+    async def send_text(self, message):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_code = code
+
+
+def test_broadcast_not_blocked_by_slow_client():
+    """广播只入队，慢客户端不会拖慢其他连接"""
+    async def run():
+        fast_sockets = [FakeWebSocket() for _ in range(1000)]
+        slow_socket = FakeWebSocket(delay=5)
+        ConnectionHandler.sessions = {}
+        ConnectionHandler.sessions["slow"] = OutboundQueue(slow_socket, max_size=16)
+        for index, websocket in enumerate(fast_sockets):
+            ConnectionHandler.sessions[str(index)] = OutboundQueue(websocket, max_size=16)
+
+        start = time.perf_counter()
+        await ConnectionHandler.broadcast("hello", exclude_id="0")
+        broadcast_time = time.perf_counter() - start
+
+        await asyncio.sleep(0.05)
+        assert broadcast_time < 1
+        assert fast_sockets[0].sent == []
+        assert all(websocket.sent == ["hello"] for websocket in fast_sockets[1:])
+        assert slow_socket.sent == []
+
+        stats = ConnectionHandler.get_queue_stats()
+        assert stats["connections"] == 1001 and stats["max_depth"] <= 1
+
+        for outbound in list(ConnectionHandler.sessions.values()):
+            await outbound.close()
+        ConnectionHandler.sessions = {}
+
+    asyncio.run(run())
+    print("✓ Broadcast fan-out tests passed!")
+
+
+def test_overflow_policies():
+    """drop_oldest 丢弃最旧消息，disconnect 关闭连接并移除会话"""
+    async def run():
+        gate = asyncio.Event()
+        websocket = FakeWebSocket(gate=gate)
+        outbound = OutboundQueue(websocket, max_size=2, overflow_policy="drop_oldest")
+        assert outbound.enqueue("0")
+        await asyncio.sleep(0)
+        for index in range(1, 5):
+            assert outbound.enqueue(str(index))
+        # writer 已取出第一条并阻塞在发送上，队列中保留最新的两条
+        assert outbound.dropped == 2 and outbound.depth == 2
+        gate.set()
+        await asyncio.sleep(0.01)
+        assert websocket.sent == ["0", "3", "4"]
+        await outbound.close()
+
+        closed = []
+        websocket = FakeWebSocket(gate=asyncio.Event())
+        outbound = OutboundQueue(websocket, max_size=1, overflow_policy="disconnect", on_close=closed.append)
+        assert outbound.enqueue("a")
+        await asyncio.sleep(0)  # writer 取出 "a" 后阻塞
+        assert outbound.enqueue("b")
+        assert not outbound.enqueue("c")
+        await asyncio.sleep(0)
+        assert closed == [outbound] and websocket.closed_code == 1013
+        assert not outbound.enqueue("d")
+
+    asyncio.run(run())
+    print("✓ Outbound queue overflow tests passed!")
+
+
+def test_queue_metrics_include_match_sessions():
+    """队列深度汇总 /ws/match 自己的 sessions，并在 /metrics 中输出"""
+    async def run():
+        gate = asyncio.Event()
+        saved = ConnectionHandler.sessions, MatchSessionHandler.sessions
+        ConnectionHandler.sessions = {"base": OutboundQueue(FakeWebSocket(gate=gate), max_size=16)}
+        MatchSessionHandler.sessions = {"match": OutboundQueue(FakeWebSocket(gate=gate), max_size=16)}
+        try:
+            ConnectionHandler.sessions["base"].enqueue("0")
+            MatchSessionHandler.sessions["match"].enqueue("0")
+            await asyncio.sleep(0)  # writer 取走第一条后阻塞在 gate 上
+            for index in range(1, 4):
+                MatchSessionHandler.sessions["match"].enqueue(str(index))
+            ConnectionHandler.sessions["base"].enqueue("1")
+
+            stats = ConnectionHandler.get_queue_stats()
+            assert stats["connections"] == 2
+            assert stats["handlers"]["MatchSessionHandler"] == {"connections": 1, "total_depth": 3, "max_depth": 3}
+            assert stats["total_depth"] == 4 and stats["max_depth"] == 3
+
+            text = (await metrics()).body.decode()
+            assert 'websocket_send_queue_depth{handler="MatchSessionHandler"} 3' in text
+            assert 'websocket_send_queue_max_depth{handler="ConnectionHandler"} 1' in text
+            assert f"websocket_send_dropped_total {OutboundQueue.total_dropped}" in text
+            assert f"websocket_overflow_disconnects_total {OutboundQueue.total_overflow_disconnects}" in text
+        finally:
+            gate.set()
+            for outbound in (*ConnectionHandler.sessions.values(), *MatchSessionHandler.sessions.values()):
+                await outbound.close()
+            ConnectionHandler.sessions, MatchSessionHandler.sessions = saved
+
+    asyncio.run(run())
+    print("✓ Queue metrics tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_broadcast_not_blocked_by_slow_client()
+        test_overflow_policies()
+        test_queue_metrics_include_match_sessions()
+        print("\n🎉 All outbound queue tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
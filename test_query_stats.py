@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试数据库操作统计：查询结构脱敏、同一结构的 N+1 查询合并计数、慢查询计数、窗口轮换，以及 /debug/db_stats
+（假集合模拟耗时，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import monitoring
+from app.core.database import Database
+from app.core.query_stats import QueryStats, query_shape
+
+
+class SlowCollection:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def find_one(self, query):
+        await asyncio.sleep(self.delay)
+        return {"_id": query.get("_id"), "name": "x"}
+
+    async def delete_many(self, query):
+        class Result:
+            deleted_count = 0
+        return Result()
+
+
+def _with_collection(delay, coro_factory):
+    original = Database.__dict__["get_collection"]
+    Database.get_collection = classmethod(lambda cls, name: SlowCollection(delay))
+    try:
+        return asyncio.run(coro_factory())
+    finally:
+        Database.get_collection = original
+
+
+def test_query_shape_redacts_values():
+    assert query_shape({"user_id": 5, "age": {"$gt": 18}}) == {"user_id": "?", "age": {"$gt": "?"}}
+    assert query_shape({"_id": {"$in": [1, 2, 3]}}) == query_shape({"_id": {"$in": [9]}})
+    assert query_shape({"$or": [{"a": 1}, {"b": "secret"}]}) == {"$or": [{"a": "?"}, {"b": "?"}]}
+    pipeline = [{"$match": {"gender": 1}}, {"$limit": 10}]
+    assert query_shape(pipeline) == [{"$match": {"gender": "?"}}, {"$limit": "?"}]
+    print("✓ Query shape test passed!")
+
+
+def test_n_plus_one_shapes_and_slow_queries():
+    stats = QueryStats()
+    stats.reset()
+    saved_threshold = stats.slow_query_ms
+    stats.slow_query_ms = 20
+    try:
+        async def n_plus_one():
+            for user_id in range(30):
+                await Database.find_one("users", {"_id": user_id})
+            await Database.delete_many("matches", {"user_id_1": 1})
+
+        _with_collection(0, n_plus_one)
+        _with_collection(0.03, lambda: Database.find_one("chatrooms", {"_id": 7, "name": "secret"}))
+
+        result = stats.get_stats(top_n=5)
+        by_op = {(op["collection"], op["operation"]): op for op in result["operations"]}
+        assert by_op[("users", "find_one")]["count"] == 30
+        assert by_op[("users", "find_one")]["slow"] == 0
+        assert by_op[("chatrooms", "find_one")]["slow"] == 1
+        assert by_op[("chatrooms", "find_one")]["p99_ms"] >= 20
+
+        shapes = {(s["collection"], s["operation"]): s for s in result["top_shapes"]}
+        users_shape = shapes[("users", "find_one")]
+        assert users_shape["count"] == 30 and users_shape["shape"] == '{"_id":"?"}'
+        assert result["top_shapes"][0]["collection"] == "chatrooms"
+        assert "secret" not in str(result) and '"_id":7' not in str(result)
+    finally:
+        stats.slow_query_ms = saved_threshold
+        stats.reset()
+    print("✓ N+1 shape and slow query test passed!")
+
+
+def test_shape_window_rotation():
+    stats = QueryStats()
+    stats.reset()
+    stats.record("users", "find", 0.001, {"gender": 1})
+    stats.window_started_at -= stats.window_seconds
+    stats.record("users", "find", 0.001, {"gender": 2})
+    # 上一窗口的数据仍然参与排名
+    assert stats.get_stats()["top_shapes"][0]["count"] == 2
+    stats.window_started_at -= 2 * stats.window_seconds
+    assert stats.get_stats()["top_shapes"] == []
+    assert stats.get_stats()["operations"][0]["count"] == 2
+    stats.reset()
+    print("✓ Window rotation test passed!")
+
+
+def test_db_stats_endpoint():
+    stats = QueryStats()
+    stats.reset()
+    stats.record("messages", "find", 0.002, {"chatroom_id": 3})
+    app = FastAPI()
+    app.include_router(monitoring.router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = (await client.get("/debug/db_stats", params={"top": 1, "reset": "true"})).json()
+            second = (await client.get("/debug/db_stats")).json()
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert first["operations"][0]["collection"] == "messages"
+    assert first["top_shapes"][0]["shape"] == '{"chatroom_id":"?"}'
+    assert second["operations"] == [] and second["top_shapes"] == []
+    print("✓ /debug/db_stats endpoint test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_query_shape_redacts_values()
+        test_n_plus_one_shapes_and_slow_queries()
+        test_shape_window_rotation()
+        test_db_stats_endpoint()
+        print("\n🎉 All query stats tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
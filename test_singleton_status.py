@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+测试单例状态快照：只报告大小不列出键，摘要走缓存，/debug/status 返回同一份快照
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import monitoring
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.utils.singleton_status import SingletonStatusReporter
+
+BASE_USER_ID = 896000000
+
+
+def test_status_reports_sizes_without_keys():
+    user_manager = UserManagement()
+    MatchManager()
+    ChatroomManager()
+    ids = [BASE_USER_ID + offset for offset in range(20)]
+    try:
+        for user_id in ids:
+            user_manager.user_list[user_id] = User(f"user_{user_id}", 1, user_id)
+        status = SingletonStatusReporter.get_singleton_status()
+        assert status["UserManagement"]["user_list"] == {"size": len(user_manager.user_list)}
+        assert "keys" not in str(status) and "items" not in status["MatchManager"]["match_list"]
+        assert status["MatchManager"]["match_list"]["size"] == len(MatchManager().match_list)
+        assert "dirty" in status["ChatroomManager"]
+    finally:
+        for user_id in ids:
+            user_manager.user_list.pop(user_id, None)
+    print("✓ Status size report test passed!")
+
+
+def test_summary_is_cached_until_refresh():
+    user_manager = UserManagement()
+    SingletonStatusReporter.refresh()
+    before = SingletonStatusReporter.get_status_summary()
+    user_manager.user_list[BASE_USER_ID + 100] = User("cached", 1, BASE_USER_ID + 100)
+    try:
+        assert SingletonStatusReporter.get_status_summary() == before
+        SingletonStatusReporter.refresh()
+        after = SingletonStatusReporter.get_status_summary()
+        assert f"user_list({len(user_manager.user_list)})" in after and after != before
+    finally:
+        user_manager.user_list.pop(BASE_USER_ID + 100, None)
+    print("✓ Cached summary test passed!")
+
+
+def test_debug_status_endpoint():
+    app = FastAPI()
+    app.include_router(monitoring.router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            cached = (await client.get("/debug/status")).json()
+            refreshed = (await client.get("/debug/status", params={"refresh": "true"})).json()
+            return cached, refreshed
+
+    snapshot = SingletonStatusReporter.refresh()
+    cached, refreshed = asyncio.run(run())
+    assert cached["generated_at"] == snapshot["generated_at"]
+    assert refreshed["generated_at"] >= snapshot["generated_at"]
+    assert "UserManagement" in refreshed and "logging" in refreshed
+    print("✓ /debug/status endpoint test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_status_reports_sizes_without_keys()
+        test_summary_is_cached_until_refresh()
+        test_debug_status_endpoint()
+        print("\n🎉 All singleton status tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+测试管理器快照：文件格式校验、写入/恢复、增量回放、删除墓碑回放与后台 _id 对账（使用假集合，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import settings
+from app.core.database import Database
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.objects.Message import Message
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.SnapshotManager import (
+    SnapshotManager, SnapshotError, encode_snapshot, decode_snapshot,
+)
+from app.services.https.TombstoneLog import TombstoneLog
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return dict(next(self._iterator))
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """支持回放（updated_at $gte / null）、墓碑（collection + deleted_at $gte）查询；空查询记为全量扫描"""
+    def __init__(self, documents, full_scans):
+        self.documents = documents
+        self.full_scans = full_scans
+
+    def _matches(self, document, query):
+        if "$or" in query:
+            return any(self._matches(document, clause) for clause in query["$or"])
+        if "updated_at" in query:
+            if query["updated_at"] is None:
+                return document.get("updated_at") is None
+            return document.get("updated_at") is not None and document["updated_at"] >= query["updated_at"]["$gte"]
+        if "deleted_at" in query:
+            return document["collection"] == query["collection"] and document["deleted_at"] >= query["deleted_at"]["$gte"]
+        return True
+
+    def find(self, query=None, projection=None):
+        if not query:
+            self.full_scans.append(self)
+        return FakeCursor([d for d in self.documents if self._matches(d, query or {})])
+
+
+def test_snapshot_file_format():
+    """版本头与校验和可以识别损坏的文件"""
+    data = encode_snapshot({"created_at": 1.0, "users": [{"_id": 1, "mutual_game_scores": {2: "x"}}]})
+    assert decode_snapshot(data)["users"][0]["mutual_game_scores"] == {2: "x"}
+
+    corrupted = data[:-1] + bytes([data[-1] ^ 0xFF])
+    for bad in (corrupted, b"NOTSNAP" + data[7:], data[:10]):
+        try:
+            decode_snapshot(bad)
+            assert False, "corrupted snapshot should be rejected"
+        except SnapshotError:
+            pass
+    print("✓ Snapshot file format tests passed!")
+
+
+def test_snapshot_restore_replays_changes():
+    """快照之后的修改和删除墓碑被回放，启动时不扫描整个集合；后台对账移除没有墓碑的已删除对象"""
+    Match._initialized = Chatroom._initialized = Message._initialized = True
+    user_manager = UserManagement()
+    match_manager = MatchManager()
+    chatroom_manager = ChatroomManager()
+
+    snapshot_manager = SnapshotManager()
+    original_path = snapshot_manager.path
+    original_get_collection = Database.get_collection
+    snapshot_manager.path = Path(tempfile.mkdtemp()) / "snapshot.bin"
+
+    now = datetime.now(timezone.utc)
+    try:
+        # 写入快照：两个用户和一个匹配
+        user_manager.load_user_document({"_id": 660000001, "telegram_user_name": "a", "gender": 1, "age": 20})
+        user_manager.load_user_document({"_id": 660000002, "telegram_user_name": "b", "gender": 2})
+        user_manager.load_user_document({"_id": 660000004, "telegram_user_name": "d", "gender": 1})
+        match_manager.load_match_document({"_id": 660001, "user_id_1": 660000001, "user_id_2": 660000002})
+        assert asyncio.run(snapshot_manager.write_snapshot())
+        assert not snapshot_manager.is_due()
+
+        # 模拟重启：清空内存
+        for user_id in (660000001, 660000002, 660000004):
+            SnapshotManager._remove_user(user_id)
+        match_manager.remove_match(660001)
+        TombstoneLog().pending.clear()
+
+        # 数据库状态：用户1在快照之后被修改，用户2和匹配在快照之后被删除（有墓碑），
+        # 用户3是缺少 updated_at 的旧文档，用户4已删除但墓碑没有写入（需要后台对账）
+        full_scans = []
+        collections = {
+            "users": FakeCollection([
+                {"_id": 660000001, "telegram_user_name": "a", "gender": 1, "age": 21, "updated_at": now},
+                {"_id": 660000003, "telegram_user_name": "c", "gender": 2},
+            ], full_scans),
+            "matches": FakeCollection([], full_scans),
+            "chatrooms": FakeCollection([], full_scans),
+            "tombstones": FakeCollection([
+                {"_id": "users:660000002", "collection": "users", "object_id": 660000002, "deleted_at": now},
+                {"_id": "matches:660001", "collection": "matches", "object_id": 660001, "deleted_at": now},
+                # 高水位线之前的墓碑不回放
+                {"_id": "users:660000001", "collection": "users", "object_id": 660000001,
+                 "deleted_at": now - timedelta(days=3)},
+            ], full_scans),
+        }
+        Database.get_collection = classmethod(lambda cls, name: collections[name])
+        UserManagement._initialized = False
+
+        assert asyncio.run(snapshot_manager.restore())
+        assert full_scans == []
+        assert user_manager.get_user_instance(660000001).age == 21
+        assert user_manager.get_user_instance(660000002) is None
+        assert 660000003 in user_manager.female_user_list
+        # 匹配的删除墓碑被回放
+        assert match_manager.get_match(660001) is None
+        assert match_manager.get_match_by_pair(660000001, 660000002) is None
+
+        # 没有墓碑的删除由后台对账处理
+        assert user_manager.get_user_instance(660000004) is not None
+        assert asyncio.run(snapshot_manager.reconcile())["users"] == 1
+        assert user_manager.get_user_instance(660000004) is None
+        assert user_manager.get_user_instance(660000003) is not None
+
+        # 过期快照不会被使用
+        snapshot_manager.max_age = 0
+        time.sleep(0.01)
+        assert not asyncio.run(snapshot_manager.restore())
+    finally:
+        Database.get_collection = original_get_collection
+        snapshot_manager.path = original_path
+        snapshot_manager.max_age = settings.SNAPSHOT_MAX_AGE
+        for user_id in (660000001, 660000002, 660000003, 660000004):
+            SnapshotManager._remove_user(user_id)
+        match_manager.remove_match(660001)
+        TombstoneLog().pending.clear()
+    print("✓ Snapshot restore tests passed!")
+
+
+def test_deletions_are_flushed_as_tombstones():
+    """删除记录为墓碑并批量写入；写入失败时保留，等待下一轮"""
+    from app.services.https.IntegrityChangeLog import IntegrityChangeLog
+    tombstones = TombstoneLog()
+    tombstones.pending.clear()
+    change_log = IntegrityChangeLog()
+    change_log.record_user_deleted(660000009)
+    change_log.record_match_deleted(660009, 660000009, 660000008, 66009)
+    change_log.record_chatroom_deleted(66009)
+    change_log.drain()
+    assert set(tombstones.pending) == {("users", 660000009), ("matches", 660009), ("chatrooms", 66009)}
+
+    written = []
+
+    async def failing_bulk_write(collection_name, operations, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    async def recording_bulk_write(collection_name, operations, **kwargs):
+        written.extend((collection_name, operation._filter["_id"]) for operation in operations)
+        return {"matched": 0, "modified": 0, "deleted": 0, "upserted": len(operations), "errors": 0}
+
+    original = Database.bulk_write
+    try:
+        Database.bulk_write = failing_bulk_write
+        assert asyncio.run(tombstones.flush()) == 0 and len(tombstones) == 3
+        Database.bulk_write = recording_bulk_write
+        assert asyncio.run(tombstones.flush()) == 3 and len(tombstones) == 0
+    finally:
+        Database.bulk_write = original
+        tombstones.pending.clear()
+    assert ("tombstones", "matches:660009") in written
+    print("✓ Tombstone flush tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_snapshot_file_format()
+        test_snapshot_restore_replays_changes()
+        test_deletions_are_flushed_as_tombstones()
+        print("\n🎉 All snapshot tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
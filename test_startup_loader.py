@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+测试启动预热：流式分批读取并加载用户、匹配、聊天室（使用假集合，不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import Database
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.StartupLoader import StartupLoader
+from app.services.matching.UserFeatureStore import UserFeatureStore
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.requested_batch_size = None
+
+    def batch_size(self, size):
+        self.requested_batch_size = size
+        return self
+
+    def sort(self, sort):
+        key, direction = sort[0]
+        self.documents = sorted(self.documents, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+    def __aiter__(self):
+        self._iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return dict(next(self._iterator))
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.projections = []
+
+    def find(self, query=None, projection=None):
+        self.projections.append(projection)
+        return FakeCursor(list(self.documents))
+
+
+COLLECTIONS = {
+    "users": FakeCollection([
+        {"_id": 770000001, "telegram_user_name": "a", "gender": 1, "match_ids": [770001]},
+        {"_id": 770000002, "telegram_user_name": "b", "gender": 2, "match_ids": [770001]},
+        {"_id": 770000003, "telegram_user_name": "c", "gender": 2, "match_ids": []},
+    ]),
+    "matches": FakeCollection([
+        {"_id": 770001, "user_id_1": 770000001, "user_id_2": 770000002, "match_score": 80, "chatroom_id": 770101},
+    ]),
+    "chatrooms": FakeCollection([
+        {"_id": 770101, "user1_id": 770000001, "user2_id": 770000002, "message_ids": [1, 2], "match_id": 770001},
+        # 用户不存在的聊天室会被跳过
+        {"_id": 770102, "user1_id": 770000001, "user2_id": 779999999, "message_ids": [], "match_id": None},
+    ]),
+    "messages": FakeCollection([]),
+}
+
+
+def test_database_iterate_batches():
+    """iterate 按 batch_size 分批 yield"""
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: COLLECTIONS[name])
+
+    async def collect():
+        return [batch async for batch in Database.iterate("users", batch_size=2)]
+
+    try:
+        batches = asyncio.run(collect())
+    finally:
+        Database.get_collection = original
+    assert [len(batch) for batch in batches] == [2, 1]
+    print("✓ Database.iterate batching tests passed!")
+
+
+def test_startup_loader_warms_up_managers():
+    """用户先加载，匹配与聊天室随后并发加载，并记录各阶段耗时"""
+    original = Database.get_collection
+    Database.get_collection = classmethod(lambda cls, name: COLLECTIONS[name])
+    UserManagement._initialized = False
+    try:
+        loader = StartupLoader(batch_size=2, use_snapshot=False)
+        success = asyncio.run(loader.run())
+    finally:
+        Database.get_collection = original
+
+    user_manager = UserManagement()
+    match_manager = MatchManager()
+    chatroom_manager = ChatroomManager()
+    try:
+        assert success
+        assert set(loader.timings) == {"users", "indexes", "matches", "chatrooms", "total"}
+        assert 770000003 in user_manager.female_user_list
+        assert 770000003 in UserFeatureStore().row_of
+        assert 770000003 in user_manager.query_users(gender=2)
+
+        match = match_manager.get_match(770001)
+        assert match.user_1 is user_manager.get_user_instance(770000001)
+        assert match_manager.get_match_by_pair(770000002, 770000001) is match
+
+        chatroom = chatroom_manager.chatrooms[770101]
+        assert chatroom.message_ids == [1, 2] and chatroom.match_id == 770001
+        assert 770102 not in chatroom_manager.chatrooms
+
+        # 只读取需要的字段
+        assert COLLECTIONS["users"].projections[-1] == UserManagement.LOAD_PROJECTION
+    finally:
+        # 清理
+        match_manager.remove_match(770001)
+        chatroom_manager.chatrooms.pop(770101, None)
+        for user_id in (770000001, 770000002, 770000003):
+            user_manager.user_list.pop(user_id, None)
+            user_manager.male_user_list.pop(user_id, None)
+            user_manager.female_user_list.pop(user_id, None)
+    print("✓ StartupLoader warm-up tests passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_database_iterate_batches()
+        test_startup_loader_warms_up_managers()
+        print("\n🎉 All startup loader tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试 UserFeatureStore 随 UserManagement 的创建/编辑/注销增量更新，以及 top_k 的过滤与排序（不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.matching.UserFeatureStore import UserFeatureStore
+
+
+def make_user(user_id, gender, target_gender, age, summary):
+    user = User(f"user_{user_id}", gender, user_id)
+    user.target_gender = target_gender
+    user.age = age
+    user.user_personality_summary = summary
+    return user
+
+
+def test_top_k_filters_and_ranks_in_one_pass():
+    """性别/目标性别/年龄过滤、排除位图、按分数降序"""
+    store = UserFeatureStore.__new__(UserFeatureStore)
+    store._allocate(4)
+    me = make_user(1, 1, 2, 30, "hiking jazz")
+    users = [
+        me,
+        make_user(2, 2, 1, 30, "hiking jazz"),
+        make_user(3, 2, 1, 31, "gaming"),
+        make_user(4, 2, 0, 45, "hiking jazz"),     # 年龄超出范围
+        make_user(5, 1, 2, 30, "hiking jazz"),     # 性别不符
+        make_user(6, 2, 1, None, "hiking"),        # 未填写年龄，不受年龄限制
+        make_user(7, 2, 1, 30, "hiking jazz"),     # 调用方排除
+    ]
+    store.rebuild(users)
+
+    user_ids, scores = store.top_k(me, 10, excluded_ids=[7], age_range=10)
+    assert user_ids.tolist() == [2, 6, 3]
+    assert list(scores) == sorted(scores, reverse=True)
+
+    # 反向拉黑进入排除位图
+    store.record_block(2, 1)
+    assert store.top_k(me, 1, excluded_ids=[7], age_range=10)[0].tolist() == [6]
+    print("✓ top_k test passed!")
+
+
+def test_user_management_keeps_store_in_sync():
+    """create_new_user / edit_* / deactivate_user 增量更新特征行，注销后的行被复用"""
+    user_manager = UserManagement()
+    store = UserFeatureStore()
+    base = 892000000
+    try:
+        user_manager.create_new_user("a", base + 1, 1)
+        user_manager.edit_target_gender(base + 1, 2)
+        user_manager.edit_user_age(base + 1, 25)
+        user_manager.edit_summary(base + 1, "likes cats")
+        row = store.row_of[base + 1]
+        assert store.genders[row] == 1 and store.target_genders[row] == 2 and store.ages[row] == 25
+        assert store.vectors[row].any()
+
+        asyncio.run(user_manager.deactivate_user(base + 1))
+        assert base + 1 not in store.row_of and not store.active[row]
+
+        user_manager.create_new_user("b", base + 2, 2)
+        assert store.row_of[base + 2] == row
+    finally:
+        for user_id in (base + 1, base + 2):
+            if user_id in user_manager.user_list:
+                asyncio.run(user_manager.deactivate_user(user_id))
+            user_manager.dirty_tracker.discard(user_id)
+    print("✓ Incremental feature store test passed!")
+
+
+def test_store_grows_past_capacity():
+    store = UserFeatureStore.__new__(UserFeatureStore)
+    store._allocate(2)
+    for user_id in range(1, 6):
+        store.upsert_user(make_user(user_id, 2, 1, 20, None))
+    assert len(store) == 5 and store.capacity >= 5
+    assert store.user_ids[:5].tolist() == [1, 2, 3, 4, 5]
+    print("✓ Feature store growth test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_top_k_filters_and_ranks_in_one_pass()
+        test_user_management_keeps_store_in_sync()
+        test_store_grows_past_capacity()
+        print("\n🎉 All feature store tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
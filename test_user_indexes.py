@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+测试 UserManagement 二级索引（性别/目标性别/年龄）的维护与查询，以及本地匹配走索引时结果与全量扫描一致（不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.indexes import HashIndex, SortedIndex
+from app.services.https.UserManagement import UserManagement
+from app.services.matching.MatchEngine import LocalMatchEngine
+
+BASE_USER_ID = 893000000
+
+
+def test_hash_and_sorted_index():
+    hash_index = HashIndex("gender")
+    hash_index.add(1, 2)
+    hash_index.add(2, 2)
+    hash_index.add(1, 1)  # 更新
+    assert hash_index.get(2) == {2} and hash_index.get(1) == {1}
+    hash_index.remove(2)
+    assert hash_index.count(2) == 0 and len(hash_index) == 1
+
+    sorted_index = SortedIndex("age")
+    sorted_index.bulk_load([(1, 30), (2, 25), (3, None), (4, 40)])
+    assert sorted_index.range(25, 30) == [2, 1]
+    sorted_index.add(2, 35)  # 更新
+    sorted_index.add(5, 28)
+    assert sorted_index.range(25, 30) == [5, 1]
+    assert sorted(sorted_index.range(36, None, include_missing=True)) == [3, 4]
+    assert sorted_index.count_range(None, 30) == 2
+    sorted_index.remove(3)
+    sorted_index.remove(4)
+    assert sorted_index.range(36, None, include_missing=True) == [] and len(sorted_index) == 3
+    print("✓ Hash/sorted index test passed!")
+
+
+def test_user_management_query_follows_create_edit_deactivate():
+    """"women 25-30 looking for men" 这类查询随 create_new_user / edit_* / deactivate_user 同步"""
+    user_manager = UserManagement()
+    ids = [BASE_USER_ID + offset for offset in range(4)]
+    try:
+        user_manager.rebuild_indexes()
+        for user_id, gender, target_gender, age in (
+            (ids[0], 2, 1, 26),
+            (ids[1], 2, 1, 35),
+            (ids[2], 2, 2, 27),
+            (ids[3], 1, 2, 28),
+        ):
+            user_manager.create_new_user(f"user_{user_id}", user_id, gender)
+            user_manager.edit_target_gender(user_id, target_gender)
+            user_manager.edit_user_age(user_id, age)
+
+        def women_25_30_seeking_men():
+            return {user_id for user_id in user_manager.query_users(gender=2, target_gender=1, age_min=25, age_max=30) if user_id in ids}
+
+        assert women_25_30_seeking_men() == {ids[0]}
+        user_manager.edit_user_age(ids[1], 29)
+        user_manager.edit_target_gender(ids[2], 1)
+        assert women_25_30_seeking_men() == {ids[0], ids[1], ids[2]}
+        assert user_manager.estimate_query_size(gender=2, target_gender=1, age_min=25, age_max=30) >= 3
+
+        asyncio.run(user_manager.deactivate_user(ids[0]))
+        assert women_25_30_seeking_men() == {ids[1], ids[2]}
+    finally:
+        for user_id in ids:
+            if user_id in user_manager.user_list:
+                asyncio.run(user_manager.deactivate_user(user_id))
+            user_manager.dirty_tracker.discard(user_id)
+    print("✓ UserManagement index query test passed!")
+
+
+def test_local_engine_index_path_matches_full_scan():
+    """索引取候选与全量扫描得到相同的匹配"""
+    user_manager = UserManagement()
+    ids = [BASE_USER_ID + 100 + offset for offset in range(20)]
+    try:
+        for offset, user_id in enumerate(ids):
+            gender = 1 if offset == 0 else 2
+            user_manager.create_new_user(f"user_{user_id}", user_id, gender)
+            user_manager.edit_target_gender(user_id, 2 if gender == 1 else 1)
+            user_manager.edit_user_age(user_id, 20 + offset * 2)
+            user_manager.edit_summary(user_id, "hiking jazz" if offset % 3 == 0 else "reading")
+
+        async def run(selectivity):
+            engine = LocalMatchEngine(age_range=6, index_selectivity=selectivity)
+            matches = await engine.request_matches(ids[0], num_of_matches=5)
+            return [m["matched_user_id"] for m in matches], engine
+
+        scan_ids, scan_engine = asyncio.run(run(0.0))
+        index_ids, index_engine = asyncio.run(run(1.0))
+        assert scan_engine.scan_queries == 1 and index_engine.index_queries == 1
+        assert index_ids == scan_ids and ids[3] in index_ids
+    finally:
+        for user_id in ids:
+            if user_id in user_manager.user_list:
+                asyncio.run(user_manager.deactivate_user(user_id))
+            user_manager.dirty_tracker.discard(user_id)
+    print("✓ Index-backed local matching test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_hash_and_sorted_index()
+        test_user_management_query_follows_create_edit_deactivate()
+        test_local_engine_index_path_matches_full_scan()
+        print("\n🎉 All user index tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
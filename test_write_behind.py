@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试 write-behind 脏数据追踪（不需要数据库）
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.dirty_tracker import DirtyTracker
+from app.core.database import Database
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ChatroomManager import ChatroomManager
+
+
+def test_dirty_tracker_drain_and_restore():
+    """drain 取出并清空，restore 重新标记"""
+    tracker = DirtyTracker("test")
+    tracker.mark(1)
+    tracker.mark(2)
+    tracker.mark(None)  # None 会被忽略
+    assert len(tracker) == 2
+
+    drained = tracker.drain()
+    assert drained == {1, 2}
+    assert len(tracker) == 0
+
+    # drain 之后的新修改进入新集合
+    tracker.mark(3)
+    tracker.restore([1])
+    assert tracker.is_dirty(1) and tracker.is_dirty(3)
+    assert not tracker.is_dirty(2)
+
+    tracker.discard(3)
+    assert not tracker.is_dirty(3)
+    print("✓ DirtyTracker drain/restore tests passed!")
+
+
+def test_user_mutations_mark_dirty():
+    """创建和编辑用户会标记用户为脏"""
+    user_manager = UserManagement()
+    user_manager.dirty_tracker.drain()
+
+    user_id = user_manager.create_new_user("dirty_test_user", 990000001, 1)
+    assert user_manager.dirty_tracker.is_dirty(user_id)
+
+    user_manager.dirty_tracker.drain()
+    user_manager.edit_user_age(user_id, 30)
+    assert user_manager.dirty_tracker.is_dirty(user_id)
+
+    user_manager.dirty_tracker.drain()
+    user_manager.get_user_instance(user_id).block_user(990000002)
+    assert user_manager.dirty_tracker.is_dirty(user_id)
+
+    # 清理
+    user_manager.user_list.pop(user_id, None)
+    user_manager.male_user_list.pop(user_id, None)
+    user_manager.dirty_tracker.drain()
+    print("✓ User mutation dirty-marking tests passed!")
+
+
+class FailingCollection:
+    """按集合名决定 bulk_write 是否失败"""
+    def __init__(self, name, failing):
+        self.name = name
+        self.failing = failing
+
+    async def bulk_write(self, operations, ordered=False):
+        if self.name in self.failing:
+            raise ConnectionError(f"{self.name} unavailable")
+        return type("Result", (), {"matched_count": 0, "modified_count": 0, "upserted_count": len(operations)})()
+
+
+def test_chatroom_link_on_match_is_marked_dirty():
+    """新建聊天室后 match 标记为脏；聊天室保存失败时 match 不指向被移除的聊天室"""
+    async def run():
+        user_manager = UserManagement()
+        match_manager = MatchManager()
+        chatroom_manager = ChatroomManager()
+        users = [User(f"link_{offset}", 1, 990000010 + offset) for offset in range(2)]
+        for user in users:
+            user_manager.user_list[user.user_id] = user
+        Match._initialized = True
+        Chatroom._initialized = True
+        match = await match_manager.create_match(users[0].user_id, users[1].user_id, "r1", "r2", 80)
+        failing = set()
+        original = Database.get_collection
+        Database.get_collection = classmethod(lambda cls, name: FailingCollection(name, failing))
+        try:
+            # 聊天室保存失败
+            failing.update({"chatrooms"})
+            assert await chatroom_manager.get_or_create_chatroom(users[0].user_id, users[1].user_id, match.match_id) is None
+            assert match.chatroom_id is None
+
+            # 聊天室保存成功但 match 保存失败：关联留在内存并等待自动保存
+            failing.clear()
+            failing.add("matches")
+            match_manager.dirty_tracker.drain()
+            chatroom_id = await chatroom_manager.get_or_create_chatroom(users[0].user_id, users[1].user_id, match.match_id)
+            assert chatroom_id is not None and match.chatroom_id == chatroom_id
+            assert match_manager.dirty_tracker.is_dirty(match.match_id)
+        finally:
+            Database.get_collection = original
+            match_manager.remove_match(match.match_id)
+            if match.chatroom_id is not None:
+                chatroom_manager.chatrooms.pop(match.chatroom_id, None)
+            for user in users:
+                user_manager.user_list.pop(user.user_id, None)
+            match_manager.dirty_tracker.drain()
+
+    asyncio.run(run())
+    print("✓ Match chatroom link dirty-marking test passed!")
+
+
+if __name__ == "__main__":
+    try:
+        test_dirty_tracker_drain_and_restore()
+        test_user_mutations_mark_dirty()
+        test_chatroom_link_on_match_is_marked_dirty()
+        print("\n🎉 All write-behind tests passed!")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)